@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Address level view of the sales data.
+
+Many sales share a coordinate (apartments in the same building), so the
+search and the tooltips work on one row per distinct coordinate instead of
+one row per sale:
+
+    table = AddressTable(gdf)
+    table.addresses            #lng, lat, address, apartments - one row per address
+    table.row_address          #address id of every sale (positional)
+    table.rows_of([3, 7])      #positional sale rows at addresses 3 and 7
+    table.address_of_rows(rows)  #street address of the sales at rows, by lookup
+    table.prices               #count/mean/median adjusted_sqm_price per (address, year)
+
+PartitionedAddressTable puts the AddressTables of the year partitions
+together, so after an append only the tables of the partitions it touched
+are built again and the merge only hashes their distinct coordinates.
+"""
+
+import numpy as np
+import pandas as pd
+
+from data_store import concat_ranges
+
+
+def street_address(addresses):
+    """Strip the apartment part ("Testvej 1, 2. tv" -> "Testvej 1"), splitting every distinct string once."""
+    codes, uniques = pd.factorize(pd.Series(addresses), use_na_sentinel=False)
+    stripped = np.array([str(a).strip().split(',')[0] for a in uniques], dtype=object)
+    return stripped[codes]
+
+
+def address_prices(row_address, year, price):
+    """count/mean/median of price per (address_id, year) with sales, from bincounts and one sort instead of a groupby."""
+    year_code, years = pd.factorize(year, sort=True)
+    years = np.asarray(years)
+    cell = row_address.astype(np.int64) * len(years) + year_code
+    price = np.asarray(price, dtype=np.float64)
+
+    count = np.bincount(cell)
+    total = np.bincount(cell, weights=price)
+    cells = np.flatnonzero(count)
+    count, total = count[cells], total[cells]
+
+    #prices sorted by (cell, price), one integer sort on cell and price rank is far cheaper than a lexsort;
+    #the prices of the i-th cell with sales are ordered[start[i]:start[i] + count[i]]
+    by_price = np.argsort(price)
+    rank = np.empty(len(price), dtype=np.int64)
+    rank[by_price] = np.arange(len(price))
+    ordered = price[by_price][np.sort(cell * len(price) + rank) % max(len(price), 1)]
+    start = np.cumsum(count) - count
+    median = (ordered[start + (count - 1) // 2] + ordered[start + count // 2]) / 2
+
+    index = pd.MultiIndex.from_arrays([cells // len(years), years[cells % len(years)]], names=['address_id', 'year'])
+    return pd.DataFrame({'count': count, 'mean': total / count, 'median': median}, index=index)
+
+
+class AddressTable:
+
+    def __init__(self, gdf):
+        self.gdf = gdf
+
+        lng = gdf['lng'].to_numpy(dtype=np.float64)
+        lat = gdf['lat'].to_numpy(dtype=np.float64)
+
+        #sales sorted by address (lng, then lat, then row), rows of address a are row_order[start[a]:start[a+1]]
+        self.row_order = np.lexsort((lat, lng))
+        lng, lat = lng[self.row_order], lat[self.row_order]
+        first = np.concatenate([[True], (lng[1:] != lng[:-1]) | (lat[1:] != lat[:-1])])
+        self.start = np.concatenate([np.flatnonzero(first), [len(first)]])
+        counts = np.diff(self.start)
+
+        self.row_address = np.empty(len(first), dtype=np.int64)
+        self.row_address[self.row_order] = np.cumsum(first) - 1
+
+        #street address of the first sale at every coordinate
+        first_rows = self.row_order[self.start[:-1]]
+        self.addresses = pd.DataFrame({
+            'lng': lng[first],
+            'lat': lat[first],
+            'address': street_address(gdf['address'].to_numpy()[first_rows]),
+            'apartments': counts,
+        })
+
+        self.prices = address_prices(self.row_address, gdf['year'].to_numpy(), gdf['adjusted_sqm_price'].to_numpy())
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def rows_of(self, address_ids):
+        """Positional rows of all sales at the given addresses, in address order."""
+        if len(address_ids) == 0:
+            return np.array([], dtype=np.int64)
+        address_ids = np.asarray(address_ids)
+        return self.row_order[concat_ranges(self.start[address_ids], self.start[address_ids + 1])]
+
+    def address_of_rows(self, rows=slice(None)):
+        """Street address of the sales at the given positional rows, by lookup."""
+        return self.addresses['address'].to_numpy()[self.row_address[rows]]
+
+
+class PartitionedAddressTable:
+
+    def __init__(self, gdf, tables):
+        """gdf: the partitions concatenated in order, tables: the AddressTable of every partition in that order.
+
+        Same addresses, rows_of, row_address, prices and gdf as
+        AddressTable(gdf), with the addresses in order of first appearance
+        instead of sorted. The tables must not share years, as year
+        partitions don't, so their prices only need their address ids mapped.
+        """
+        self.gdf = gdf
+        self.tables = list(tables)
+        self.offsets = np.cumsum([0] + [len(table.gdf) for table in self.tables])
+        if self.offsets[-1] != len(gdf):
+            raise ValueError("tables cover {} rows, the frame has {}".format(self.offsets[-1], len(gdf)))
+
+        parts = [table.addresses for table in self.tables]
+        addresses = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=['lng', 'lat', 'address', 'apartments'])
+        #one complex number per coordinate, hashed instead of sorted
+        codes, _ = pd.factorize(addresses['lng'].to_numpy(dtype=np.float64) + 1j * addresses['lat'].to_numpy(dtype=np.float64))
+
+        _, first = np.unique(codes, return_index=True)
+
+        #every partition's id of each address, -1 where the partition has no sales at it
+        self.local = []
+        row_address, prices = [np.array([], dtype=np.int64)], []
+        bounds = np.cumsum([0] + [len(part) for part in parts])
+        for table, lo, hi in zip(self.tables, bounds[:-1], bounds[1:]):
+            local = np.full(len(first), -1, dtype=np.int32)
+            local[codes[lo:hi]] = np.arange(hi - lo)
+            self.local.append(local)
+
+            #partition address id -> merged address id
+            ids = codes[lo:hi]
+            row_address.append(ids[table.row_address])
+            prices.append(table.prices.set_axis(pd.MultiIndex.from_arrays(
+                [ids[table.prices.index.get_level_values('address_id')], table.prices.index.get_level_values('year')],
+                names=['address_id', 'year'])))
+
+        self.row_address = np.concatenate(row_address)
+        self.prices = pd.concat(prices).sort_index() if prices else address_prices(self.row_address, [], [])
+        self.addresses = addresses.iloc[first].reset_index(drop=True)
+        self.addresses['apartments'] = np.bincount(codes, weights=addresses['apartments'].to_numpy(), minlength=len(first)).astype(np.int64)
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def rows_of(self, address_ids):
+        """Positional rows of all sales at the given addresses in gdf, in address order."""
+        address_ids = np.asarray(address_ids, dtype=np.int64)
+        rows, order = [np.array([], dtype=np.int64)], [np.array([], dtype=np.int64)]
+        for table, local, offset in zip(self.tables, self.local, self.offsets):
+            ids = local[address_ids]
+            found = np.flatnonzero(ids >= 0)
+            lo, hi = table.start[ids[found]], table.start[ids[found] + 1]
+            rows.append(table.row_order[concat_ranges(lo, hi)] + offset)
+            order.append(np.repeat(found, hi - lo))
+
+        rows, order = np.concatenate(rows), np.concatenate(order)
+        return rows[np.argsort(order, kind='stable')]
+
+    def address_of_rows(self, rows=slice(None)):
+        """Street address of the sales at the given positional rows, by lookup."""
+        return self.addresses['address'].to_numpy()[self.row_address[rows]]
@@ -1,71 +1,541 @@
 import streamlit as st
 import pandas as pd
-import geopandas as gpd
-import leafmap.colormaps as cm
-import pydeck as pdk
-import matplotlib.pyplot as plt
 import numpy as np
+import pydeck as pdk
+import os
+
+#leafmap.colormaps, matplotlib, scipy (density, neighbourhood) and requests (geocoding) are
+#imported by the functions that use them, so a worker starts without paying for them
+from geocode_cache import GeocodeCache
+from address_table import AddressTable, PartitionedAddressTable
+from data_store import read_geo, sort_by_year, year_rows, parish_name_column
+from lod import level_of_detail, cell_radius
+from region_cube import RegionCube
+from app_cache import resource_cache, data_cache, cache_stats
+from density_score import density_score, LEVELS_PATH
+from partitions import PartitionedSales
+from compact import compact_sales, tooltip_columns
+from polygon_layers import PolygonLayer, CITY_ZOOM
+from colormapping import palette_array, palette_names, add_color_columns, FILL_COLOR
+from instrumentation import span, record, trace, serve_metrics, log_traces
 
-from matplotlib.patches import Rectangle
 
-from leafmap.common import hex_to_rgb
-from dawa_scrape_prod import DAWA_data
+COLOR = 'white'
 
-from shapely.geometry import Point
-from shapely.ops import nearest_points
 
+def style_matplotlib():
+    #white text on a transparent background for the colorbar, set on first use of matplotlib
+    import matplotlib.pyplot as plt
 
-plt.rcParams.update({
-    #"figure.facecolor":  (1.0, 0.0, 0.0, 0.3),  # red   with alpha = 30%
-    #"axes.facecolor":    (0.0, 1.0, 0.0, 0.5),  # green with alpha = 50%
-    "savefig.facecolor": (0.0, 0.0, 0.0, 0),  # blue  with alpha = 20%
-})
+    plt.rcParams.update({
+        #"figure.facecolor":  (1.0, 0.0, 0.0, 0.3),  # red   with alpha = 30%
+        #"axes.facecolor":    (0.0, 1.0, 0.0, 0.5),  # green with alpha = 50%
+        "savefig.facecolor": (0.0, 0.0, 0.0, 0),  # blue  with alpha = 20%
+    })
 
-COLOR = 'white'
-plt.rcParams['text.color'] = COLOR
-plt.rcParams['axes.labelcolor'] = COLOR
-plt.rcParams['xtick.color'] = COLOR
-plt.rcParams['ytick.color'] = COLOR
+    plt.rcParams['text.color'] = COLOR
+    plt.rcParams['axes.labelcolor'] = COLOR
+    plt.rcParams['xtick.color'] = COLOR
+    plt.rcParams['ytick.color'] = COLOR
 
-def custom_round(x, base=5):
-    return int(round(float(x*100)/base))
 
-@st.cache(allow_output_mutation=True)
-def get_data(limit=None):
-    #read scraped data in
-    #df = pd.read_csv('data/final_final_data.csv', sep=';').drop(['Unnamed: 0','Unnamed: 0.1'],axis=1)
-    gdf = gpd.read_file('data/final_geodataframe_v2.geojson')
+#attributes the Home map can show, kde_sales_density only when data/kde_levels.geojson exists
+ATTRIBUTES = ['adjusted_sqm_price','square_meters_price','kde_sales_density']
+
+#tooltip wording of the attributes
+ATTRIBUTE_UNITS = {
+    'adjusted_sqm_price': 'price pr sq meter',
+    'square_meters_price': 'price pr sq meter',
+    'kde_sales_density': 'sales density',
+}
+
+#density levels are 0-1, prices tens of thousands
+ELEVATION_SCALE = {'kde_sales_density': 1000}
+
+#iso-proportion levels and bandwidth multiplier of the Sales Density scale, as in analysis.ipynb
+DENSITY_LEVELS = (0.2, 0.4, 0.6, 0.8, 0.95, 1)
+BW_ADJUST = 1.0
+
+#year-partitioned dataset written by partitions.py, read instead of final_geodataframe_v2 when it exists
+SALES_ROOT = 'data/sales'
+
+#offline address index built by offline_index.py, the search geocodes against it instead of DAWA when it exists
+ADDRESS_INDEX = 'data/address_index'
+
+#Prometheus /metrics port and json lines file of rerun traces, off unless set in the environment
+METRICS_PORT = os.environ.get('HOUSING_METRICS_PORT')
+TRACE_LOG = os.environ.get('HOUSING_TRACE_LOG')
+
+#compact column types and no geometry/tooltip columns in the shared sales frame (compact.py),
+#HOUSING_COMPACT_DATA=0 keeps the full GeoDataFrame
+COMPACT_DATA = os.environ.get('HOUSING_COMPACT_DATA', '1') != '0'
 
-    if limit:
-        gdf = gdf.head(limit)
 
-    #convert adjusted_sqm_price to thousand separated integer (string)
-    gdf['tooltip_price'] = gdf['adjusted_sqm_price'].astype(int)
-    gdf['tooltip_price'] = gdf['tooltip_price'].map('{:,.2f}'.format)
+def serialized(deck):
+    #serialize a deck once, pydeck_chart's to_json() call and the payload metric then reuse the string
+    payload = deck.to_json()
+    deck.to_json = lambda: payload
+    return deck
 
-    #strip apartment identifier and store just address for tooltip
-    gdf['tooltip_address'] = [a.strip().split(',')[0] for a in gdf['address'].values.tolist()]
 
-    #scale price to get elevation right for plot
-    gdf['scaled_adjusted_sqm_price']=(gdf['adjusted_sqm_price']-gdf['adjusted_sqm_price'].min())/(gdf['adjusted_sqm_price'].max()-gdf['adjusted_sqm_price'].min())
+@resource_cache
+def start_instrumentation():
+    #once per process, every session's reruns are traced into the same metrics
+    server = serve_metrics(int(METRICS_PORT)) if METRICS_PORT else None
+    if TRACE_LOG:
+        log_traces(TRACE_LOG)
+    return server
 
-    gdf['color_int'] = gdf['scaled_adjusted_sqm_price'].apply(lambda x: custom_round(x,base=5))
+
+def add_density_column(gdf):
+    #density level of every apartment, when analysis.ipynb has written the KDE contours
+    if os.path.exists(LEVELS_PATH):
+        gdf['kde_sales_density'] = density_score(gdf['lng'].values, gdf['lat'].values, read_geo(LEVELS_PATH))
     return gdf
 
-@st.cache
+
+def prepare_sales(gdf):
+    #every column get_data needs, in the layout it is kept in
+    gdf = add_density_column(gdf)
+    return compact_sales(gdf) if COMPACT_DATA else gdf
+
+
+@resource_cache
+def get_sales_store():
+    #the year-partitioned dataset (partitions.py) when it has been built, None otherwise
+    if not os.path.isdir(SALES_ROOT):
+        return None
+    store = PartitionedSales(SALES_ROOT, transform=prepare_sales)
+    store.refresh()
+    return store
+
+
+def data_version():
+    #version of the whole dataset, bumped by every append
+    store = get_sales_store()
+    return store.version if store is not None else 0
+
+
+def range_version(year_filter):
+    #versions of the partitions in the year range, so an append only invalidates the ranges it touches
+    store = get_sales_store()
+    return store.versions(*year_filter) if store is not None else 0
+
+
+@resource_cache(max_entries=1)
+def get_data(version, limit=None):
+    #read scraped data in
+    #df = pd.read_csv('data/final_final_data.csv', sep=';').drop(['Unnamed: 0','Unnamed: 0.1'],axis=1)
+    with span('load_data'):
+        store = get_sales_store()
+        if store is not None:
+            #partitions come in year order
+            return store.frame()
+
+        gdf = read_geo('data/final_geodataframe_v2')
+
+        if limit:
+            gdf = gdf.head(limit)
+
+        #sorted by year once, so a year range is a slice of rows and filtering never copies the frame
+        gdf = sort_by_year(gdf)
+        return prepare_sales(gdf)
+
+@resource_cache
 def get_postnumre():
-    gdf = gpd.read_file('data/filtered_postnumre.geojson')
+    gdf = read_geo('data/filtered_postnumre')
     return gdf
 
-@st.cache
+@resource_cache
 def get_sogne():
-    gdf = gpd.read_file('data/sogne.geojson')
+    gdf = read_geo('data/sogne')
     return gdf
 
 
+def get_attributes():
+    #map attributes of the dataset, known without loading it: kde_sales_density is added
+    #by add_density_column exactly when the KDE contours exist
+    return [a for a in ATTRIBUTES if a != 'kde_sales_density' or os.path.exists(LEVELS_PATH)]
+
+
+def get_years(version):
+    #years for the slider, from the partition manifest when there is one so the first page
+    #renders before any sales are read
+    store = get_sales_store()
+    if store is not None:
+        return store.year_list()
+    return get_year_ranges(version).index.tolist()
+
+
+@data_cache
+def get_year_ranges(version):
+    #min/max of every attribute per year, for the year slider and colorbar
+    return get_data(version).groupby('year')[get_attributes()].agg(['min','max'])
+
+
+@resource_cache(max_entries=2)
+def get_region_cube(scale, version):
+    #region x year aggregates, any year range is a sum over the cube
+    keys = ['postal','kommune'] if scale == 'Postal Codes' else ['sognekode']
+    store = get_sales_store()
+    if store is not None:
+        #one cube per year partition, an append only rebuilds the cubes of its years
+        return RegionCube.combine(store.partitions(('region_cube', scale), lambda frame: RegionCube(frame, keys)).values())
+    return RegionCube(get_data(version), keys)
+
+
+@resource_cache(max_entries=2)
+def get_region_geometry(scale, version):
+    #polygons plus the (cube region, polygon row) pairs to join them
+    if scale == 'Postal Codes':
+        geometry = get_postnumre().drop('id',axis=1)
+        key = 'POSTNR_TXT'
+    else:
+        #a copy, the cached sogne frame is shared and must not be modified
+        geometry = get_sogne().copy()
+        key = 'SOGNEKODE'
+    geometry[key] = geometry[key].astype(str)
+    return geometry, get_region_cube(scale, version).geometry_pairs(geometry[key])
+
+
+@resource_cache
+def get_polygon_layer(scale):
+    #simplified, pre-serialized polygons in the row order of get_region_geometry, built once
+    geometry = get_postnumre() if scale == 'Postal Codes' else get_sogne()
+    return PolygonLayer(geometry.geometry.values, zoom=CITY_ZOOM)
+
+
+@resource_cache(max_entries=1)
+def get_address_table(version):
+    #one row per distinct coordinate, built once per dataset version
+    gdf = get_data(version)
+    store = get_sales_store()
+    if store is not None:
+        #merged from one table per year partition, an append only rebuilds the tables of its years
+        return PartitionedAddressTable(gdf, store.partitions('address_table', AddressTable).values())
+    return AddressTable(gdf)
+
+
+@resource_cache(max_entries=1)
+def get_neighbourhood_index(version):
+    from neighbourhood import NeighbourhoodIndex
+
+    #built once per dataset version, the search page only queries it
+    return NeighbourhoodIndex(get_address_table(version))
+
+
+@resource_cache
+def get_geocoder():
+    from geocoders import CachedGeocoder, RemoteGeocoder, OfflineGeocoder
+    from coalesce import CoalescingGeocoder
+
+    #shared across sessions, the cache makes repeated searches skip the lookup
+    backend = OfflineGeocoder(ADDRESS_INDEX) if os.path.isdir(ADDRESS_INDEX) else RemoteGeocoder()
+    #sessions searching the same address at once share one lookup
+    return CoalescingGeocoder(CachedGeocoder(backend, GeocodeCache()))
+
+
+@data_cache
+def get_density_surface(year_filter, bw_adjust, versions):
+    #binned KDE of the sales in the year range, per (year range, bandwidth, partition versions)
+    from density import kde_grid
+
+    gdf = get_data(data_version())
+    rows = year_rows(gdf['year'].values, *year_filter)
+    return kde_grid(gdf['lng'].iloc[rows].to_numpy(), gdf['lat'].iloc[rows].to_numpy(), bw_adjust=bw_adjust)
+
+
+@data_cache
+def get_density_polygons(year_filter, bw_adjust, versions):
+    #filled bands between the iso-proportion levels of the surface
+    from density import level_polygons
+
+    return level_polygons(get_density_surface(year_filter, bw_adjust, versions), DENSITY_LEVELS)
+
+
+@resource_cache
+def get_palettes():
+    #names of the available leafmap palettes for the dropdowns, precomputed in data/palettes.json
+    return palette_names()
+
+
+@data_cache
+def get_palette_colors(palette):
+    #(21, 3) uint8 color array of a palette
+    return palette_array(palette)
+
+
+@data_cache(copy=False)
+def get_home_deck(year_filter, attribute, scale, palette, versions):
+    #the Home page map for one (year range, attribute, scale, palette), shared by all sessions
+    #until a partition in the year range changes
+    #the full dataset, rendering is bounded by the level of detail in lod.py
+    version = data_version()
+    gdf = get_data(version)
+    colors = get_palette_colors(palette)
+
+    #let view be the same no matter the plot
+    view = pdk.ViewState(
+    latitude=55.67, longitude=12.56, zoom=9, max_zoom=18, pitch=0, bearing=0
+    )
+
+    if scale == 'Individual Apartments':
+
+        #the selected years are a contiguous block of the year-sorted frame, the column arrays below are views
+        rows = year_rows(gdf['year'].values, *year_filter)
+        lng, lat, values = (gdf[c].iloc[rows].to_numpy() for c in ['lng','lat',attribute])
+
+        #above MAX_POINTS apartments the points are binned into a grid for the browser's sake
+        with span('level_of_detail'):
+            cells, cell_zoom = level_of_detail(lng, lat, values)
+
+        if cells is None:
+            #only the columns the layer and tooltip use, not the whole GeoDataFrame
+            data = pd.DataFrame({
+                'lng': lng,
+                'lat': lat,
+                attribute: values,
+                #formatted for the drawn rows only, the shared frame has no tooltip columns
+                **tooltip_columns(get_address_table(version), rows),
+            })
+            with span('colors'):
+                add_color_columns(data, values, colors)
+            radius = 50
+            html = "<b>{tooltip_address}</b> <br> {tooltip_price} price pr sq meter"
+        else:
+            data = cells.rename(columns={'mean':attribute})
+            with span('colors'):
+                add_color_columns(data, data[attribute].values, colors)
+            data['tooltip_price'] = data[attribute].map(('{:,.2f}' if attribute == 'kde_sales_density' else '{:,.0f}').format)
+            radius = cell_radius(cell_zoom)
+            html = "<b>{count} apartments</b> <br> {tooltip_price} average " + ATTRIBUTE_UNITS[attribute]
+
+        column_layer = pdk.Layer(
+            "ColumnLayer",
+            data=data,
+            get_position=["lng", "lat"],
+            get_elevation=attribute,
+            elevation_scale=ELEVATION_SCALE.get(attribute, .02),
+            radius=radius,
+            extruded =True,
+            #get_fill_color=[255,255,"attribute/1000"],
+            get_fill_color = FILL_COLOR,
+            #[180, 0, 200, 140],
+            #[255, "square_meters_price/100", "square_meters_price/10000", 140],
+            opacity = 1,
+            pickable=True,
+            auto_highlight=True,
+        )
+
+        tooltip = {
+            "html": html,
+            "style": {"background": "grey", "color": "white", "font-family": '"Helvetica Neue", Arial', "z-index": "10000"},
+        }
+
+
+        r = pdk.Deck(
+            column_layer,
+            initial_view_state=view, 
+            tooltip=tooltip,
+            map_provider="carto",
+        )
+
+
+    elif scale == 'Postal Codes':
+        
+        post, pairs = get_region_geometry(scale, version)
+
+        #mean/median per postal code from the precomputed cube, joined to the polygons by row
+        cube = get_region_cube(scale, version)
+        with span('region_join'):
+            stats, rows = cube.join(cube.query(*year_filter), pairs)
+        geometry = post.iloc[rows]
+
+        #properties only, the layer attaches the pre-serialized polygons
+        grouped = pd.DataFrame({
+            'city': geometry['POSTBYNAVN'].values,
+            'postal': stats['postal'].astype(str).values,
+            'adjusted_sqm_price_mean': stats['mean'].values,
+            'adjusted_sqm_price_median': stats['median'].values,
+        })
+ 
+        #max_median = grouped.adjusted_sqm_price_median.max()
+        #min_median = grouped.adjusted_sqm_price_median.min()
+
+        with span('colors'):
+            add_color_columns(grouped, grouped['adjusted_sqm_price_median'].values, colors)
+
+        #convert adjusted_sqm_price to thousand separated integer (string)
+        grouped['tooltip_price'] = grouped['adjusted_sqm_price_median'].astype(int)
+        grouped['tooltip_price'] = grouped['tooltip_price'].map('{:,.0f}'.format)
+
+        geojson = pdk.Layer(
+        "GeoJsonLayer",
+        #"ColumnLayer",
+        get_polygon_layer(scale).records(rows, grouped),
+        #id="geojson",
+        pickable=True,
+        opacity=0.5,
+        stroked=True,
+        filled=True,
+        extruded=True,
+        wireframe=True,
+        get_elevation='adjusted_sqm_price_median',
+        #get_elevation = '',
+        elevation_scale=.15,
+        # get_fill_color="color",
+        #get_fill_color=color_exp,
+        get_fill_color=FILL_COLOR,
+        get_line_color=[0, 0, 0],
+        get_line_width=2,
+        line_width_min_pixels=1,
+        )
+
+        
+        tooltip = {
+            "html": "<b>{city}</b> <br> {tooltip_price} price pr sq meter",
+            "style": {"background": "grey", "color": "white", "font-family": '"Helvetica Neue", Arial', "z-index": "10000"},
+        }
+
+
+        r = pdk.Deck(
+            layers =[geojson],
+            initial_view_state=view,
+            #pdk.data_utils.compute_view(gdf[["lng", "lat"]]),
+            map_provider="carto",
+            tooltip=tooltip,
+        )
+
+
+    elif scale == 'Parish (Sogn)':
+
+        sogne, pairs = get_region_geometry(scale, version)
+
+        #mean/median per parish from the precomputed cube, joined to the polygons by row
+        cube = get_region_cube(scale, version)
+        with span('region_join'):
+            stats, rows = cube.join(cube.query(*year_filter), pairs)
+        geometry = sogne.iloc[rows]
+
+        #properties only, the layer attaches the pre-serialized polygons
+        grouped = pd.DataFrame({
+            'sognekode': geometry['SOGNEKODE'].values,
+            'sognenavn': geometry[parish_name_column(geometry)].values,
+            'adjusted_sqm_price_mean': stats['mean'].values,
+            'adjusted_sqm_price_median': stats['median'].values,
+        })
+
+        with span('colors'):
+            add_color_columns(grouped, grouped['adjusted_sqm_price_median'].values, colors)
+
+        #convert adjusted_sqm_price to thousand separated integer (string)
+        grouped['tooltip_price'] = grouped['adjusted_sqm_price_median'].astype(int)
+        grouped['tooltip_price'] = grouped['tooltip_price'].map('{:,.0f}'.format)
+   
+        geojson = pdk.Layer(
+        "GeoJsonLayer",
+        #"ColumnLayer",
+        get_polygon_layer(scale).records(rows, grouped),
+        #id="geojson",
+        pickable=True,
+        opacity=0.5,
+        stroked=True,
+        filled=True,
+        extruded=True,
+        wireframe=True,
+        get_elevation='adjusted_sqm_price_median',
+        #get_elevation = '',
+        elevation_scale=.15,
+        # get_fill_color="color",
+        #get_fill_color=color_exp,
+        get_fill_color=FILL_COLOR,
+        get_line_color=[0, 0, 0],
+        get_line_width=2,
+        line_width_min_pixels=1,
+        )
+
+        tooltip = {
+            "html": "<b>{sognenavn}</b> <br> {tooltip_price} price pr sq meter",
+            "style": {"background": "grey", "color": "white", "font-family": '"Helvetica Neue", Arial', "z-index": "10000"},
+        }
+
+        r = pdk.Deck(
+            layers =[geojson],
+            initial_view_state=view,
+            map_provider="carto",
+            tooltip=tooltip,
+        )
+
+    elif scale == 'Sales Density':
+
+        #filled KDE bands of the sales in the year range, one MultiPolygon per level
+        bands = get_density_polygons(year_filter, BW_ADJUST, versions)
+
+        with span('colors'):
+            add_color_columns(bands, bands['level'].values, colors)
+        bands['tooltip_level'] = ['inside the contour around the densest {:.0%} of sales'.format(1 - level) for level in bands['level']]
+
+        geojson = pdk.Layer(
+        "GeoJsonLayer",
+        bands,
+        pickable=True,
+        opacity=0.5,
+        stroked=True,
+        filled=True,
+        get_fill_color=FILL_COLOR,
+        get_line_color=[0, 0, 0],
+        get_line_width=2,
+        line_width_min_pixels=1,
+        )
+
+        tooltip = {
+            "html": "<b>Sales density level {level}</b> <br> {tooltip_level}",
+            "style": {"background": "grey", "color": "white", "font-family": '"Helvetica Neue", Arial', "z-index": "10000"},
+        }
+
+        r = pdk.Deck(
+            layers =[geojson],
+            initial_view_state=view,
+            map_provider="carto",
+            tooltip=tooltip,
+        )
+
+    with span('deck_serialize'):
+        return serialized(r)
+
+
+@data_cache
+def get_colorbar(year_filter, attribute, scale, palette, versions):
+    #fetch max and min values for colorbar ticks
+    if scale == 'Sales Density':
+        label = 'Sales Density Level'
+        min_value, max_value = min(DENSITY_LEVELS[:-1]), max(DENSITY_LEVELS[:-1])
+    else:
+        label = attribute.replace("_", " ").title()
+        year_ranges = get_year_ranges(data_version()).loc[year_filter[0]:year_filter[1], attribute]
+        min_value = year_ranges['min'].min()
+        max_value = year_ranges['max'].max()
+
+    #leafmap.colormaps takes seconds to import, only a plot needs it
+    import leafmap.colormaps as cm
+    style_matplotlib()
+
+    return cm.create_colormap(
+        palette,
+        label=label,
+        width=0.2,
+        height=3,
+        orientation="vertical",
+        vmin=min_value,
+        vmax=max_value,
+        font_size=8,
+    )
+
+
 def pd_column_to_pretty(pd_column):
     d = {'square_meters_price':'Price m\u00b2',
-        'adjusted_sqm_price': 'Adj. price m\u00b2'
+        'adjusted_sqm_price': 'Adj. price m\u00b2',
+        'kde_sales_density': 'Sales density'
     }
     return d[pd_column]
 
@@ -73,6 +543,23 @@ def pd_column_to_pretty(pd_column):
 def main():
 
     st.set_page_config(layout="wide")
+    start_instrumentation()
+
+    #cProfile the whole rerun, e.g. tick it and click Plot to profile one plot
+    profile = st.sidebar.checkbox("Profile this run", help="Show a cProfile report of every rerun while ticked")
+
+    with trace('rerun', profile=profile) as run:
+        render()
+
+    #shown in the sidebar on the next rerun
+    st.session_state['last_trace'] = run
+
+    if run.profile:
+        with st.expander("Profile of this run"):
+            st.text(run.profile)
+
+
+def render():
 
     st.markdown("<h1 style='text-align: center; color: White;'>Copenhagen Housing</h1>", unsafe_allow_html=True)
     st.write('')
@@ -103,14 +590,30 @@ def main():
     #chosen tab
     page_choice = st.sidebar.radio("Menu",pages)
 
-    #fetch data - we can put this inside the if later
-    gdf = get_data(limit=5000)
+    #pick up partitions appended since the last rerun, only their new files are read
+    store = get_sales_store()
+    if store is not None:
+        with span('refresh'):
+            store.refresh()
+
+    #calls/hits/misses of the caches shared by all sessions, as of the previous rerun
+    with st.sidebar.expander("Cache stats"):
+        st.dataframe(cache_stats())
+
+    #where the previous rerun of this session spent its time, spans listed as they finished
+    last_trace = st.session_state.get('last_trace')
+    if last_trace is not None:
+        with st.sidebar.expander("Last rerun: {:.3f}s".format(last_trace.seconds)):
+            spans = pd.DataFrame(last_trace.spans, columns=['span', 'depth', 'seconds'])
+            spans['span'] = ['  ' * depth + name for name, depth in zip(spans['span'], spans['depth'])]
+            st.dataframe(spans[['span', 'seconds']])
+            if last_trace.values:
+                st.write(last_trace.values)
 
     #if home page is selected
     if page_choice == 'Home':
         
-        postals = gdf.postal.unique()
-        years = sorted(gdf.year.unique())
+        years = get_years(data_version())
 
         min_y, max_y = min(years),max(years)
 
@@ -122,219 +625,36 @@ def main():
         year_filter = c1.select_slider("Data from: ",options=years,value=(min_y,max_y))
         
         #attribute dropdown
-        attribute = c2.selectbox("Attribute",options=['adjusted_sqm_price','square_meters_price'],format_func=pd_column_to_pretty,index=0)
+        attribute = c2.selectbox("Attribute",options=get_attributes(),format_func=pd_column_to_pretty,index=0)
         
         #scale for plot
-        scale = c3.selectbox("Scale",options=['Individual Apartments','Postal Codes','Parish (Sogn)'])
+        scale = c3.selectbox("Scale",options=['Individual Apartments','Postal Codes','Parish (Sogn)','Sales Density'])
 
         #fetch available palettes and display in dropdown
-        palettes = cm.list_colormaps()
+        palettes = get_palettes()
         palette = c4.selectbox("Color Palette",options=palettes,index=2)
 
-        #convert chosen palette to colors
-        colors = cm.get_palette(palette,21)
-        colors = [hex_to_rgb(c) for c in colors]
-
         #search button
         go = button.button('Plot ')
 
         if go:
 
-            #filter the dataframe by selected year range
-            gdf = gdf[(gdf['year'] >= year_filter[0]) & (gdf['year'] <= year_filter[1])]
-
-            #let view be the same no matter the plot
-            view = pdk.ViewState(
-            latitude=55.67, longitude=12.56, zoom=9, max_zoom=18, pitch=0, bearing=0
-            )
-
-            if scale == 'Individual Apartments':
-
-                gdf['color_rgb'] = [colors[i-1] for i in gdf['color_int'].values.tolist()]
-
-                column_layer = pdk.Layer(
-                    "ColumnLayer",
-                    data=gdf,
-                    get_position=["lng", "lat"],
-                    get_elevation=attribute,
-                    elevation_scale=.02,
-                    radius=50,
-                    extruded =True,
-                    #get_fill_color=[255,255,"attribute/1000"],
-                    get_fill_color = "color_rgb",
-                    #[180, 0, 200, 140],
-                    #[255, "square_meters_price/100", "square_meters_price/10000", 140],
-                    opacity = 1,
-                    pickable=True,
-                    auto_highlight=True,
-                )
-
-                tooltip = {
-                    "html": "<b>{tooltip_address}</b> <br> {tooltip_price} price pr sq meter",
-                    "style": {"background": "grey", "color": "white", "font-family": '"Helvetica Neue", Arial', "z-index": "10000"},
-                }
-
-
-                r = pdk.Deck(
-                    column_layer,
-                    initial_view_state=view, 
-                    tooltip=tooltip,
-                    map_provider="carto",
-                )
-    
-        
-            elif scale == 'Postal Codes':
-                
-                post = get_postnumre().drop('id',axis=1)
-
-                grouped = gdf.groupby(['postal','kommune']).agg({'adjusted_sqm_price':['mean','median']}).reset_index()
-            
-                grouped['postal'] = grouped['postal'].astype(str)
-                post['POSTNR_TXT'] = post['POSTNR_TXT'].astype(str)
-
-                grouped = post.merge(grouped,left_on='POSTNR_TXT',right_on='postal')
-
-                grouped.columns = ['city','postal','geometry','drop_1','drop_2','adjusted_sqm_price_mean','adjusted_sqm_price_median']
-                grouped = grouped.drop(['drop_1','drop_2'],axis=1)
-     
-                #max_median = grouped.adjusted_sqm_price_median.max()
-                #min_median = grouped.adjusted_sqm_price_median.min()
-
-                grouped['scaled_adjusted_sqm_price']=(grouped['adjusted_sqm_price_median']-grouped['adjusted_sqm_price_median'].min())/(grouped['adjusted_sqm_price_median'].max()-grouped['adjusted_sqm_price_median'].min())
-
-                grouped['color_int'] = grouped['scaled_adjusted_sqm_price'].apply(lambda x: custom_round(x,base=5))
-                grouped['color_rgb'] = [colors[i] for i in grouped['color_int'].values.tolist()]
-
-                #convert adjusted_sqm_price to thousand separated integer (string)
-                grouped['tooltip_price'] = grouped['adjusted_sqm_price_median'].astype(int)
-                grouped['tooltip_price'] = grouped['tooltip_price'].map('{:,.0f}'.format)
-
-                geojson = pdk.Layer(
-                "GeoJsonLayer",
-                #"ColumnLayer",
-                grouped,
-                #id="geojson",
-                pickable=True,
-                opacity=0.5,
-                stroked=True,
-                filled=True,
-                extruded=True,
-                wireframe=True,
-                get_elevation='adjusted_sqm_price_median',
-                #get_elevation = '',
-                elevation_scale=.15,
-                # get_fill_color="color",
-                #get_fill_color=color_exp,
-                get_fill_color="color_rgb",
-                get_line_color=[0, 0, 0],
-                get_line_width=2,
-                line_width_min_pixels=1,
-                )
-
-                
-                tooltip = {
-                    "html": "<b>{city}</b> <br> {tooltip_price} price pr sq meter",
-                    "style": {"background": "grey", "color": "white", "font-family": '"Helvetica Neue", Arial', "z-index": "10000"},
-                }
-
-
-                r = pdk.Deck(
-                    layers =[geojson],
-                    initial_view_state=view,
-                    #pdk.data_utils.compute_view(gdf[["lng", "lat"]]),
-                    map_provider="carto",
-                    tooltip=tooltip,
-                )
-
-
-            elif scale == 'Parish (Sogn)':
-
-                sogne = get_sogne()
-
-                grouped = gdf.groupby(['sognekode']).agg({'adjusted_sqm_price':['mean','median']}).reset_index()
-            
-                grouped['SOGNEKODE'] = grouped['sognekode'].astype(str)
-                
-                sogne['SOGNEKODE'] = sogne['SOGNEKODE'].astype(str)
-                
-                grouped = sogne.merge(grouped,left_on=['SOGNEKODE'],right_on=['sognekode'])
-
-                grouped.columns = ['drop_1','sognekode','sognenavn','geometry','drop_2','adjusted_sqm_price_mean','adjusted_sqm_price_median','drop_3']
-                grouped = grouped.drop(['drop_1','drop_2','drop_3'],axis=1)
-
-                grouped['scaled_adjusted_sqm_price']=(grouped['adjusted_sqm_price_median']-grouped['adjusted_sqm_price_median'].min())/(grouped['adjusted_sqm_price_median'].max()-grouped['adjusted_sqm_price_median'].min())
-
-                grouped['color_int'] = grouped['scaled_adjusted_sqm_price'].apply(lambda x: custom_round(x,base=5))
-                grouped['color_rgb'] = [colors[i-1] for i in grouped['color_int'].values.tolist()]
-
-                max_median = grouped.adjusted_sqm_price_median.max()
-                min_median = grouped.adjusted_sqm_price_median.min()
-
-                grouped['color'] = (grouped['adjusted_sqm_price_median']-min_median)/(max_median-min_median)*255
-                grouped['color'] = grouped['color'].astype(int)
-
-                #convert adjusted_sqm_price to thousand separated integer (string)
-                grouped['tooltip_price'] = grouped['adjusted_sqm_price_median'].astype(int)
-                grouped['tooltip_price'] = grouped['tooltip_price'].map('{:,.0f}'.format)
-           
-                geojson = pdk.Layer(
-                "GeoJsonLayer",
-                #"ColumnLayer",
-                grouped,
-                #id="geojson",
-                pickable=True,
-                opacity=0.5,
-                stroked=True,
-                filled=True,
-                extruded=True,
-                wireframe=True,
-                get_elevation='adjusted_sqm_price_median',
-                #get_elevation = '',
-                elevation_scale=.15,
-                # get_fill_color="color",
-                #get_fill_color=color_exp,
-                get_fill_color="color_rgb",
-                get_line_color=[0, 0, 0],
-                get_line_width=2,
-                line_width_min_pixels=1,
-                )
-
-                tooltip = {
-                    "html": "<b>{sognenavn}</b> <br> {tooltip_price} price pr sq meter",
-                    "style": {"background": "grey", "color": "white", "font-family": '"Helvetica Neue", Arial', "z-index": "10000"},
-                }
-
-                r = pdk.Deck(
-                    layers =[geojson],
-                    initial_view_state=view,
-                    map_provider="carto",
-                    tooltip=tooltip,
-                )
-
+            versions = range_version(year_filter)
+            with span('home_deck'):
+                r = get_home_deck(year_filter, attribute, scale, palette, versions)
 
             #columns for plot and colorbar
             mapp, color_bar = st.columns((1,.125))
 
-            #fetch max and min values for colorbar ticks
-            min_value = gdf[attribute].min()
-            max_value = gdf[attribute].max()
-
             #plot the mao
-            mapp.pydeck_chart(r)
+            #what pydeck_chart sends to the browser, the cached deck's json is not rebuilt to measure it
+            record('home_deck_payload_bytes', len(r.to_json()))
+            with span('pydeck_chart'):
+                mapp.pydeck_chart(r)
 
             #show the colorbar
-            color_bar.write(
-                cm.create_colormap(
-                    palette,
-                    label=attribute.replace("_", " ").title(),
-                    width=0.2,
-                    height=3,
-                    orientation="vertical",
-                    vmin=min_value,
-                    vmax=max_value,
-                    font_size=8,
-                )
-            )
+            with span('colorbar'):
+                color_bar.write(get_colorbar(year_filter, attribute, scale, palette, versions))
 
 
     elif page_choice == 'Search':
@@ -350,12 +670,11 @@ def main():
         min_apartments = first_row[4].selectbox("Min. number of Apartments",options=[i for i in range(10,101,10)],index=4)
 
         #fetch available palettes and display in dropdown
-        palettes = cm.list_colormaps()
+        palettes = get_palettes()
         palette = first_row[-1].selectbox("Color Palette",options=palettes,index=2)
 
-        #convert chosen palette to colors
-        colors = cm.get_palette(palette,21)
-        colors = [hex_to_rgb(c) for c in colors]
+        #convert chosen palette to a (21, 3) uint8 color array
+        colors = get_palette_colors(palette)
 
         space, button = st.columns((1,1.15))
 
@@ -365,7 +684,18 @@ def main():
 
         if go:
 
-            addr, confidence, lng, lat = DAWA_data(text)
+            from dawa_scrape_prod import DAWA_data
+
+            #failed lookups come back as (None, None, None, None), anything raised is a broken backend
+            try:
+                with span('geocode'):
+                    addr, confidence, lat, lng = DAWA_data(text, backend=get_geocoder())
+            except Exception:
+                lat = lng = None
+
+            if lat is None or lng is None:
+                st.markdown("<h6 style='text-align: center; color: White;'>Lookup failed: could not match {} to an address, try again</h3>".format(text), unsafe_allow_html=True)
+                return
 
             temp_string = 'Matched {} to address: {}'.format(text,addr)
             print_string = "<h6 style='text-align: center; color: White;'>{}</h3>".format(temp_string)
@@ -377,104 +707,43 @@ def main():
             second_row = st.columns((1,1,1))
             second_row_extended = second_row*100
 
-            points = [(lat,lng),]
-            points_set = set()
+            #nearest addresses until we have enough addresses and apartments
+            #a small frame of just the columns the layer uses, the shared dataset is not copied
+            with span('neighbourhood_query'):
+                new_dataframe, addresses = get_neighbourhood_index(data_version()).query(lng, lat, min_addresses=min_addresses, min_apartments=min_apartments,
+                                                                           columns=['lng','lat','adjusted_sqm_price'])
 
-            points_set.add((lat,lng))
+            for i, (add, num_condos) in enumerate(zip(addresses['address'], addresses['apartments'])):
+                if num_condos == 1:
+                    s = 'apartment'
+                else:
+                    s = 'apartments'
 
-            new_dataframe = pd.DataFrame()
+                second_row_extended[i].write('{} {} sold at \t{}'.format(num_condos,s,add))
 
-            search_gdf = gdf.copy()
-
-            search_gdf['lnglat'] = search_gdf['lng'].astype(str) + ',' + search_gdf['lat'].astype(str)
-
-            count = 0
-
-            total_condos = 0
-
-            #while len(points) <= min_addresses:
-            while count <  min_apartments+1 or len(points)<= min_addresses:
-                
-                current_length = len(search_gdf)
-
-                #if we have one point, the point's index is 0
-                #so len(points) - 1 is curr_point_index
-                curr_point_index = len(points) - 1
-
-                #this is the current point (lat,lng)
-                curr_point = points[curr_point_index]
-
-                #get the nearest points to curr_point
-                neighborhood = search_gdf.sindex.nearest(curr_point)
-
-                #neighbors = [x for x in neighborhood]
-
-                #num_neighbors = len(neighbors)
-
-                for i in neighborhood:
-                    count += 1
-                    row = search_gdf.iloc[[i]]
-
-                    #store lat, lng
-                    lati = float(row['lat'])
-                    longi = float(row['lng'])
-
-                    #point = row['latlng']
-
-                    #check if the address has already been traversed
-                    if (longi,lati) not in points_set:
-
-                        add = row['address'].values.tolist()[0].strip().split(',')[0]
-
-
-                        lat_filter = row['lat'].values.flatten().tolist()[0]
-                        long_filter = row['lng'].values.flatten().tolist()[0]
-
-                        num_condos = current_length - len(search_gdf[(search_gdf['lat'] != lat_filter) & (search_gdf['lat'] != long_filter)])
-                        total_condos += num_condos
-                        
-                        if num_condos == 1:
-                            s = 'apartment'
-                        else:
-                            s = 'apartments'
-
-                        second_row_extended[len(points)-1].write('{} {} sold at \t{}'.format(num_condos,s,add))
-                        
-                        #if it hasn't, put it in the points_set
-                        #and points
-                        points.append((longi,lati))
-                        points_set.add((longi,lati))
-
-
-                    #append the apartment to new_dataframe
-                    new_dataframe = new_dataframe.append(row)
-
-                filter_points = [','.join(map(str, tup)) for tup in points_set] 
-
-                search_gdf = search_gdf[~search_gdf['lnglat'].isin(filter_points)]
+            count = len(new_dataframe)
 
+            #the sales come address by address, all of every address's apartments
+            new_dataframe['tooltip_address'] = np.repeat(addresses['address'].to_numpy(), addresses['apartments'].to_numpy())
 
             #scale price to get elevation right for plot
             new_dataframe['scaled_adjusted_sqm_price']=(new_dataframe['adjusted_sqm_price']-new_dataframe['adjusted_sqm_price'].min())/(new_dataframe['adjusted_sqm_price'].max()-new_dataframe['adjusted_sqm_price'].min())
 
-            new_dataframe['color_int'] = new_dataframe['scaled_adjusted_sqm_price'].apply(lambda x: custom_round(x,base=5))
-            new_dataframe['color_rgb'] = [colors[i] for i in new_dataframe['color_int'].values.tolist()]
+            with span('colors'):
+                add_color_columns(new_dataframe, new_dataframe['adjusted_sqm_price'].values, colors)
 
             #convert adjusted_sqm_price to thousand separated integer (string)
             new_dataframe['tooltip_price'] = new_dataframe['adjusted_sqm_price'].astype(int)
             new_dataframe['tooltip_price'] = new_dataframe['tooltip_price'].map('{:,.0f}'.format)
-
-            #strip apartment identifier and store just address for tooltip
-            new_dataframe['tooltip_address'] = [a.strip().split(',')[0] for a in new_dataframe['address'].values.tolist()]
             
-            temp_string = '{} apartments on {} different addresses'.format(count,len(points))
+            temp_string = '{} apartments on {} different addresses'.format(count,len(addresses))
             print_string = "<h3 style='text-align: center; color: White;'>{}</h3>".format(temp_string)
 
             st.markdown("---")
             st.markdown(print_string, unsafe_allow_html=True)
 
             view = pdk.ViewState(
-            latitude=lng, longitude=lat, zoom=15, max_zoom=18, pitch=45, bearing=0
+            latitude=lat, longitude=lng, zoom=15, max_zoom=18, pitch=45, bearing=0
             )
 
             column_layer = pdk.Layer(
@@ -484,7 +753,7 @@ def main():
                 get_elevation="scaled_adjusted_sqm_price",
                 elevation_scale=250,
                 radius=4,
-                get_fill_color="color_rgb",#/1000
+                get_fill_color=FILL_COLOR,#/1000
                 #[180, 0, 200, 140],
                 #[255, "square_meters_price/100", "square_meters_price/10000", 140],
                 pickable=True,
@@ -504,7 +773,16 @@ def main():
                 map_provider="carto",
             )
 
-            st.pydeck_chart(r)
+            record('search_deck_payload_bytes', len(serialized(r).to_json()))
+            with span('pydeck_chart'):
+                st.pydeck_chart(r)
+
+            #price per sq meter per year on the addresses, looked up in the address table
+            prices = get_address_table(data_version()).prices.loc[addresses['address_id'].tolist()].reset_index()
+            prices['address'] = addresses.set_index('address_id')['address'].loc[prices['address_id']].to_numpy()
+            prices[['mean', 'median']] = prices[['mean', 'median']].round(0)
+            st.markdown("<h3 style='text-align: center; color: White;'>Price pr sq meter by year</h3>", unsafe_allow_html=True)
+            st.dataframe(prices.set_index(['address', 'year'])[['count', 'mean', 'median']])
 
         
 
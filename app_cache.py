@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Caching layer for the Streamlit app.
+
+Two kinds of cache, both shared by every session of the server process:
+
+- resource_cache: st.cache_resource for the immutable base data (sales,
+  polygons, region cube, search index). One object, handed out by
+  reference and never copied, so it must not be mutated by callers.
+- data_cache: st.cache_data for derived results (filtered aggregates,
+  palettes, decks), keyed on the arguments, e.g. (year range, attribute,
+  scale, palette). Entries expire after DATA_TTL seconds and only the
+  DATA_MAX_ENTRIES most recent per function are kept. Decks are kept by
+  reference (copy=False) since they don't survive pickling.
+
+Both count calls and misses per function, cache_stats() returns them and
+the Prometheus output of instrumentation.py includes them.
+"""
+
+import functools
+import threading
+
+import pandas as pd
+import streamlit as st
+
+import instrumentation
+
+
+#seconds a derived result stays cached
+DATA_TTL = 60 * 60
+
+#derived results kept per function, oldest evicted first
+DATA_MAX_ENTRIES = 64
+
+_stats = {}
+_lock = threading.Lock()
+
+
+def _count(name, field):
+    with _lock:
+        counts = _stats.setdefault(name, {'calls': 0, 'misses': 0})
+        counts[field] += 1
+
+
+def _counted(cache):
+    def decorator(func):
+        name = func.__qualname__
+
+        #only runs on a miss; wraps keeps func's name and source for streamlit's cache key
+        @functools.wraps(func)
+        def compute(*args, **kwargs):
+            _count(name, 'misses')
+            return func(*args, **kwargs)
+
+        cached = cache(compute)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            _count(name, 'calls')
+            return cached(*args, **kwargs)
+
+        wrapper.clear = cached.clear
+        return wrapper
+    return decorator
+
+
+def resource_cache(func=None, max_entries=None):
+    """Cache func's result once per process (per argument tuple) and share it by reference.
+
+    max_entries=1 keeps only the latest, e.g. for results keyed on a dataset version.
+    """
+    decorator = _counted(st.cache_resource(max_entries=max_entries, show_spinner=False))
+    return decorator(func) if func is not None else decorator
+
+
+def data_cache(func=None, ttl=DATA_TTL, max_entries=DATA_MAX_ENTRIES, copy=True):
+    """Cache func's result per argument tuple, bounded by ttl and max_entries.
+
+    Hits return a copy (unpickled) of the result; copy=False shares the
+    result by reference instead, for read-only objects that don't pickle,
+    like pdk.Deck.
+    """
+    cache = st.cache_data if copy else st.cache_resource
+    decorator = _counted(cache(ttl=ttl, max_entries=max_entries, show_spinner=False))
+    return decorator(func) if func is not None else decorator
+
+
+def cache_stats():
+    """DataFrame of calls, hits, misses and hit rate per cached function."""
+    with _lock:
+        rows = {name: dict(counts) for name, counts in _stats.items()}
+
+    stats = pd.DataFrame.from_dict(rows, orient='index', columns=['calls', 'misses']).sort_index()
+    stats['hits'] = stats['calls'] - stats['misses']
+    stats['hit_rate'] = (stats['hits'] / stats['calls'].where(stats['calls'] > 0)).fillna(0).round(3)
+    return stats[['calls', 'hits', 'misses', 'hit_rate']]
+
+
+def _cache_metrics():
+    with _lock:
+        rows = {name: dict(counts) for name, counts in _stats.items()}
+    #samples of one metric stay together, as the exposition format expects
+    return [('cache_{}_total'.format(field), {'function': name}, counts[field])
+            for field in ('calls', 'misses') for name, counts in sorted(rows.items())]
+
+
+instrumentation.register_collector(_cache_metrics)
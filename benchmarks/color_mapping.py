@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Per-row color mapping (custom_round + list of tuples) vs colormapping.color_array.
+
+Usage (from the repo root):
+    python benchmarks/color_mapping.py --rows 5000 100000 1000000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+from colormapping import N_COLORS, color_array, palette_array
+
+
+def custom_round(x, base=5):
+    return int(round(float(x*100)/base))
+
+
+def per_row(values, colors):
+    """The mapping app.py used to do on every rerun."""
+    scaled = (values - values.min()) / (values.max() - values.min())
+    color_int = scaled.apply(lambda x: custom_round(x, base=5))
+    return [colors[i] for i in color_int.values.tolist()]
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[5000, 100000, 1000000])
+    parser.add_argument("--palette", default="Blues")
+    args = parser.parse_args(argv)
+
+    rgb = palette_array(args.palette)
+    colors = [tuple(int(c) for c in row) for row in rgb]
+    assert len(colors) == N_COLORS
+
+    rng = np.random.default_rng(0)
+    for rows in args.rows:
+        values = pd.Series(rng.lognormal(10.5, 0.4, rows))
+        old = timed(per_row, values, colors)
+        new = timed(color_array, values.to_numpy(), rgb)
+        print("{:>8} rows: per row {:8.1f}ms, vectorized {:7.2f}ms ({:.0f}x)".format(rows, old * 1000, new * 1000, old / new))
+
+
+if __name__ == '__main__':
+    main()
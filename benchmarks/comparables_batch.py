@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Throughput of comparables.comparables with 1 to N worker processes.
+
+Usage (from the repo root):
+    python benchmarks/comparables_batch.py --rows 1000000 --points 100000 --processes 1 2 4 8
+
+Builds a comparables index from synthetic sales in a temporary directory,
+checks a sample of the batch results against the Search page's
+NeighbourhoodIndex and prints points/sec per process count (pool start-up
+and the per-worker KD-tree build included).
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from address_table import AddressTable
+from comparables import CHUNK_SIZE, build_index, comparables
+from neighbourhood import NeighbourhoodIndex
+from synthetic import synthetic_sales
+
+
+def check(table, results, samples=50):
+    index = NeighbourhoodIndex(table)
+    for point_id, lng, lat, stats in results[:samples]:
+        sales, addresses = index.query(lng, lat, columns=['adjusted_sqm_price'])
+        assert stats['addresses'] == len(addresses) and stats['apartments'] == len(sales), point_id
+        assert np.isclose(stats['median'], sales['adjusted_sqm_price'].median()), point_id
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--points", type=int, default=100000)
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    table = AddressTable(synthetic_sales(args.rows))
+    rng = np.random.default_rng(1)
+    lng = 12.56 + rng.normal(0, 0.05, args.points)
+    lat = 55.68 + rng.normal(0, 0.03, args.points)
+    points = list(zip(range(args.points), lng, lat))
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        start = time.perf_counter()
+        build_index(table, index_dir)
+        print("{} sales, {} addresses: index built in {:.2f}s".format(args.rows, len(table), time.perf_counter() - start))
+
+        baseline = None
+        for processes in args.processes:
+            start = time.perf_counter()
+            results = list(comparables(iter(points), index_dir, processes=processes, chunk_size=args.chunk_size))
+            elapsed = time.perf_counter() - start
+            check(table, results)
+
+            baseline = baseline or elapsed
+            print("{:>2} processes: {} points in {:6.2f}s  {:9.1f} points/sec  {:4.1f}x".format(
+                processes, len(results), elapsed, len(results) / elapsed, baseline / elapsed))
+
+
+if __name__ == '__main__':
+    main()
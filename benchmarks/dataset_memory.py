@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Bytes per sale of the full sales GeoDataFrame vs compact.compact_sales.
+
+Usage (from the repo root):
+    python benchmarks/dataset_memory.py --rows 100000 1000000
+
+"before" is what get_data held: the GeoDataFrame with its Points and the
+tooltip columns of compact.add_derived_columns. "after" is the compact
+frame the app keeps now. Also times compacting and formatting the
+tooltips of a 20000 row slice (the most the Individual layer draws).
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from address_table import AddressTable
+from compact import add_derived_columns, compact_sales, memory_report, tooltip_columns
+from lod import MAX_POINTS
+from synthetic import synthetic_sales
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[100000, 1000000])
+    args = parser.parse_args(argv)
+
+    for rows in args.rows:
+        gdf = add_derived_columns(synthetic_sales(rows))
+
+        start = time.perf_counter()
+        compact = compact_sales(gdf)
+        compact_seconds = time.perf_counter() - start
+
+        table = AddressTable(compact)
+        start = time.perf_counter()
+        tooltip_columns(table, slice(0, MAX_POINTS))
+        tooltip_seconds = time.perf_counter() - start
+
+        report = memory_report(gdf, compact)
+        before, after = report.loc['total']
+        print("{} sales: {:.0f} -> {:.0f} bytes per sale ({:.1f}x), {:.0f} -> {:.0f} MB; compact in {:.2f}s, {} tooltips in {:.3f}s".format(
+            rows, before, after, before / after, before * rows / 1e6, after * rows / 1e6, compact_seconds, MAX_POINTS, tooltip_seconds))
+        print(report.fillna('-').to_string())
+        print()
+
+
+if __name__ == '__main__':
+    main()
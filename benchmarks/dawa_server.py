@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Local stand-in for the DAWA api, used to measure geocoding throughput.
+
+Usage:
+    python benchmarks/dawa_server.py --port 8765 --latency 0.05
+    python dawa_batch.py members.csv out.csv --base-url http://127.0.0.1:8765
+
+    #record real responses once, then replay them with errors and throttling
+    python benchmarks/dawa_server.py --record members.csv data/dawa_recording.jsonl
+    python benchmarks/dawa_server.py --replay data/dawa_recording.jsonl --error-rate 0.01 --throttle-rate 0.02
+
+Answers /datavask/adgangsadresser with a synthetic match whose href points
+back to this server, /adgangsadresser/<id> with synthetic coordinates and
+/adgangsadresser?struktur=mini&id=a|b|c with the bulk form of the same.
+With a recording loaded, requests it contains get the recorded status and
+body instead (hrefs rewritten to this server), everything else stays
+synthetic and is counted in server.replay_misses.
+
+The number of requests served is kept in server.request_count. With
+max_rps set, requests above that rate get a 429 with a Retry-After header.
+error_rate and throttle_rate answer that share of requests with a 500 or a
+429 at random (seeded, so runs are repeatable), latency + up to jitter
+seconds is added to every response.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qsl, parse_qs, urlencode
+
+import requests
+
+
+DAWA_URL = "https://api.dataforsyningen.dk"
+
+
+def fake_address(text):
+    #deterministic fake address so repeated runs give the same output
+    key = zlib.crc32(text.encode("utf-8"))
+    return {
+        "id": "{:08x}-0000-0000-0000-000000000000".format(key),
+        "vejnavn": text.split(",")[0].strip() or "Ukendt vej",
+        "husnr": str(key % 200 + 1),
+        "supplerendebynavn": None,
+        "postnr": str(1000 + key % 1500),
+        "postnrnavn": "København",
+        "x": 12.45 + (key % 10000) / 50000,
+        "y": 55.60 + (key // 10000 % 10000) / 50000,
+    }
+
+
+def request_key(url):
+    """Path and sorted, decoded query of a request url, the same however the client encoded it."""
+    url = urlparse(url)
+    return url.path + "?" + urlencode(sorted(parse_qsl(url.query, keep_blank_values=True)))
+
+
+def load_recording(path):
+    """request_key -> (status, body text, base url the body's hrefs point to) from a recording file."""
+    recording = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                recording[entry["key"]] = (entry["status"], json.dumps(entry["body"]), entry["base_url"])
+    return recording
+
+
+def record(addresses, path, base_url=DAWA_URL, session=None):
+    """Fetch the datavask match and coordinate lookup of every address from base_url and append them to path.
+
+    One json line per response: {"key", "status", "body", "base_url"}.
+    """
+    http = session or requests.Session()
+    written = 0
+    with open(path, "a", encoding="utf-8") as f:
+        def save(response):
+            entry = {"key": request_key(response.request.path_url), "status": response.status_code,
+                     "body": response.json(), "base_url": base_url}
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+        for address in addresses:
+            r = http.get(base_url + "/datavask/adgangsadresser", params={"betegnelse": address})
+            save(r)
+            written += 1
+            try:
+                href = r.json()["resultater"][0]["adresse"]["href"]
+            except (KeyError, IndexError, TypeError, ValueError):
+                continue
+            save(http.get(href))
+            written += 1
+    return written
+
+
+class DawaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    latency = 0.0
+    jitter = 0.0
+    max_rps = None
+    error_rate = 0.0
+    throttle_rate = 0.0
+    recording = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_body(self, body, status=200, headers=()):
+        body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, payload, status=200):
+        self._send_body(json.dumps(payload), status)
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.request_count += 1
+
+            #one second fixed window rate limit, like a typical api gateway
+            now = int(time.time())
+            if now != self.server.window:
+                self.server.window, self.server.window_count = now, 0
+            self.server.window_count += 1
+            throttled = self.max_rps is not None and self.server.window_count > self.max_rps
+
+            #injected faults, drawn under the lock so a seeded run is repeatable for a fixed request order
+            draw = self.server.random.random()
+            throttled = throttled or draw < self.throttle_rate
+            failed = not throttled and draw < self.throttle_rate + self.error_rate
+            delay = self.latency + self.server.random.random() * self.jitter
+
+        if throttled:
+            self.server.throttled += 1
+            self._send_body('{"type": "TooManyRequests"}', 429, [("Retry-After", "1")])
+            return
+
+        if delay:
+            time.sleep(delay)
+
+        if failed:
+            self.server.errors += 1
+            self._send_json({"type": "InternalServerError"}, status=500)
+            return
+
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        host = "http://{}:{}".format(*self.server.server_address[:2])
+
+        if self.recording is not None:
+            recorded = self.recording.get(request_key(self.path))
+            if recorded is not None:
+                status, body, base_url = recorded
+                self._send_body(body.replace(base_url, host), status)
+                return
+            self.server.replay_misses += 1
+
+        if url.path == "/datavask/adgangsadresser":
+            address = fake_address(query.get("betegnelse", [""])[0])
+            address["href"] = host + "/adgangsadresser/" + address["id"]
+            self._send_json({"kategori": "A", "resultater": [{"adresse": address}]})
+
+        elif url.path.startswith("/adgangsadresser/"):
+            self._send_json({"id": url.path.rsplit("/", 1)[-1], "adgangspunkt": {"koordinater": [12.55, 55.67]}})
+
+        elif url.path == "/adgangsadresser":
+            ids = query.get("id", [""])[0].split("|")
+            self._send_json([{"id": i, "x": 12.55, "y": 55.67} for i in ids if i])
+
+        else:
+            self._send_json({"type": "ResourceNotFoundError"}, status=404)
+
+
+def start_server(port=0, latency=0.0, max_rps=None, handler=DawaHandler, jitter=0.0, error_rate=0.0,
+                 throttle_rate=0.0, recording=None, seed=0):
+    """Start the stand-in server in a daemon thread, returns (server, base_url).
+
+    recording is a load_recording dict or the path of a recording file.
+    """
+    if isinstance(recording, str):
+        recording = load_recording(recording)
+    handler = type("ConfiguredDawaHandler", (handler,), {
+        "latency": latency, "jitter": jitter, "max_rps": max_rps,
+        "error_rate": error_rate, "throttle_rate": throttle_rate, "recording": recording,
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.random = random.Random(seed)
+    server.request_count = 0
+    server.throttled = 0
+    server.errors = 0
+    server.replay_misses = 0
+    server.window, server.window_count = 0, 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://127.0.0.1:{}".format(server.server_address[1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in for the DAWA api")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many seconds added at random")
+    parser.add_argument("--max-rps", type=int, default=None, help="answer 429 above this many requests/sec")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with a 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of requests answered with a 429")
+    parser.add_argument("--replay", default=None, help="recording file to answer from")
+    parser.add_argument("--record", nargs=2, metavar=("MEMBERS", "RECORDING"), default=None,
+                        help="record the real api's answers for a ';' separated member file and exit")
+    args = parser.parse_args(argv)
+
+    if args.record:
+        with open(args.record[0], "r", encoding="utf-8") as f:
+            addresses = [line.strip().replace("\ufeff", "").split(";")[1] for line in f if ";" in line]
+        print("recorded", record(addresses, args.record[1]), "responses to", args.record[1])
+        return
+
+    server, url = start_server(args.port, args.latency, args.max_rps, jitter=args.jitter, error_rate=args.error_rate,
+                               throttle_rate=args.throttle_rate, recording=args.replay)
+    print("serving DAWA stand-in on", url)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Notebook's intersects loop vs density_score's prepared, vectorized intersects_xy.
+
+Usage (from the repo root):
+    python benchmarks/density_scoring.py --rows 5000 100000 1000000
+
+Uses data/kde_levels.geojson when it exists, otherwise five concentric
+contour bands around central Copenhagen with seaborn-like vertex counts.
+The loop is timed on at most --loop-rows points and extrapolated.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+import geopandas as gpd
+import numpy as np
+
+from shapely.geometry import MultiPolygon, Point
+
+from density_score import density_score
+from synthetic import synthetic_sales
+
+
+def synthetic_levels():
+    center = Point(12.56, 55.68)
+    levels = [0.95, 0.8, 0.6, 0.4, 0.2]
+    radii = [0.004, 0.01, 0.02, 0.04, 0.06, 0.1]
+    geometry = [MultiPolygon([center.buffer(radii[0], quad_segs=500)])]
+    for i in range(1, len(levels)):
+        geometry.append(MultiPolygon([center.buffer(radii[i], quad_segs=500).difference(center.buffer(radii[i - 1], quad_segs=500))]))
+    return gpd.GeoDataFrame({'level': levels}, geometry=geometry, crs='EPSG:4326')
+
+
+def intersects_loop(points, geo):
+    """The loop analysis.ipynb used, levels sorted descending."""
+    levels = geo['level'].tolist()
+    geometry = geo.geometry.tolist()
+    score = []
+    for a in points:
+        for idx, level in enumerate(geometry):
+            found = False
+            if a.intersects(level):
+                score.append(levels[idx])
+                found = True
+                break
+        if not found:
+            score.append(0)
+    return score
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[5000, 100000, 1000000])
+    parser.add_argument("--loop-rows", type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    path = os.path.join(REPO, "data", "kde_levels.geojson")
+    geo = gpd.read_file(path) if os.path.exists(path) else synthetic_levels()
+    geo = geo.sort_values('level', ascending=False).reset_index(drop=True)
+
+    for rows in args.rows:
+        gdf = synthetic_sales(rows)
+
+        start = time.perf_counter()
+        vectorized = density_score(gdf['lng'], gdf['lat'], geo)
+        vectorized_time = time.perf_counter() - start
+
+        n = min(rows, args.loop_rows)
+        start = time.perf_counter()
+        loop = intersects_loop(gdf.geometry.values[:n], geo)
+        loop_time = (time.perf_counter() - start) * rows / n
+
+        assert np.array_equal(vectorized[:n], np.asarray(loop, dtype=np.float64))
+        print("{:>8} rows: loop {:8.2f}s{}, vectorized {:6.2f}s ({:.0f}x)".format(
+            rows, loop_time, " (extrapolated)" if n < rows else "", vectorized_time, loop_time / vectorized_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Rows/sec of geocode_batch against the local DAWA stand-in.
+
+Usage (from the repo root):
+    python benchmarks/geocode_throughput.py --rows 2000 --latency 0.02 --concurrency 1 8 32
+
+Every concurrency level is run with the per-address coordinate lookup and
+with bulk id lookups, and reports the requests sent per address. --max-rps
+makes the stand-in throttle with 429s, to see how the adaptive rate limiter
+settles; --rate is the limiter's starting rate.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dawa_scrape_prod
+from dawa_batch import geocode_batch
+from rate_limit import RetryScheduler, TokenBucket
+from dawa_server import start_server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--max-rps", type=int, default=None)
+    parser.add_argument("--rate", type=float, default=1000.0)
+    args = parser.parse_args(argv)
+
+    server, url = start_server(latency=args.latency, max_rps=args.max_rps)
+    dawa_scrape_prod.DAWA_URL = url
+
+    addresses = ["Testvej {}, 2300 København S".format(i) for i in range(args.rows)]
+
+    for concurrency in args.concurrency:
+        for bulk in (False, True):
+            server.request_count = 0
+            server.throttled = 0
+            dawa_scrape_prod.SCHEDULER = RetryScheduler(TokenBucket(rate=args.rate, max_rate=max(args.rate, 2000.0)), base_delay=0.1)
+            start = time.perf_counter()
+            rows = sum(1 for _ in geocode_batch(addresses, concurrency=concurrency, bulk=bulk))
+            elapsed = time.perf_counter() - start
+            stats = dawa_scrape_prod.SCHEDULER.stats()
+            print("concurrency {:>3} {:<6}: {:>6} rows in {:6.2f}s  {:8.1f} rows/sec  {:.2f} requests/address  {} retries  {} throttles  final rate {:.0f}/s".format(
+                concurrency, "bulk" if bulk else "single", rows, elapsed, rows / elapsed, server.request_count / rows,
+                stats["retries"], stats["throttles"], stats["rate"]))
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
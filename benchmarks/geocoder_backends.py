@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Latency and rows/sec of every geocoder backend at several concurrency levels.
+
+Usage (from the repo root):
+    python benchmarks/geocoder_backends.py --rows 2000 --latency 0.02 --jitter 0.02 --concurrency 1 8 32
+    python benchmarks/geocoder_backends.py --replay data/dawa_recording.jsonl --error-rate 0.01 --throttle-rate 0.02
+
+The addresses come from a synthetic DAWA dump, so the offline backend has
+an index to find them in, and every backend geocodes the same list through
+dawa_batch.geocode_batch:
+
+- remote: RemoteGeocoder against the local stand-in (benchmarks/dawa_server.py)
+- cached cold / cached warm: the same behind an in-memory GeocodeCache, on
+  its first and on a second pass
+- offline: OfflineGeocoder on the index built from the dump
+
+Per run it prints p50/p95 of the per-address geocode call, rows/sec, the
+share of rows with coordinates and the 500s and 429s the stand-in sent.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import dawa_scrape_prod
+from dawa_batch import geocode_batch
+from geocode_cache import GeocodeCache
+from geocoders import RemoteGeocoder, CachedGeocoder, OfflineGeocoder
+from offline_index import build_index, DUMP_COLUMNS
+from rate_limit import RetryScheduler, TokenBucket
+from dawa_server import start_server
+from offline_lookup import synthetic_dump
+
+
+class TimedGeocoder:
+    """Records the duration of every geocode call of the wrapped backend."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.durations = []
+
+    def geocode(self, address, session=None):
+        start = time.perf_counter()
+        try:
+            return self.backend.geocode(address, session=session)
+        finally:
+            #list.append is atomic, the worker threads can share the list
+            self.durations.append(time.perf_counter() - start)
+
+
+def run(label, backend, addresses, concurrency, server):
+    server.request_count = server.throttled = server.errors = 0
+    timed = TimedGeocoder(backend)
+
+    start = time.perf_counter()
+    results = [result for _, result in geocode_batch(addresses, concurrency=concurrency, backend=timed)]
+    elapsed = time.perf_counter() - start
+
+    p50, p95 = np.percentile(timed.durations, [50, 95]) * 1000
+    matched = sum(result[2] is not None for result in results) / len(results)
+    print("{:<12} concurrency {:>3}: p50 {:8.2f}ms  p95 {:8.2f}ms  {:9.1f} rows/sec  {:6.1%} matched  {:>4} 500s  {:>4} 429s".format(
+        label, concurrency, p50, p95, len(results) / elapsed, matched, server.errors, server.throttled))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--addresses", type=int, default=100000, help="size of the synthetic dump behind the offline index")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--replay", default=None, help="recording for the stand-in, see dawa_server.py --record")
+    args = parser.parse_args(argv)
+
+    server, url = start_server(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                               throttle_rate=args.throttle_rate, recording=args.replay)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dump = os.path.join(tmp, "dump.csv")
+        df = synthetic_dump(args.addresses, dump)
+        build_index(dump, os.path.join(tmp, "index"))
+        offline = OfflineGeocoder(os.path.join(tmp, "index"))
+
+        sample = df.sample(args.rows, random_state=1)
+        addresses = ["{} {}, {} {}".format(street, husnr, postnr, name) for street, husnr, postnr, name in zip(
+            sample[DUMP_COLUMNS["vejnavn"]], sample[DUMP_COLUMNS["husnr"]], sample[DUMP_COLUMNS["postnr"]], sample[DUMP_COLUMNS["postnrnavn"]])]
+
+        for concurrency in args.concurrency:
+            #fresh limiter per run, so one run's throttling does not slow the next
+            dawa_scrape_prod.SCHEDULER = RetryScheduler(TokenBucket(rate=1000.0, max_rate=2000.0), base_delay=0.1)
+
+            remote = RemoteGeocoder(url)
+            run("remote", remote, addresses, concurrency, server)
+
+            cached = CachedGeocoder(remote, GeocodeCache(":memory:"))
+            run("cached cold", cached, addresses, concurrency, server)
+            run("cached warm", cached, addresses, concurrency, server)
+            cached.cache.close()
+
+            run("offline", offline, addresses, concurrency, server)
+
+    if args.replay:
+        print("{} requests were not in the recording".format(server.replay_misses))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Cold-start cost of the app: `python -X importtime` of app.py and its first run.
+
+Usage (from the repo root):
+    python benchmarks/import_time.py --repeat 5 --top 15
+    python benchmarks/import_time.py --target app dawa_scrape_prod leafmap.colormaps --first-run
+
+Every measurement runs in a fresh interpreter. For each target it prints
+the median wall time of the import and, from the -X importtime report of
+the median run, the modules it pulls in directly with their cumulative
+time, slowest first. --first-run adds the time a new worker needs to
+import streamlit's AppTest, run app.py once and render the Home page
+(including whatever data that first page loads).
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+IMPORT = """
+import json, sys, time
+sys.path.insert(0, {repo!r})
+start = time.perf_counter()
+import {target}
+print(json.dumps({{"seconds": time.perf_counter() - start}}))
+"""
+
+FIRST_RUN = """
+import json, sys, time
+sys.path.insert(0, {repo!r})
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({app!r}, default_timeout=600)
+at.run()
+print(json.dumps({{"seconds": time.perf_counter() - start, "exception": bool(at.exception)}}))
+"""
+
+
+def parse_importtime(stderr):
+    """[(module, depth, self seconds, cumulative seconds)] from a -X importtime report, in report order."""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        modules.append((name.strip(), depth, int(self_us) / 1e6, int(cumulative_us) / 1e6))
+    return modules
+
+
+def run_python(code, importtime=False):
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    result = subprocess.run(command, cwd=REPO, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--target", nargs="+", default=["app"], help="modules to import")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="direct imports listed per target")
+    parser.add_argument("--first-run", action="store_true", help="also time a fresh AppTest run of app.py")
+    args = parser.parse_args(argv)
+
+    for target in args.target:
+        runs = sorted((run_python(IMPORT.format(repo=REPO, target=target), importtime=True) for _ in range(args.repeat)),
+                      key=lambda run: run[0]["seconds"])
+        result, stderr = runs[len(runs) // 2]
+        modules = parse_importtime(stderr)
+
+        print("import {}: median {:.3f}s (min {:.3f}s, max {:.3f}s), {} modules".format(
+            target, result["seconds"], runs[0][0]["seconds"], runs[-1][0]["seconds"], len(modules)))
+
+        #modules imported directly by the target (one level below it), slowest first
+        top_depth = min(depth for _, depth, _, _ in modules)
+        direct = [m for m in modules if m[1] == top_depth + 1] or [m for m in modules if m[1] == top_depth]
+        for name, _, self_seconds, cumulative in sorted(direct, key=lambda m: -m[3])[:args.top]:
+            print("    {:<40} {:8.3f}s cumulative {:8.3f}s self".format(name, cumulative, self_seconds))
+
+    if args.first_run:
+        seconds = []
+        for _ in range(args.repeat):
+            result, _ = run_python(FIRST_RUN.format(repo=REPO, app=os.path.join(REPO, "app.py")))
+            if result["exception"]:
+                print("first run raised an exception")
+            seconds.append(result["seconds"])
+        print("first run of app.py (worker spin-up + Home page): median {:.3f}s (min {:.3f}s, max {:.3f}s)".format(
+            statistics.median(seconds), min(seconds), max(seconds)))
+
+
+if __name__ == '__main__':
+    main()
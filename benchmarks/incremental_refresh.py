@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Refresh after appending new sales: full reload vs reading only the new partitions.
+
+Usage (from the repo root):
+    python benchmarks/incremental_refresh.py --rows 100000 1000000 --delta 1000
+
+"full" is what a refresh used to cost: read the whole dataset and derive
+the tooltip columns again. "refresh" is PartitionedSales.refresh() picking
+up the new manifest, "frame" reading the appended part file and
+concatenating the year partitions that get_data then returns.
+
+The second line is what the app derives from the new data: both region
+cubes plus the address table and neighbourhood index. "rebuild" builds
+them on the whole frame, "incremental" builds only the changed year's
+cubes and table through PartitionedSales.partitions and merges them with
+the unchanged ones (RegionCube.combine, PartitionedAddressTable); the
+neighbourhood index is rebuilt on the merged table either way.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from address_table import AddressTable, PartitionedAddressTable
+from compact import add_derived_columns
+from data_store import read_geo, sort_by_year
+from neighbourhood import NeighbourhoodIndex
+from partitions import PartitionedSales, append
+from region_cube import RegionCube
+from synthetic import synthetic_sales
+
+CUBE_KEYS = (['postal', 'kommune'], ['sognekode'])
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def rebuild(gdf):
+    cubes = [RegionCube(gdf, keys) for keys in CUBE_KEYS]
+    return cubes, NeighbourhoodIndex(AddressTable(gdf))
+
+
+def incremental(store, gdf):
+    #what get_region_cube and get_address_table do on a partitioned store
+    cubes = [RegionCube.combine(store.partitions(('region_cube', i), lambda frame: RegionCube(frame, keys)).values())
+             for i, keys in enumerate(CUBE_KEYS)]
+    table = PartitionedAddressTable(gdf, store.partitions('address_table', AddressTable).values())
+    return cubes, NeighbourhoodIndex(table)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--delta", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as tmp:
+            gdf = synthetic_sales(rows)
+            single = os.path.join(tmp, "sales.parquet")
+            gdf.to_parquet(single, compression="zstd", index=False)
+            root = os.path.join(tmp, "sales")
+            append(gdf, root)
+
+            store = PartitionedSales(root)
+            store.refresh()
+            incremental(store, store.frame())
+
+            delta = synthetic_sales(args.delta, seed=1)
+            delta['year'] = 2021
+            append(delta, root)
+
+            _, full = timed(lambda: add_derived_columns(sort_by_year(read_geo(single))))
+            changed, refresh = timed(store.refresh)
+            gdf, frame = timed(store.frame)
+            print("{:>8} rows + {} new: full reload {:6.2f}s, refresh {:6.3f}s (years {}) + frame {:6.3f}s".format(
+                rows, args.delta, full, refresh, changed, frame))
+
+            _, rebuilt = timed(rebuild, gdf)
+            _, updated = timed(incremental, store, gdf)
+            print("{:>8} rows + {} new: cubes + address table + neighbourhood index, rebuild {:6.2f}s, incremental {:6.2f}s".format(
+                rows, args.delta, rebuilt, updated))
+
+
+if __name__ == '__main__':
+    main()
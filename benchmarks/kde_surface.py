@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""scipy gaussian_kde on the kdeplot grid (what seaborn computes) vs density.kde_grid.
+
+Usage (from the repo root):
+    python benchmarks/kde_surface.py --rows 5000 100000 1000000
+
+gaussian_kde is evaluated on a random sample of --check-nodes grid nodes
+and its time extrapolated to the full grid; the error is the largest
+difference on those nodes relative to the peak density.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from scipy.stats import gaussian_kde
+
+from density import kde_grid, level_polygons
+from synthetic import synthetic_sales
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[5000, 100000, 1000000])
+    parser.add_argument("--gridsize", type=int, default=200)
+    parser.add_argument("--check-nodes", type=int, default=400)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    for rows in args.rows:
+        gdf = synthetic_sales(rows)
+        x, y = gdf['lng'].to_numpy(), gdf['lat'].to_numpy()
+
+        start = time.perf_counter()
+        surface = kde_grid(x, y, gridsize=args.gridsize)
+        grid_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        polygons = level_polygons(surface)
+        polygon_time = time.perf_counter() - start
+
+        iy = rng.integers(0, args.gridsize, args.check_nodes)
+        ix = rng.integers(0, args.gridsize, args.check_nodes)
+        start = time.perf_counter()
+        exact = gaussian_kde(np.vstack([x, y]))(np.vstack([surface.x[ix], surface.y[iy]]))
+        exact_time = (time.perf_counter() - start) * args.gridsize ** 2 / args.check_nodes
+
+        error = np.abs(surface.density[iy, ix] - exact).max() / surface.density.max()
+        print("{:>8} rows: gaussian_kde {:8.1f}s (extrapolated), kde_grid {:6.3f}s + {} bands {:6.3f}s, max error {:.2%}".format(
+            rows, exact_time, grid_time, len(polygons), polygon_time, error))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Latency of the Search page's neighbourhood query.
+
+Usage (from the repo root):
+    python benchmarks/neighbourhood_search.py --rows 5000 100000 1000000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from address_table import AddressTable
+from neighbourhood import NeighbourhoodIndex
+from synthetic import synthetic_sales
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[5000, 100000, 1000000])
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(1)
+    for rows in args.rows:
+        gdf = synthetic_sales(rows)
+
+        start = time.perf_counter()
+        index = NeighbourhoodIndex(AddressTable(gdf))
+        build = time.perf_counter() - start
+
+        points = np.column_stack([12.56 + rng.normal(0, 0.04, args.queries), 55.68 + rng.normal(0, 0.025, args.queries)])
+        timings = []
+        for lng, lat in points:
+            start = time.perf_counter()
+            index.query(lng, lat, min_addresses=5, min_apartments=50)
+            timings.append(time.perf_counter() - start)
+
+        print("{:>8} sales, {:>7} addresses: build {:6.2f}s, query p50 {:6.2f}ms p95 {:6.2f}ms".format(
+            rows, len(index), build, np.percentile(timings, 50) * 1000, np.percentile(timings, 95) * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Lookups/sec of the offline address index on a synthetic DAWA dump.
+
+Usage (from the repo root):
+    python benchmarks/offline_lookup.py --addresses 500000 --lookups 20000
+
+Also checks that exact inputs come back with the same name as
+json_best_match_name on the original record, and how many misspelled
+inputs still find the right address.
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from dawa_scrape_prod import json_best_match_name
+from offline_index import build_index, OfflineIndex, DUMP_COLUMNS
+
+
+WORDS = ["Kongens", "Nørre", "Vester", "Øster", "Amager", "Frederiks", "Christians", "Sankt", "Gammel", "Ny",
+         "Hans", "Tavsens", "Jagt", "Borg", "Strand", "Kirke", "Skole", "Mølle", "Park", "Enghave"]
+SUFFIXES = ["gade", "vej", "allé", "boulevard", "stræde", "plads", "torv", "brogade"]
+
+
+def synthetic_dump(n, path, seed=0):
+    rng = random.Random(seed)
+    streets = sorted({"{}{} {}".format(rng.choice(WORDS), rng.choice(["", "s"]), rng.choice(WORDS)) + rng.choice(SUFFIXES)
+                      for _ in range(n // 100)})
+    rows = []
+    for i in range(n):
+        postnr = rng.randint(1000, 2990)
+        rows.append({
+            DUMP_COLUMNS["id"]: "{:032x}".format(i),
+            DUMP_COLUMNS["vejnavn"]: rng.choice(streets),
+            DUMP_COLUMNS["husnr"]: str(rng.randint(1, 250)) + rng.choice(["", "", "", "A", "B"]),
+            DUMP_COLUMNS["supplerendebynavn"]: rng.choice(["", "", "", "Valby"]),
+            DUMP_COLUMNS["postnr"]: postnr,
+            DUMP_COLUMNS["postnrnavn"]: "København {}".format(postnr),
+            DUMP_COLUMNS["x"]: 12.4 + rng.random() * 0.3,
+            DUMP_COLUMNS["y"]: 55.6 + rng.random() * 0.15,
+        })
+    #duplicate (street, husnr, postnr) combinations are dropped, like the real register
+    df = pd.DataFrame(rows).drop_duplicates([DUMP_COLUMNS["vejnavn"], DUMP_COLUMNS["husnr"], DUMP_COLUMNS["postnr"]])
+    df.to_csv(path, index=False)
+    return df
+
+
+def misspell(text, rng):
+    i = rng.randrange(1, len(text) - 1)
+    return text[:i] + text[i+1:]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--addresses", type=int, default=200000)
+    parser.add_argument("--lookups", type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        dump = os.path.join(tmp, "dump.csv")
+        df = synthetic_dump(args.addresses, dump)
+
+        start = time.perf_counter()
+        build_index(dump, os.path.join(tmp, "index"))
+        print("built index of {} addresses in {:.1f}s".format(len(df), time.perf_counter() - start))
+
+        start = time.perf_counter()
+        index = OfflineIndex(os.path.join(tmp, "index"))
+        print("loaded index in {:.3f}s".format(time.perf_counter() - start))
+
+        sample = df.sample(args.lookups, random_state=1)
+        expected, exact, typos = [], [], []
+        for _, r in sample.iterrows():
+            record = {"resultater": [{"adresse": {
+                "vejnavn": r[DUMP_COLUMNS["vejnavn"]], "husnr": r[DUMP_COLUMNS["husnr"]],
+                "supplerendebynavn": r[DUMP_COLUMNS["supplerendebynavn"]] or None,
+                "postnr": str(r[DUMP_COLUMNS["postnr"]]), "postnrnavn": r[DUMP_COLUMNS["postnrnavn"]]}}]}
+            expected.append(json_best_match_name(record))
+            exact.append("{} {}, {} {}".format(r[DUMP_COLUMNS["vejnavn"]], r[DUMP_COLUMNS["husnr"]], r[DUMP_COLUMNS["postnr"]], r[DUMP_COLUMNS["postnrnavn"]]))
+            typos.append("{} {}, {}".format(misspell(r[DUMP_COLUMNS["vejnavn"]], rng), r[DUMP_COLUMNS["husnr"]], r[DUMP_COLUMNS["postnr"]]))
+
+        for label, queries in (("exact", exact), ("misspelled", typos)):
+            start = time.perf_counter()
+            results = [index.DAWA_data(q) for q in queries]
+            elapsed = time.perf_counter() - start
+            same = sum(r[0] == e for r, e in zip(results, expected))
+            print("{:<10}: {:8.0f} lookups/sec, {:.1%} same name as json_best_match_name, kategori {}".format(
+                label, len(queries) / elapsed, same / len(queries),
+                pd.Series([r[1] for r in results]).value_counts().to_dict()))
+
+
+if __name__ == '__main__':
+    main()
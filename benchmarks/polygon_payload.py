@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Deck JSON size and build time of the Postal Codes layer: GeoDataFrame vs PolygonLayer records.
+
+Usage (from the repo root):
+    python benchmarks/polygon_payload.py --plots 20
+
+Uses data/filtered_postnumre (and data/sogne when it exists) with random
+per-polygon medians; a "plot" builds the layer and the deck JSON the way
+st.pydeck_chart does.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pydeck as pdk
+
+from data_store import read_geo
+from polygon_layers import PolygonLayer, CITY_ZOOM
+
+
+#the app draws CITY_ZOOM, the others show how the payload scales with the tolerance
+ZOOMS = (9, CITY_ZOOM, 15)
+
+
+def deck_json(data):
+    layer = pdk.Layer("GeoJsonLayer", data, get_fill_color="[r, g, b]", get_elevation="median")
+    return pdk.Deck(layers=[layer], map_provider="carto").to_json()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--plots", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    for name in ("filtered_postnumre", "sogne"):
+        path = os.path.join(REPO, "data", name)
+        try:
+            polygons = read_geo(path)
+        except FileNotFoundError:
+            continue
+
+        rows = np.arange(len(polygons))
+        properties = pd.DataFrame({'median': rng.lognormal(10.5, 0.3, len(rows)), 'r': 1, 'g': 2, 'b': 3})
+
+        start = time.perf_counter()
+        for _ in range(args.plots):
+            old = deck_json(gpd.GeoDataFrame(properties, geometry=polygons.geometry.values, crs=polygons.crs))
+        old_time = (time.perf_counter() - start) / args.plots
+
+        vertices = int(polygons.geometry.count_coordinates().sum())
+        print("{:>20} {:>4} polygons  GeoDataFrame   {:7} vertices  {:8.0f} kB  {:6.1f} ms/plot".format(
+            name, len(polygons), vertices, len(old) / 1e3, old_time * 1000))
+
+        for zoom in ZOOMS:
+            start = time.perf_counter()
+            layer = PolygonLayer(polygons.geometry.values, zoom=zoom)
+            prepare = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for _ in range(args.plots):
+                new = deck_json(layer.records(rows, properties))
+            new_time = (time.perf_counter() - start) / args.plots
+            print("{:>20} {:>4} polygons  tier zoom {:>2}   {:7} vertices  {:8.0f} kB  {:6.1f} ms/plot  (prepared once in {:.0f} ms)".format(
+                name, len(polygons), zoom, layer.vertices, len(new) / 1e3, new_time * 1000, prepare * 1000))
+
+
+if __name__ == '__main__':
+    main()
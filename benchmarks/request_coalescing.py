@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Upstream lookups saved by address deduplication and single-flight coalescing.
+
+Usage (from the repo root):
+    python benchmarks/request_coalescing.py --rows 5000 --addresses 1000 --latency 0.02
+
+batch: a member list where popular addresses repeat (Zipf distributed,
+with case and whitespace variants) geocoded against the local DAWA
+stand-in with geocode_batch and with geocode_batch_dedup; prints rows/sec,
+requests the stand-in served and the dedup report.
+
+search: --sessions threads geocoding the same few addresses at the same
+time, through a plain RemoteGeocoder and through a CoalescingGeocoder.
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import dawa_scrape_prod
+from coalesce import CoalescingGeocoder, DedupReport
+from dawa_batch import geocode_batch, geocode_batch_dedup
+from geocoders import RemoteGeocoder
+from rate_limit import RetryScheduler, TokenBucket
+from dawa_server import start_server
+
+
+def member_addresses(rows, addresses, seed=0):
+    rng = np.random.default_rng(seed)
+    popular = np.minimum(rng.zipf(1.3, rows), addresses) - 1
+    spellings = ["Testvej {}, 2300 København S", "testvej {},  2300 København S", "TESTVEJ {}, 2300 KØBENHAVN S "]
+    return [spellings[rng.integers(len(spellings))].format(a) for a in popular]
+
+
+def run_batch(label, results, server):
+    server.request_count = 0
+    start = time.perf_counter()
+    rows = sum(1 for _ in results)
+    elapsed = time.perf_counter() - start
+    print("{:<6}: {:>6} rows in {:6.2f}s  {:8.1f} rows/sec  {:>6} requests".format(label, rows, elapsed, rows / elapsed, server.request_count))
+
+
+def run_search(label, geocoder, addresses, sessions, server):
+    server.request_count = 0
+    barrier = threading.Barrier(sessions)
+
+    def session(i):
+        barrier.wait()
+        geocoder.geocode(addresses[i % len(addresses)])
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(sessions)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    print("{:<10}: {} concurrent searches of {} addresses in {:.3f}s, {} requests".format(
+        label, sessions, len(addresses), elapsed, server.request_count))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--addresses", type=int, default=1000, help="distinct addresses in the member list")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--sessions", type=int, default=32, help="concurrent searches in the search run")
+    args = parser.parse_args(argv)
+
+    server, url = start_server(latency=args.latency)
+    dawa_scrape_prod.DAWA_URL = url
+    dawa_scrape_prod.SCHEDULER = RetryScheduler(TokenBucket(rate=1000.0, max_rate=2000.0), base_delay=0.1)
+
+    members = member_addresses(args.rows, args.addresses)
+    run_batch("plain", geocode_batch(members, concurrency=args.concurrency), server)
+    report = DedupReport()
+    run_batch("dedup", geocode_batch_dedup(members, report=report, concurrency=args.concurrency), server)
+    print("        " + str(report))
+
+    popular = ["Kongens Nytorv {}, 1050 København K".format(i) for i in range(1, 4)]
+    run_search("plain", RemoteGeocoder(), popular, args.sessions, server)
+    coalescing = CoalescingGeocoder(RemoteGeocoder())
+    run_search("coalescing", coalescing, popular, args.sessions, server)
+    print("            {}".format(coalescing.stats()))
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Memory a single Home or Search request allocates on top of the shared dataset.
+
+Usage (from the repo root):
+    python benchmarks/session_memory.py --rows 5000 100000 1000000
+
+"copy" is the old path: filter the GeoDataFrame by a year mask (a copy of
+every column including geometry) and .copy() the search result.
+"view" is the current path: slice the year-sorted column arrays and gather
+only the columns the layer needs. "held" is what the request keeps alive
+until the rerun ends, "peak" includes the temporaries of the grid
+aggregation (freed before the deck is built). Measured with tracemalloc,
+which sees numpy and pandas allocations.
+"""
+
+import argparse
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from address_table import AddressTable, street_address
+from data_store import sort_by_year, year_rows
+from lod import level_of_detail
+from neighbourhood import NeighbourhoodIndex
+from synthetic import synthetic_sales
+
+
+YEARS = (2012, 2019)
+ATTRIBUTE = 'adjusted_sqm_price'
+SEARCH_COLUMNS = ['lng', 'lat', ATTRIBUTE, 'tooltip_address']
+
+
+def home_copy(gdf):
+    #the filtered frame stayed alive for the rest of the rerun
+    gdf = gdf[(gdf['year'] >= YEARS[0]) & (gdf['year'] <= YEARS[1])]
+    cells, _ = level_of_detail(gdf['lng'].values, gdf['lat'].values, gdf[ATTRIBUTE].values)
+    return gdf, cells
+
+
+def home_view(gdf):
+    rows = year_rows(gdf['year'].values, *YEARS)
+    lng, lat, values = (gdf[c].iloc[rows].to_numpy() for c in ['lng', 'lat', ATTRIBUTE])
+    cells, _ = level_of_detail(lng, lat, values)
+    return cells
+
+
+def search_copy(index):
+    sales, _ = index.query(12.56, 55.68, min_addresses=5, min_apartments=50)
+    return sales.copy()
+
+
+def search_view(index):
+    sales, _ = index.query(12.56, 55.68, min_addresses=5, min_apartments=50, columns=SEARCH_COLUMNS)
+    return sales
+
+
+def measure(fn, *args):
+    """(MB still held by the result, peak MB during the call)."""
+    tracemalloc.start()
+    result = fn(*args)
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return held / 1e6, peak / 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[5000, 100000, 1000000])
+    args = parser.parse_args(argv)
+
+    for rows in args.rows:
+        gdf = sort_by_year(synthetic_sales(rows))
+        gdf['tooltip_address'] = street_address(gdf['address'].values)
+        index = NeighbourhoodIndex(AddressTable(gdf))
+
+        for name, fn, arg in [("home copy", home_copy, gdf), ("home view", home_view, gdf),
+                              ("search copy", search_copy, index), ("search view", search_view, index)]:
+            held, peak = measure(fn, arg)
+            print("{:>8} rows  {:<12} held {:7.2f} MB  peak {:7.2f} MB".format(rows, name, held, peak))
+
+
+if __name__ == '__main__':
+    main()
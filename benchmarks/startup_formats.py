@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Cold-start load time and peak memory of GeoJSON vs GeoParquet vs Feather.
+
+Usage (from the repo root):
+    python benchmarks/startup_formats.py --rows 5000 100000 1000000
+
+Uses data/final_geodataframe_v2.geojson for the "full" size when it exists,
+synthetic sales otherwise. Every load runs in a fresh interpreter so the
+numbers include the parse cost but not warm caches of a previous load
+(the geopandas import itself is not timed).
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+import geopandas as gpd
+
+from synthetic import synthetic_sales
+
+
+LOAD = """
+import json, sys, time
+sys.path.insert(0, {repo!r})
+from data_store import read_geo
+start = time.perf_counter()
+gdf = read_geo({path!r}, columns={columns!r})
+elapsed = time.perf_counter() - start
+#VmHWM is reset on exec, unlike ru_maxrss which keeps the parent's peak
+hwm = [l for l in open("/proc/self/status") if l.startswith("VmHWM")][0].split()[1]
+print(json.dumps({{"seconds": elapsed, "rows": len(gdf), "max_rss_mb": int(hwm) / 1024}}))
+"""
+
+
+def load_in_subprocess(path, columns=None):
+    out = subprocess.run([sys.executable, "-c", LOAD.format(repo=REPO, path=path, columns=columns)],
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[5000, 100000, 1000000])
+    args = parser.parse_args(argv)
+
+    real = os.path.join(REPO, "data", "final_geodataframe_v2.geojson")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            if os.path.exists(real) and rows == args.rows[len(args.rows) // 2]:
+                gdf = gpd.read_file(real)
+                label = "full ({})".format(len(gdf))
+            else:
+                gdf = synthetic_sales(rows)
+                label = str(rows)
+
+            base = os.path.join(tmp, "sales_{}".format(rows))
+            gdf.to_file(base + ".geojson", driver="GeoJSON")
+            gdf.to_parquet(base + ".parquet", compression="zstd", index=False)
+            gdf.to_feather(base + ".feather", compression="uncompressed")
+
+            results = []
+            for ext in (".geojson", ".parquet", ".feather"):
+                r = load_in_subprocess(base + ext)
+                results.append((ext, os.path.getsize(base + ext) / 1e6, r))
+            r = load_in_subprocess(base + ".parquet", columns=["lng", "lat", "year", "adjusted_sqm_price"])
+            results.append((".parquet (4 columns)", os.path.getsize(base + ".parquet") / 1e6, r))
+
+            for ext, size, r in results:
+                print("{:>14} {:<21} {:8.1f} MB  load {:7.2f}s  peak rss {:7.0f} MB".format(label, ext, size, r["seconds"], r["max_rss_mb"]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Synthetic sales GeoDataFrame with the columns of final_geodataframe_v2.geojson.
+
+Used by the benchmarks so they run without the real dataset.
+"""
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+
+
+def synthetic_sales(n, n_addresses=None, seed=0):
+    rng = np.random.default_rng(seed)
+    n_addresses = n_addresses or max(1, n // 8)
+
+    #addresses clustered around central Copenhagen
+    addr_lng = 12.56 + rng.normal(0, 0.04, n_addresses)
+    addr_lat = 55.68 + rng.normal(0, 0.025, n_addresses)
+    postal = rng.integers(1000, 2900, n_addresses)
+    sognekode = rng.integers(7000, 7100, n_addresses)
+
+    a = rng.integers(0, n_addresses, n)
+    year = rng.integers(2010, 2022, n)
+    price = rng.lognormal(10.5, 0.3, n) * (1 + (year - 2010) * 0.05)
+
+    df = pd.DataFrame({
+        'address': ['Testvej {}, {}. tv'.format(i, f) for i, f in zip(a, rng.integers(1, 6, n))],
+        'city': 'København',
+        'postal': postal[a],
+        'kommune': np.where(postal[a] < 2000, 'København', 'Frederiksberg'),
+        'sognekode': sognekode[a],
+        'year': year,
+        'lng': addr_lng[a],
+        'lat': addr_lat[a],
+        'square_meters_price': price * 0.95,
+        'adjusted_sqm_price': price,
+    })
+    return gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(df['lng'], df['lat']), crs='EPSG:4326')
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Address deduplication and single-flight lookups in front of the geocoder.
+
+Two ways the same address ends up geocoded more than once:
+
+- a member file lists many members at one address; deduplicate() looks up
+  every normalized address (geocode_cache.normalize_address) once per
+  batch and fans the result out to every row, in input order
+- several sessions search the same address at the same time;
+  CoalescingGeocoder wraps any geocoders backend so concurrent geocode()
+  calls for one normalized address share a single upstream call
+
+    backend = CoalescingGeocoder(CachedGeocoder(RemoteGeocoder(), cache))
+    report = DedupReport()
+    for address, result in deduplicate(addresses, lookup, report=report):
+        ...
+    print(report)   #rows, unique addresses, dedup ratio, upstream calls saved
+"""
+
+import threading
+
+from geocode_cache import normalize_address
+
+
+#addresses read ahead and deduplicated together
+DEDUP_BATCH = 10000
+
+
+class DedupReport:
+
+    def __init__(self):
+        self.rows = 0
+        self.unique = 0
+
+    @property
+    def ratio(self):
+        """Rows per upstream lookup."""
+        return self.rows / self.unique if self.unique else 1.0
+
+    @property
+    def saved(self):
+        return self.rows - self.unique
+
+    def __str__(self):
+        return "{} rows, {} unique addresses, dedup ratio {:.2f}, {} upstream lookups saved ({:.1%})".format(
+            self.rows, self.unique, self.ratio, self.saved, self.saved / self.rows if self.rows else 0)
+
+
+def _batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def deduplicate(addresses, lookup, batch_size=DEDUP_BATCH, report=None):
+    """Yield (address, result) for every address in input order, calling lookup once per normalized address and batch.
+
+    lookup(list of addresses) returns their results in the same order. The
+    first spelling of an address in the batch is the one looked up.
+    """
+    for batch in _batches(addresses, batch_size):
+        keys = [normalize_address(address) for address in batch]
+        first = {}
+        for address, key in zip(batch, keys):
+            first.setdefault(key, address)
+
+        results = dict(zip(first, lookup(list(first.values()))))
+        if report is not None:
+            report.rows += len(batch)
+            report.unique += len(first)
+
+        for address, key in zip(batch, keys):
+            yield address, results[key]
+
+
+class _Call:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Concurrent do(key, ...) calls for the same key run fn once and all get its result."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        """(fn(*args, **kwargs), shared), shared is True when the result came from another caller's call."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except Exception as error:
+            call.error = error
+            raise
+        finally:
+            #later callers start a new call, only the ones already waiting share this one
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+
+class CoalescingGeocoder:
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.flight = SingleFlight()
+        self.requests = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+
+    def geocode(self, address, session=None):
+        result, shared = self.flight.do(normalize_address(address), self.backend.geocode, address, session=session)
+        with self._lock:
+            self.requests += 1
+            self.coalesced += shared
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {"requests": self.requests, "coalesced": self.coalesced, "upstream": self.requests - self.coalesced}
+
+    def __repr__(self):
+        return "CoalescingGeocoder({!r})".format(self.backend)
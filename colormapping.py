@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Vectorized value -> color mapping shared by all map layers.
+
+Values are min-max scaled, binned into N_COLORS bins (bin i covers the
+values that round to i/(N_COLORS-1), like custom_round did row by row) and
+looked up in a (N_COLORS, 3) uint8 palette array. The colors end up in
+uint8 r, g, b columns that layers read with get_fill_color=FILL_COLOR.
+
+The palettes are the matplotlib colormaps leafmap offers. Their names and
+N_COLORS colors are precomputed into PALETTES_PATH with
+
+    python colormapping.py
+
+so the app lists and maps palettes without importing matplotlib or leafmap
+(leafmap.colormaps alone takes seconds to import). Without the file they
+are computed from matplotlib on first use.
+"""
+
+import argparse
+import functools
+import json
+
+import numpy as np
+
+
+N_COLORS = 21
+
+#deck.gl accessor for the r, g, b columns added by add_color_columns
+FILL_COLOR = "[r, g, b]"
+
+#palette name -> N_COLORS hex colors
+PALETTES_PATH = "data/palettes.json"
+
+
+def _colormap_hex(cmap, n):
+    #what leafmap.colormaps.get_palette(name, n) returns: hex without '#' at i / (n - 1)
+    import matplotlib.colors
+    return [matplotlib.colors.rgb2hex(cmap(i / (n - 1)))[1:] for i in range(n)]
+
+
+def compute_palettes(n=N_COLORS):
+    """{name: n hex colors} of every colormap in leafmap's list_colormaps(), in its (sorted) order."""
+    import matplotlib
+    return {name: _colormap_hex(matplotlib.colormaps[name], n) for name in sorted(matplotlib.colormaps())}
+
+
+@functools.lru_cache(maxsize=None)
+def _palettes(path=PALETTES_PATH):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return compute_palettes()
+
+
+def palette_names():
+    """Names of the available palettes, as leafmap.colormaps.list_colormaps() lists them."""
+    return list(_palettes())
+
+
+def _hex_to_rgb(value):
+    return [int(value[i:i + 2], 16) for i in (0, 2, 4)]
+
+
+def palette_array(palette, n=N_COLORS):
+    """(n, 3) uint8 array of a leafmap palette."""
+    colors = _palettes().get(palette) if n == N_COLORS else None
+    if colors is None:
+        import matplotlib
+        colors = _colormap_hex(matplotlib.colormaps[palette], n)
+    return np.array([_hex_to_rgb(c) for c in colors], dtype=np.uint8)
+
+
+def color_bins(values, n=N_COLORS):
+    """Bin index 0..n-1 of every value after min-max scaling, NaN and constant input give bin 0."""
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return np.zeros(0, dtype=np.intp)
+
+    low, high = np.nanmin(values), np.nanmax(values)
+    if not high > low:
+        return np.zeros(len(values), dtype=np.intp)
+
+    scaled = (values - low) / (high - low)
+    return np.nan_to_num(np.rint(scaled * (n - 1)), nan=0).astype(np.intp)
+
+
+def color_array(values, palette_rgb):
+    """(len(values), 3) contiguous uint8 colors for values."""
+    return palette_rgb[color_bins(values, len(palette_rgb))]
+
+
+def add_color_columns(df, values, palette_rgb):
+    """Add uint8 r, g, b columns for values to df (in place) and return it."""
+    rgb = color_array(values, palette_rgb)
+    df['r'] = rgb[:, 0]
+    df['g'] = rgb[:, 1]
+    df['b'] = rgb[:, 2]
+    return df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute the palette colors the app offers")
+    parser.add_argument("output", nargs="?", default=PALETTES_PATH)
+    path = parser.parse_args(argv).output
+
+    palettes = compute_palettes()
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(palettes, f, separators=(",", ":"))
+        f.write("\n")
+    print("{} palettes of {} colors to {}".format(len(palettes), N_COLORS, path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Compact in-memory layout of the sales data.
+
+The full GeoDataFrame keeps float64 prices and coordinates, the region
+keys as strings, a shapely Point per sale next to the lng/lat columns it
+duplicates, and two tooltip strings per sale. compact_sales() keeps the
+same rows and column names in a plain DataFrame with:
+
+- categorical postal, kommune, sognekode and city (a few hundred distinct values)
+- float32 lng/lat (~0.1 m at Copenhagen) and prices (~0.01 kr/m2)
+- int16 year
+- no geometry, points(df, rows) builds the Points of the rows that need them
+- no tooltip columns, tooltip_columns(table, rows) formats the rendered rows,
+  looking the addresses up in the AddressTable
+
+    python compact.py data/final_geodataframe_v2
+
+prints the bytes per sale of every column before and after.
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from address_table import street_address
+from data_store import read_geo
+
+
+CATEGORY_COLUMNS = ['postal', 'kommune', 'sognekode', 'city']
+FLOAT32_COLUMNS = ['lng', 'lat', 'square_meters_price', 'adjusted_sqm_price', 'kde_sales_density']
+INT16_COLUMNS = ['year']
+
+#rebuilt on demand by points() and tooltip_columns()
+DROPPED_COLUMNS = ['geometry', 'tooltip_price', 'tooltip_address']
+
+#memory of a Point outside the 8 byte pointer memory_usage sees (the GEOS geometry and
+#its shapely object), ~210 bytes of RSS per Point measured with shapely 2
+POINT_BYTES = 210
+
+
+def add_derived_columns(gdf):
+    """Per-row tooltip columns (in place), what get_data kept before tooltips were formatted per drawn row."""
+    #convert adjusted_sqm_price to thousand separated integer (string)
+    gdf['tooltip_price'] = gdf['adjusted_sqm_price'].astype(int).map('{:,.2f}'.format)
+
+    #strip apartment identifier and store just address for tooltip
+    gdf['tooltip_address'] = street_address(gdf['address'].values)
+    return gdf
+
+
+def compact_sales(gdf):
+    """Plain DataFrame of the sales with compact column types, see the module docstring."""
+    columns = {}
+    for name in gdf.columns:
+        if name in DROPPED_COLUMNS:
+            continue
+        column = gdf[name]
+        if name in CATEGORY_COLUMNS:
+            column = column.astype('category')
+        elif name in FLOAT32_COLUMNS:
+            column = column.astype(np.float32)
+        elif name in INT16_COLUMNS:
+            column = column.astype(np.int16)
+        columns[name] = column
+    return pd.DataFrame(columns)
+
+
+def points(df, rows=slice(None)):
+    """GeoSeries of the sales' Points at `rows`, built from lng/lat."""
+    import geopandas as gpd
+    import shapely
+
+    lng = df['lng'].iloc[rows].to_numpy(dtype=np.float64)
+    lat = df['lat'].iloc[rows].to_numpy(dtype=np.float64)
+    return gpd.GeoSeries(shapely.points(lng, lat), crs='EPSG:4326')
+
+
+def tooltip_prices(values, fmt='{:,.2f}'):
+    """Thousand separated integer part of the prices, as add_derived_columns wrote them."""
+    return np.array([fmt.format(v) for v in np.asarray(values).astype(np.int64)], dtype=object)
+
+
+def tooltip_columns(table, rows=slice(None)):
+    """tooltip_address and tooltip_price of the sales at `rows` of an AddressTable's frame."""
+    return {
+        'tooltip_address': table.address_of_rows(rows),
+        'tooltip_price': tooltip_prices(table.gdf['adjusted_sqm_price'].iloc[rows].to_numpy()),
+    }
+
+
+def bytes_per_sale(df):
+    """Series of memory per row of every column (deep, so strings and geometries count)."""
+    usage = df.memory_usage(deep=True, index=False)
+    if 'geometry' in df.columns:
+        usage['geometry'] += len(df) * POINT_BYTES
+    return usage / max(len(df), 1)
+
+
+def memory_report(before, after):
+    """DataFrame of bytes per sale per column before and after, with a total row."""
+    report = pd.concat({'before': bytes_per_sale(before), 'after': bytes_per_sale(after)}, axis=1, sort=False)
+    report.loc['total'] = report.sum()
+    return report.round(1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bytes per sale of the full and the compact sales frame")
+    parser.add_argument("source", help="dataset path, read with read_geo")
+    args = parser.parse_args(argv)
+
+    #what get_data held before the compact layout: the frame plus its tooltip columns
+    gdf = add_derived_columns(read_geo(args.source))
+    report = memory_report(gdf, compact_sales(gdf))
+    print("{} sales".format(len(gdf)))
+    print(report.fillna('-'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Comparable sales for many points at once, the Search page's analysis without the page.
+
+For every point: the nearest addresses until there are at least
+min_addresses of them and more than min_apartments sales on them (the same
+walk as neighbourhood.NeighbourhoodIndex), and the count, mean and median
+adjusted_sqm_price of those sales.
+
+Build the index once per dataset, then query a geocoded member file (the
+output of dawa_batch.py, member_code;...;lat;long with decimal commas):
+
+    python comparables.py build data/final_geodataframe_v2 data/comparables_index
+    python comparables.py query data/comparables_index "dimMember(v2)_output.csv" comparables.csv --processes 8
+
+The index is a directory of .npy arrays: address coordinates and apartment
+counts, and the prices of all sales sorted by address. Pool workers memory
+map them, so the price arrays are shared through the page cache instead of
+pickled to every process; each worker builds its own KD-tree over the
+mapped coordinates once, when it starts. Points go to the pool in chunks of
+chunk_size, results come back and are written in input order with at most
+a few chunks per worker in flight, so the input can be any size.
+"""
+
+import argparse
+import os
+import time
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from scipy.spatial import cKDTree
+
+from address_table import AddressTable
+from data_store import concat_ranges, read_geo
+from neighbourhood import nearest_addresses
+
+
+#points per task sent to a worker
+CHUNK_SIZE = 2000
+
+#metres per degree of latitude, the KD-tree distances are in degrees of latitude
+METRES_PER_DEGREE = 111320.0
+
+#index arrays, all 1d
+INDEX_ARRAYS = ['lng', 'lat', 'apartments', 'start', 'price']
+
+OUTPUT_HEADER = ["member_code","lat","long","addresses","apartments","radius_m","mean_sqm_price","median_sqm_price"]
+
+
+def build_index(table, index_dir):
+    """Write the arrays of an AddressTable's comparables index to index_dir, returns the number of addresses."""
+    os.makedirs(index_dir, exist_ok=True)
+
+    def save(name, array):
+        np.save(os.path.join(index_dir, name + ".npy"), np.ascontiguousarray(array))
+
+    save("lng", table.addresses['lng'].to_numpy(dtype=np.float64))
+    save("lat", table.addresses['lat'].to_numpy(dtype=np.float64))
+    save("apartments", table.addresses['apartments'].to_numpy(dtype=np.int64))
+    #prices of address a are price[start[a]:start[a+1]]
+    save("start", table.start.astype(np.int64))
+    save("price", table.gdf['adjusted_sqm_price'].to_numpy(dtype=np.float64)[table.row_order])
+    return len(table)
+
+
+class ComparablesIndex:
+
+    def __init__(self, index_dir, mmap=True):
+        mode = "r" if mmap else None
+        for name in INDEX_ARRAYS:
+            #plain ndarray view of the mapping, np.memmap slicing is slow
+            setattr(self, name, np.asarray(np.load(os.path.join(index_dir, name + ".npy"), mmap_mode=mode)))
+
+        #same scaling as NeighbourhoodIndex, so both pick the same addresses
+        self.lng_scale = np.cos(np.radians(self.lat.mean())) if len(self.lat) else 1.0
+        self.tree = cKDTree(np.column_stack([self.lng * self.lng_scale, self.lat]))
+
+    def __len__(self):
+        return len(self.apartments)
+
+    def _nearest_many(self, x, y, min_addresses, min_apartments):
+        """[address ids] and [distances] per point, one vectorized tree query for the points it satisfies."""
+        n = len(self)
+        k = min(n, max(min_addresses, 16))
+        distances, idx = self.tree.query(np.column_stack([x, y]), k=k)
+        distances, idx = distances.reshape(len(x), k), idx.reshape(len(x), k)
+
+        apartments = np.cumsum(self.apartments[idx], axis=1)
+        enough = (np.arange(1, k + 1) >= min_addresses) & (apartments > min_apartments)
+        found = enough.any(axis=1)
+        stops = np.where(found, np.argmax(enough, axis=1) + 1, k)
+
+        ids, dists = [], []
+        for i in range(len(x)):
+            if found[i] or k == n:
+                ids.append(idx[i, :stops[i]])
+                dists.append(distances[i, :stops[i]])
+            else:
+                #sparse areas need a wider search, same loop as the Search page
+                a, d = nearest_addresses(self.tree, self.apartments, x[i], y[i], min_addresses, min_apartments)
+                ids.append(a)
+                dists.append(d)
+        return ids, dists
+
+    def query(self, lng, lat, min_addresses=5, min_apartments=50):
+        """Dict of arrays with addresses, apartments, radius_m, mean and median per point.
+
+        Points without coordinates (nan) get 0 addresses and nan statistics.
+        """
+        lng = np.asarray(lng, dtype=np.float64)
+        lat = np.asarray(lat, dtype=np.float64)
+        m = len(lng)
+        result = {
+            'addresses': np.zeros(m, dtype=np.int64),
+            'apartments': np.zeros(m, dtype=np.int64),
+            'radius_m': np.full(m, np.nan),
+            'mean': np.full(m, np.nan),
+            'median': np.full(m, np.nan),
+        }
+
+        valid = np.flatnonzero(np.isfinite(lng) & np.isfinite(lat))
+        if len(valid) == 0 or len(self) == 0:
+            return result
+
+        ids, dists = self._nearest_many(lng[valid] * self.lng_scale, lat[valid], min_addresses, min_apartments)
+        for i, a, d in zip(valid, ids, dists):
+            #price rows of all sales on the addresses, one contiguous range per address
+            prices = self.price[concat_ranges(self.start[a], self.start[a + 1])]
+
+            result['addresses'][i] = len(a)
+            result['apartments'][i] = len(prices)
+            result['radius_m'][i] = d[-1] * METRES_PER_DEGREE
+            result['mean'][i] = prices.mean()
+            result['median'][i] = np.median(prices)
+        return result
+
+
+#the index of a pool worker, loaded once by _init_worker
+_index = None
+
+
+def _init_worker(index_dir):
+    global _index
+    _index = ComparablesIndex(index_dir)
+
+
+def _query_chunk(lng, lat, min_addresses, min_apartments):
+    return _index.query(lng, lat, min_addresses, min_apartments)
+
+
+def _chunks(points, size):
+    ids, lng, lat = [], [], []
+    for point_id, x, y in points:
+        ids.append(point_id)
+        lng.append(x)
+        lat.append(y)
+        if len(ids) >= size:
+            yield ids, np.array(lng, dtype=np.float64), np.array(lat, dtype=np.float64)
+            ids, lng, lat = [], [], []
+    if ids:
+        yield ids, np.array(lng, dtype=np.float64), np.array(lat, dtype=np.float64)
+
+
+def _rows(ids, lng, lat, result):
+    for i, point_id in enumerate(ids):
+        yield point_id, lng[i], lat[i], {name: values[i] for name, values in result.items()}
+
+
+def comparables(points, index_dir, processes=None, chunk_size=CHUNK_SIZE, min_addresses=5, min_apartments=50):
+    """Yield (id, lng, lat, stats) for an iterable of (id, lng, lat) points, in input order.
+
+    stats is a dict with addresses, apartments, radius_m, mean and median
+    (adjusted_sqm_price of the comparable sales). `processes` workers
+    (default os.cpu_count()) query chunks of chunk_size points; processes=1
+    queries in this process without a pool.
+    """
+    processes = processes or os.cpu_count() or 1
+
+    if processes == 1:
+        index = ComparablesIndex(index_dir)
+        for ids, lng, lat in _chunks(points, chunk_size):
+            yield from _rows(ids, lng, lat, index.query(lng, lat, min_addresses, min_apartments))
+        return
+
+    in_flight = deque()
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(index_dir,)) as pool:
+        for ids, lng, lat in _chunks(points, chunk_size):
+            in_flight.append((ids, lng, lat, pool.submit(_query_chunk, lng, lat, min_addresses, min_apartments)))
+
+            #wait for the oldest chunk once every worker has two queued, keeps input order and memory bounded
+            if len(in_flight) >= 2 * processes:
+                ids, lng, lat, future = in_flight.popleft()
+                yield from _rows(ids, lng, lat, future.result())
+
+        while in_flight:
+            ids, lng, lat, future = in_flight.popleft()
+            yield from _rows(ids, lng, lat, future.result())
+
+
+def read_points(path, id_column='member_code', chunk_size=CHUNK_SIZE):
+    """Yield (id, lng, lat) from a ';' separated file with lat/long columns and decimal commas (dawa_batch output)."""
+    reader = pd.read_csv(path, sep=';', decimal=',', usecols=[id_column, 'lat', 'long'],
+                         dtype={id_column: str}, chunksize=chunk_size, encoding='utf-8-sig')
+    for frame in reader:
+        lng = pd.to_numeric(frame['long'], errors='coerce').to_numpy()
+        lat = pd.to_numeric(frame['lat'], errors='coerce').to_numpy()
+        yield from zip(frame[id_column].to_numpy(), lng, lat)
+
+
+def _number(value, fmt):
+    return "" if np.isnan(value) else fmt.format(value).replace(".", ",")
+
+
+def format_output_row(point_id, lng, lat, stats):
+    return ";".join([str(point_id), _number(lat, "{}"), _number(lng, "{}"), str(stats['addresses']), str(stats['apartments']),
+                     _number(stats['radius_m'], "{:.0f}"), _number(stats['mean'], "{:.0f}"), _number(stats['median'], "{:.0f}")])+"\n"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Comparable sales for a file of geocoded points")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="build a comparables index from a sales dataset")
+    build.add_argument("source", help="sales dataset path, read with read_geo")
+    build.add_argument("index_dir")
+
+    query = commands.add_parser("query", help="comparables for every point of a geocoded member file")
+    query.add_argument("index_dir")
+    query.add_argument("input", help="';' separated file with member_code, lat and long columns, e.g. dawa_batch.py output")
+    query.add_argument("output", help="';' separated output file, overwritten")
+    query.add_argument("--id-column", default="member_code")
+    query.add_argument("--processes", type=int, default=None, help="worker processes, default one per cpu")
+    query.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    query.add_argument("--min-addresses", type=int, default=5)
+    query.add_argument("--min-apartments", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        start = time.perf_counter()
+        n = build_index(AddressTable(read_geo(args.source, columns=['lng', 'lat', 'address', 'year', 'adjusted_sqm_price'])), args.index_dir)
+        print("{} addresses in {:.1f}s".format(n, time.perf_counter() - start))
+        return
+
+    points = read_points(args.input, args.id_column, args.chunk_size)
+    results = comparables(points, args.index_dir, args.processes, args.chunk_size, args.min_addresses, args.min_apartments)
+
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        output_file.write(";".join(OUTPUT_HEADER)+"\n")
+
+        start = time.perf_counter()
+        rows = 0
+        for point_id, lng, lat, stats in results:
+            output_file.write(format_output_row(point_id, lng, lat, stats))
+            rows += 1
+            if rows % 10000 == 0:
+                elapsed = time.perf_counter() - start
+                print("{} rows, {:.1f} rows/sec".format(rows, rows / elapsed))
+
+        elapsed = time.perf_counter() - start
+        print("done: {} rows in {:.1f}s, {:.1f} rows/sec".format(rows, elapsed, rows / elapsed if elapsed else 0))
+
+
+if __name__ == '__main__':
+    main()
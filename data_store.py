@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Columnar copies of the GeoJSON datasets.
+
+Parsing GeoJSON text dominates the app's cold start, so the datasets can be
+converted once to GeoParquet (or Feather) with WKB geometry:
+
+    python data_store.py convert data/final_geodataframe_v2.geojson data/filtered_postnumre.geojson data/sogne.geojson
+    python data_store.py convert data/final_geodataframe_v2.geojson --format feather
+
+read_geo('data/sogne') then reads the columnar copy when there is one and
+falls back to the .geojson otherwise. A copy older than the .geojson next
+to it is skipped with a warning, so a regenerated GeoJSON is read until it
+is converted again.
+"""
+
+import argparse
+import json
+import os
+import time
+import warnings
+
+import numpy as np
+
+
+#tried in this order by read_geo
+FORMATS = ['.parquet', '.feather', '.geojson']
+
+
+def convert(geojson_path, fmt='parquet'):
+    """Write a columnar copy next to geojson_path, returns its path."""
+    import geopandas as gpd
+
+    gdf = gpd.read_file(geojson_path)
+    out = os.path.splitext(geojson_path)[0] + '.' + fmt
+    if fmt == 'parquet':
+        gdf.to_parquet(out, compression='zstd', index=False)
+    elif fmt == 'feather':
+        #uncompressed feather can be memory mapped without a decode step
+        gdf.to_feather(out, compression='uncompressed')
+    else:
+        raise ValueError("unknown format {}".format(fmt))
+    return out
+
+
+def read_geo(path, columns=None, memory_map=True):
+    """Read a dataset by path without extension, preferring the columnar copies that are not older than the .geojson.
+
+    columns projects the read down to the given columns (the geometry column
+    is always included), memory_map lets arrow map the file instead of
+    reading it into memory first.
+    """
+    #imported on first read, so the app starts without geopandas
+    import geopandas as gpd
+
+    base, ext = os.path.splitext(path)
+    if ext in FORMATS:
+        candidates, geojson = [path], None
+    else:
+        candidates, geojson = [base + fmt for fmt in FORMATS], base + '.geojson'
+
+    for candidate in candidates:
+        if not os.path.exists(candidate):
+            continue
+
+        #a stale copy of a regenerated GeoJSON, only when the caller didn't ask for this file
+        if geojson is not None and candidate != geojson and os.path.exists(geojson) and os.path.getmtime(candidate) < os.path.getmtime(geojson):
+            warnings.warn("{} is older than {}, reading the GeoJSON; run python data_store.py convert {} to refresh it".format(
+                candidate, geojson, geojson), UserWarning)
+            continue
+
+        if columns is not None and 'geometry' not in columns:
+            columns = list(columns) + ['geometry']
+
+        if candidate.endswith('.parquet'):
+            return gpd.read_parquet(candidate, columns=columns, memory_map=memory_map)
+        if candidate.endswith('.feather'):
+            return gpd.read_feather(candidate, columns=columns, memory_map=memory_map)
+
+        gdf = gpd.read_file(candidate)
+        return gdf[columns] if columns is not None else gdf
+
+    raise FileNotFoundError("no {} dataset found".format(path))
+
+
+def parish_name_column(sogne):
+    """Name of the parish name column of the sogne dataset, its third column."""
+    return sogne.columns[2]
+
+
+def write_json(path, obj, **kwargs):
+    """json.dump obj to path through a temp file and a rename, so a crash never leaves a half written file."""
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(obj, f, **kwargs)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+
+def sort_by_year(gdf):
+    """gdf sorted by year (stable) with a fresh RangeIndex, so year ranges are contiguous rows."""
+    return gdf.sort_values('year', kind='stable', ignore_index=True)
+
+
+def year_rows(years, year_from, year_to):
+    """Slice of the rows with year_from <= year <= year_to in a year-sorted `years` array.
+
+    gdf[col].iloc[rows] with it is a view of the column, not a copy.
+    """
+    lo = np.searchsorted(years, year_from, side='left')
+    hi = np.searchsorted(years, year_to, side='right')
+    return slice(int(lo), int(hi))
+
+
+def concat_ranges(lo, hi):
+    """np.concatenate([np.arange(l, h) for l, h in zip(lo, hi)]) without the python loop."""
+    lo, hi = np.asarray(lo, dtype=np.int64), np.asarray(hi, dtype=np.int64)
+    lengths = hi - lo
+    return np.repeat(lo - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert GeoJSON datasets to a columnar format")
+    sub = parser.add_subparsers(dest="command", required=True)
+    conv = sub.add_parser("convert")
+    conv.add_argument("paths", nargs="+")
+    conv.add_argument("--format", choices=["parquet", "feather"], default="parquet")
+    args = parser.parse_args(argv)
+
+    for path in args.paths:
+        start = time.perf_counter()
+        out = convert(path, args.format)
+        print("{} -> {} ({:.1f} MB -> {:.1f} MB) in {:.1f}s".format(
+            path, out, os.path.getsize(path) / 1e6, os.path.getsize(out) / 1e6, time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
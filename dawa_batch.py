@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Concurrent batch geocoding on top of DAWA_data.
+
+Usage:
+    python dawa_batch.py "dimMember(v2).csv" "dimMember(v2)_output.csv" --concurrency 16
+
+The input file is the ';' separated member file (member_code;address;...),
+the output file gets the same columns as the old line-by-line loop in
+dawa_scrape_prod.py.
+"""
+
+import argparse
+import threading
+import time
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import dawa_scrape_prod
+from dawa_scrape_prod import DAWA_data, search_address, extract_coordinates_bulk, json_best_match_name
+from geocode_cache import GeocodeCache
+from geocoders import BACKENDS, make_geocoder
+from coalesce import DEDUP_BATCH, DedupReport, deduplicate
+
+
+OUTPUT_HEADER = ["member_code","address","dawa_address","confidence","lat","long"]
+
+_local = threading.local()
+
+
+def _session():
+    #one keep-alive session per worker thread, requests.Session is not guaranteed thread safe
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=4)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _local.session = session
+    return session
+
+
+def _geocode_one(address, cache=None, backend=None):
+    try:
+        return DAWA_data(address, session=_session(), cache=cache, backend=backend)
+    except Exception:
+        #json_best_match_name fails on empty resultater etc.
+        return None, None, None, None
+
+
+def _search_one(address, cache=None):
+    #returns (cached result, None) on a cache hit and (None, datavask json) otherwise
+    if cache is not None:
+        cached = cache.get(address)
+        if cached is not None:
+            return cached, None
+    try:
+        return None, search_address(address, session=_session())
+    except Exception:
+        return None, None
+
+
+def _to_result(json, coordinates):
+    #same (dawa_name, confidence, lat, long) contract as DAWA_data
+    try:
+        confidence = json["kategori"]
+        dawa_name = json_best_match_name(json)
+    except Exception:
+        return None, None, None, None
+    long, lat = coordinates
+    return dawa_name, confidence, lat, long
+
+
+def _resolve_chunk(chunk, cache=None):
+    #wait for the searches of one chunk and resolve all coordinates in one bulk request
+    searched = [future.result() for _, future in chunk]
+    coordinates = extract_coordinates_bulk([json for _, json in searched], session=_session())
+
+    results = []
+    for (address, _), (cached, json), xy in zip(chunk, searched, coordinates):
+        if cached is not None:
+            results.append((address, cached))
+            continue
+        result = _to_result(json, xy)
+        if cache is not None:
+            cache.put(address, result)
+        results.append((address, result))
+    return results
+
+
+def _geocode_batch_bulk(addresses, concurrency, window, bulk_size, cache):
+    chunk = []
+    chunks = deque()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool, ThreadPoolExecutor(max_workers=2) as resolver:
+        for address in addresses:
+            chunk.append((address, pool.submit(_search_one, address, cache)))
+
+            if len(chunk) >= bulk_size:
+                chunks.append(resolver.submit(_resolve_chunk, chunk, cache))
+                chunk = []
+
+            #keep at most `window` addresses in flight
+            if len(chunks) * bulk_size >= window:
+                yield from chunks.popleft().result()
+
+        if chunk:
+            chunks.append(resolver.submit(_resolve_chunk, chunk, cache))
+        while chunks:
+            yield from chunks.popleft().result()
+
+
+def geocode_batch(addresses, concurrency=8, window=None, bulk=False, bulk_size=dawa_scrape_prod.BULK_SIZE, cache=None, backend=None):
+    """Geocode an iterable of addresses with a pool of `concurrency` threads.
+
+    Yields (address, (dawa_name, confidence, lat, long)) in input order. At most
+    `window` lookups (default 4 x concurrency) are in flight at once, so the
+    input can be a lazy iterator over a very large file.
+
+    With bulk=True the per-address follow-up request for the coordinates is
+    replaced by one /adgangsadresser?id=... request per `bulk_size` addresses,
+    which brings the number of requests per address from 2 down to ~1.
+
+    A geocode_cache.GeocodeCache makes reruns only hit the network for new addresses.
+    A geocoders backend replaces the DAWA lookups (and the cache) for every
+    address, bulk only applies to the default remote lookups.
+    """
+    window = window or concurrency * 4
+
+    if bulk and backend is None:
+        yield from _geocode_batch_bulk(addresses, concurrency, max(window, 2 * bulk_size), bulk_size, cache)
+        return
+
+    in_flight = deque()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for address in addresses:
+            in_flight.append((address, pool.submit(_geocode_one, address, cache, backend)))
+
+            #wait for the oldest lookup once the window is full to keep input order
+            if len(in_flight) >= window:
+                address, future = in_flight.popleft()
+                yield address, future.result()
+
+        while in_flight:
+            address, future = in_flight.popleft()
+            yield address, future.result()
+
+
+def geocode_batch_dedup(addresses, batch_size=DEDUP_BATCH, report=None, **kwargs):
+    """geocode_batch that looks up every normalized address once per batch of batch_size addresses.
+
+    Yields (address, result) for every input address in input order; pass a
+    coalesce.DedupReport to count rows and unique addresses.
+    """
+    def lookup(unique):
+        return [result for _, result in geocode_batch(unique, **kwargs)]
+
+    yield from deduplicate(addresses, lookup, batch_size, report)
+
+
+def read_member_file(input_file):
+    """Yield (member_code, address) from a ';' separated member file."""
+    for i, line in enumerate(input_file):
+        try:
+            member_code, address = line.strip().replace("\ufeff","").split(";")[:2]
+        except ValueError:
+            print("split ",i," failed")
+            continue
+        yield member_code, address
+
+
+def format_output_row(member_code, address, result):
+    dawa_address, confidence, lat, long = result
+    return ";".join([member_code,address,dawa_address,confidence,str(lat).replace(".",","),str(long).replace(".",",")])+"\n"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Geocode a member file against DAWA")
+    parser.add_argument("input", help="';' separated file with member_code;address")
+    parser.add_argument("output", help="output file, appended to")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--bulk", action="store_true", help="resolve coordinates with bulk id lookups")
+    parser.add_argument("--cache", default=None, help="sqlite geocode cache file, e.g. data/geocode_cache.sqlite")
+    parser.add_argument("--base-url", default=None, help="override the DAWA url, e.g. a local stand-in server")
+    parser.add_argument("--backend", choices=BACKENDS, default=None, help="geocode through a geocoders backend instead")
+    parser.add_argument("--index", default=None, help="offline address index directory, for --backend offline")
+    parser.add_argument("--dedup", action="store_true", help="geocode every normalized address once per batch")
+    args = parser.parse_args(argv)
+
+    if args.base_url:
+        dawa_scrape_prod.DAWA_URL = args.base_url.rstrip("/")
+
+    backend = make_geocoder(args.backend, args.base_url, args.index, args.cache) if args.backend else None
+    cache = GeocodeCache(args.cache) if args.cache and backend is None else None
+
+    with open(args.input, "r", encoding="utf-8") as input_file, open(args.output, "a", encoding="utf-8") as output_file:
+        if output_file.tell() == 0:
+            output_file.write(";".join(OUTPUT_HEADER)+"\n")
+
+        members = deque()
+
+        def addresses():
+            for member_code, address in read_member_file(input_file):
+                members.append(member_code)
+                yield address
+
+        options = dict(concurrency=args.concurrency, bulk=args.bulk, cache=cache, backend=backend)
+        report = DedupReport()
+        results = geocode_batch_dedup(addresses(), report=report, **options) if args.dedup else geocode_batch(addresses(), **options)
+
+        start = time.perf_counter()
+        rows = 0
+        for address, result in results:
+            member_code = members.popleft()
+            rows += 1
+            if result[2] and result[3]:
+                output_file.write(format_output_row(member_code, address, result))
+
+            if rows % 500 == 0:
+                elapsed = time.perf_counter() - start
+                print("{} rows, {:.1f} rows/sec".format(rows, rows / elapsed))
+
+        elapsed = time.perf_counter() - start
+        print("done: {} rows in {:.1f}s, {:.1f} rows/sec".format(rows, elapsed, rows / elapsed if elapsed else 0))
+        if args.dedup:
+            print(report)
+
+
+if __name__ == '__main__':
+    main()
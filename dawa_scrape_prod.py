@@ -6,55 +6,95 @@
 
 import requests
 import pandas as pd
-import time
 
 import re
 
+from instrumentation import traced
+from rate_limit import RetryScheduler, CircuitOpenError
+
+
+#base url of the DAWA api - can be pointed at a local stand-in server for benchmarks
+DAWA_URL = "https://api.dataforsyningen.dk"
+
+HEADERS = {'User-Agent': 'Mozilla/5.0'}
+
+#shared by every caller so concurrent workers respect one rate limit,
+#SCHEDULER.stats() gives the retry/throttle counters
+SCHEDULER = RetryScheduler()
+
 
 # In[2]:
 
 
-def search_address(address):
-    url = "https://api.dataforsyningen.dk/datavask/adgangsadresser?betegnelse={}".format(address)
-    try:
-        r = requests.get(url,headers={'User-Agent': 'Mozilla/5.0'})
-    except:
-        time.sleep(2)
-        try:
-            r = requests.get(url)
-        except:
-            return None
+@traced("dawa_search_address")
+def search_address(address, session=None, base_url=None):
+    #a requests.Session can be passed in to reuse keep-alive connections
+    http = session or requests
+    url = (base_url or DAWA_URL) + "/datavask/adgangsadresser?betegnelse={}".format(address)
     try:
+        r = SCHEDULER.request(http, url, headers=HEADERS)
+        #429/5xx left after the retries and other 4xx carry an error body, not a match
+        r.raise_for_status()
         return r.json()
-    except:
+    except (requests.RequestException, CircuitOpenError, ValueError):
         return None
 
 
 # In[3]:
 
 
-def extract_coordinates(json):
+@traced("dawa_extract_coordinates")
+def extract_coordinates(json, session=None):
+    http = session or requests
     try:
         href = json["resultater"][0]["adresse"]["href"]
-    except:
+    except (KeyError, IndexError, TypeError):
         return [None,None]
     try:
-        r = requests.get(href,headers={'User-Agent': 'Mozilla/5.0'})
-    except:
-        print("overflow, sleeping for 2 seconds ...")
-        time.sleep(2)
-        try:
-            r = requests.get(href,headers={'User-Agent': 'Mozilla/5.0'})
-        except:
-            return [None,None]
-    try:
+        r = SCHEDULER.request(http, href, headers=HEADERS)
+        r.raise_for_status()
         coordinates = r.json()["adgangspunkt"]["koordinater"]
         return coordinates
-    except:
-        print(r)
+    except (requests.RequestException, CircuitOpenError, ValueError, KeyError, TypeError):
         return [None,None]
 
 
+# In[ ]:
+
+
+#max number of ids per bulk lookup, keeps the GET url well below common limits
+BULK_SIZE = 100
+
+
+@traced("dawa_extract_coordinates_bulk")
+def extract_coordinates_bulk(jsons, session=None):
+    #same as extract_coordinates for a list of datavask responses, but resolves
+    #all of them with one /adgangsadresser?id=a|b|c request per BULK_SIZE ids
+    http = session or requests
+
+    ids = []
+    for json in jsons:
+        try:
+            ids.append(json["resultater"][0]["adresse"]["id"])
+        except (KeyError, IndexError, TypeError):
+            ids.append(None)
+
+    wanted = sorted(set(i for i in ids if i))
+    coordinates = {}
+    for start in range(0, len(wanted), BULK_SIZE):
+        chunk = wanted[start:start+BULK_SIZE]
+        url = DAWA_URL + "/adgangsadresser?struktur=mini&id={}".format("|".join(chunk))
+        try:
+            r = SCHEDULER.request(http, url, headers=HEADERS)
+            r.raise_for_status()
+            for address in r.json():
+                coordinates[address["id"]] = [address["x"], address["y"]]
+        except (requests.RequestException, CircuitOpenError, ValueError, KeyError, TypeError):
+            print("bulk lookup of {} ids failed".format(len(chunk)))
+
+    return [coordinates.get(i, [None,None]) for i in ids]
+
+
 # In[4]:
 
 
@@ -77,18 +117,43 @@ def json_best_match_name(json):
 # In[5]:
 
 
-def DAWA_data(address):
+def geocode_remote(address, session=None, base_url=None):
+    #datavask match plus its coordinates from the DAWA api (or a stand-in at base_url),
+    #(None, None, None, None) when the lookup failed or nothing matched
+    json = search_address(address, session=session, base_url=base_url)
+    if json == None:
+        return None, None, None, None
+
+    try:
+        confidence = json["kategori"]
+        dawa_name = json_best_match_name(json)
+    except (KeyError, IndexError, TypeError):
+        return None, None, None, None
+    long, lat = extract_coordinates(json, session=session)
+    return dawa_name, confidence, lat, long
+
+
+def DAWA_data(address, session=None, cache=None, backend=None):
     output = {"DAWA_address":[],"Confidence":[],"X":[],"Y":[]}
-    
+
+    #a geocoders backend (remote, cached, offline) answers instead of the api when given
+    if backend is not None:
+        return backend.geocode(address, session=session)
+
+    #a geocode_cache.GeocodeCache skips the network for addresses we have already resolved
+    if cache is not None:
+        cached = cache.get(address)
+        if cached is not None:
+            return cached
+
     #print(full_address)
-    json = search_address(address)
-    if json == None:
+    dawa_name, confidence, lat, long = geocode_remote(address, session=session)
+    if dawa_name is None:
         return None, None, None, None
-        
-    confidence = json["kategori"]
-    dawa_name = json_best_match_name(json)
-    long, lat = extract_coordinates(json)
-        
+
+    if cache is not None:
+        cache.put(address, (dawa_name, confidence, lat, long))
+
     return dawa_name, confidence, lat, long
 
 
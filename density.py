@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Binned kernel density surface of the sales and its level polygons.
+
+Instead of drawing a seaborn kdeplot and scraping the matplotlib paths, the
+points are linearly binned onto a regular grid and the counts are convolved
+with the Gaussian kernel by FFT, which costs O(points + grid log grid)
+rather than points x grid evaluations. The bandwidth (Scott's rule on the
+full covariance), the grid support (data range +- cut bandwidths) and the
+iso-proportion levels follow sns.kdeplot, so the polygons match what the
+notebook used to scrape from the plot:
+
+    surface = kde_grid(gdf['lng'], gdf['lat'])
+    geo = level_polygons(surface, levels=[0.2, 0.4, 0.6, 0.8, 0.95, 1])
+
+geo has one MultiPolygon per band between consecutive levels, labelled
+with the lower level, holes included (contourpy returns them with their
+outer ring, so no polygon differences are needed).
+
+Fewer than two points, or points on one line or one spot, have no kernel
+covariance; like seaborn, kde_grid then warns and returns None, and
+level_polygons(None) is an empty frame.
+"""
+
+import warnings
+
+from collections import namedtuple
+
+import contourpy
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from scipy.signal import fftconvolve
+
+
+#sns.kdeplot(levels=...) as used in analysis.ipynb
+LEVELS = [0.2, 0.4, 0.6, 0.8, 0.95, 1]
+
+#kernel support in bandwidths, beyond it the weights are negligible
+KERNEL_SIGMAS = 4
+
+#x, y: grid node coordinates, density: pdf at the nodes, shape (len(y), len(x))
+DensitySurface = namedtuple('DensitySurface', ['x', 'y', 'density'])
+
+
+def scott_covariance(x, y, bw_adjust=1.0):
+    """Kernel covariance of scipy/seaborn's gaussian_kde: data covariance x (bw_adjust * n^(-1/6))^2."""
+    factor = len(x) ** (-1 / 6) * bw_adjust
+    return np.cov(np.vstack([x, y])) * factor ** 2
+
+
+def _linear_bin(values, start, step, size):
+    """Lower node index and weight of the upper node for linear binning."""
+    position = np.clip((values - start) / step, 0, size - 1 - 1e-9)
+    lower = position.astype(np.intp)
+    return lower, position - lower
+
+
+def _positive_definite(covariance):
+    return np.all(np.isfinite(covariance)) and np.linalg.eigvalsh(covariance)[0] > 0
+
+
+def kde_grid(x, y, gridsize=200, cut=3, bw_adjust=1.0):
+    """DensitySurface of the points on a gridsize x gridsize grid, None (with a warning) when they have no spread."""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    covariance = scott_covariance(x, y, bw_adjust) if len(x) >= 2 else None
+    if covariance is None or not _positive_definite(covariance):
+        warnings.warn("{} points without spread in both dimensions; skipping density estimate.".format(len(x)), UserWarning)
+        return None
+
+    bw = np.sqrt(np.diag(covariance))
+    gx = np.linspace(x.min() - cut * bw[0], x.max() + cut * bw[0], gridsize)
+    gy = np.linspace(y.min() - cut * bw[1], y.max() + cut * bw[1], gridsize)
+    dx, dy = gx[1] - gx[0], gy[1] - gy[0]
+
+    #every point spreads its unit mass over the four surrounding nodes
+    ix, wx = _linear_bin(x, gx[0], dx, gridsize)
+    iy, wy = _linear_bin(y, gy[0], dy, gridsize)
+    counts = np.zeros(gridsize * gridsize)
+    for ox, weight_x in ((0, 1 - wx), (1, wx)):
+        for oy, weight_y in ((0, 1 - wy), (1, wy)):
+            counts += np.bincount((iy + oy) * gridsize + ix + ox, weight_x * weight_y, minlength=gridsize * gridsize)
+    counts = counts.reshape(gridsize, gridsize)
+
+    #Gaussian kernel with the full covariance, sampled on the grid offsets
+    kx = min(gridsize - 1, int(np.ceil(KERNEL_SIGMAS * bw[0] / dx)))
+    ky = min(gridsize - 1, int(np.ceil(KERNEL_SIGMAS * bw[1] / dy)))
+    ox, oy = np.meshgrid(np.arange(-kx, kx + 1) * dx, np.arange(-ky, ky + 1) * dy)
+    offsets = np.stack([ox.ravel(), oy.ravel()])
+    mahalanobis = np.sum(offsets * (np.linalg.inv(covariance) @ offsets), axis=0)
+    kernel = np.exp(-0.5 * mahalanobis).reshape(ox.shape)
+    kernel /= kernel.sum()
+
+    density = np.clip(fftconvolve(counts, kernel, mode='same'), 0, None) / (len(x) * dx * dy)
+    return DensitySurface(gx, gy, density)
+
+
+def iso_levels(density, proportions):
+    """Density thresholds with `proportions` of the mass below them, like seaborn's iso-proportion levels."""
+    values = np.sort(density.ravel())[::-1]
+    mass_above = np.cumsum(values) / values.sum()
+    idx = np.searchsorted(mass_above, 1 - np.asarray(proportions, dtype=np.float64))
+    return np.take(values, idx, mode='clip')
+
+
+def level_polygons(surface, levels=LEVELS, crs='EPSG:4326'):
+    """GeoDataFrame (level, geometry) of the filled bands between consecutive iso-proportion levels, empty without a surface."""
+    if surface is None:
+        return gpd.GeoDataFrame({'level': []}, geometry=[], crs=crs)
+
+    thresholds = iso_levels(surface.density, levels)
+    generator = contourpy.contour_generator(surface.x, surface.y, surface.density, fill_type=contourpy.FillType.OuterOffset)
+
+    geometry = []
+    for lower, upper in zip(thresholds[:-1], thresholds[1:]):
+        polygons = []
+        points_list, offsets_list = generator.filled(lower, upper)
+        for points, offsets in zip(points_list, offsets_list):
+            #first ring is the outer boundary, the rest are its holes
+            rings = [points[a:b] for a, b in zip(offsets[:-1], offsets[1:])]
+            polygons.append(shapely.Polygon(rings[0], rings[1:]))
+        geometry.append(shapely.MultiPolygon(polygons))
+
+    return gpd.GeoDataFrame({'level': list(levels[:-1])}, geometry=geometry, crs=crs)
+
+
+def density_levels(x, y, levels=LEVELS, gridsize=200, bw_adjust=1.0, crs='EPSG:4326'):
+    """level_polygons of the KDE of the points (x, y) in one call."""
+    return level_polygons(kde_grid(x, y, gridsize=gridsize, bw_adjust=bw_adjust), levels, crs)
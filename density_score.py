@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Sales density level of every apartment from KDE contour polygons.
+
+The contour polygons (one (Multi)Polygon per level, as built in
+analysis.ipynb) are prepared once, then each level is tested against all
+coordinates still unscored with one vectorized shapely.intersects_xy call,
+highest level first. GEOS walks the prepared polygon's edge index for every
+point, so the cost is levels x points in C instead of a Python loop over
+apartments x levels, and no Point objects are built:
+
+    geo = gpd.read_file('data/kde_levels.geojson')
+    gdf['kde_sales_density'] = density_score(gdf['lng'], gdf['lat'], geo)
+"""
+
+import numpy as np
+import shapely
+
+
+#where the app looks for the contour polygons written by analysis.ipynb
+LEVELS_PATH = 'data/kde_levels.geojson'
+
+
+class DensityLevels:
+
+    def __init__(self, geometries, levels):
+        levels = np.asarray(levels, dtype=np.float64)
+        order = np.argsort(-levels, kind='stable')
+
+        #highest level first, so the first hit is the score
+        self.levels = levels[order]
+        self.geometries = np.asarray(geometries, dtype=object)[order]
+        shapely.prepare(self.geometries)
+
+    @classmethod
+    def from_frame(cls, geo, level='level'):
+        """From a GeoDataFrame with one row per contour level."""
+        return cls(geo.geometry.values, geo[level].to_numpy())
+
+    def score(self, x, y, default=0.0):
+        """Highest level whose polygon contains each point (x, y), default outside all of them."""
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        result = np.full(len(x), default, dtype=np.float64)
+
+        todo = np.arange(len(x))
+        for geometry, level in zip(self.geometries, self.levels):
+            if len(todo) == 0:
+                break
+            hit = shapely.intersects_xy(geometry, x[todo], y[todo])
+            result[todo[hit]] = level
+            todo = todo[~hit]
+
+        return result
+
+
+def density_score(x, y, geo, level='level', default=0.0):
+    """kde_sales_density of points (x, y) given the contour GeoDataFrame `geo`."""
+    return DensityLevels.from_frame(geo, level).score(x, y, default)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Enrichment stage after geocoding: postal code and parish of every point.
+
+Usage:
+    python enrich.py "dimMember(v2)_output.csv" "dimMember(v2)_enriched.csv" --chunk-size 50000
+
+Reads the ';' separated geocoding output (lat/long with decimal commas) in
+chunks, joins every chunk to the postal code polygons
+(filtered_postnumre: POSTNR_TXT, POSTBYNAVN) and the parish polygons
+(sogne: SOGNEKODE, name) and appends the rows with postal, city, sognekode
+and sognenavn columns. The polygon STRtrees are built once, every chunk is
+one vectorized tree query per layer.
+
+The output is appended to: rows already in it are skipped in the input, so
+after the geocoder has appended new rows only those are joined.
+`postal` is POSTNR_TXT as in the polygons (central Copenhagen polygons
+cover a range like "1000-1499"), which is what the app joins on. kommune
+has no polygon layer in data/ and is not produced here.
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from shapely import STRtree
+
+from data_store import parish_name_column, read_geo
+
+
+ENRICHED_COLUMNS = ['postal', 'city', 'sognekode', 'sognenavn']
+
+
+class RegionLayer:
+    """Polygons of one region layer with a prebuilt STRtree and the attributes to emit."""
+
+    def __init__(self, gdf, columns):
+        self.polygons = np.asarray(gdf.geometry.values, dtype=object)
+        shapely.prepare(self.polygons)
+        self.tree = STRtree(self.polygons)
+        #attribute columns to emit, as object arrays with a trailing None row for "no polygon"
+        self.values = {name: np.append(gdf[column].astype(str).to_numpy(dtype=object), None) for name, column in columns.items()}
+
+    def lookup(self, points):
+        """Row of the polygon containing each point, len(polygons) where there is none.
+
+        Points on a shared border get the lower polygon row.
+        """
+        point_idx, polygon_idx = self.tree.query(points, predicate='intersects')
+        rows = np.full(len(points), len(self.polygons))
+        np.minimum.at(rows, point_idx, polygon_idx)
+        return rows
+
+    def join(self, points):
+        rows = self.lookup(points)
+        return {name: values[rows] for name, values in self.values.items()}
+
+
+class RegionJoiner:
+
+    def __init__(self, postnumre='data/filtered_postnumre', sogne='data/sogne'):
+        #both layers are lon/lat (postnumre is EPSG:4979, the 3D variant), so coordinates are used as they are
+        postnumre = read_geo(postnumre)
+        sogne = read_geo(sogne)
+        self.layers = [
+            RegionLayer(postnumre, {'postal': 'POSTNR_TXT', 'city': 'POSTBYNAVN'}),
+            RegionLayer(sogne, {'sognekode': 'SOGNEKODE', 'sognenavn': parish_name_column(sogne)}),
+        ]
+
+    def enrich(self, lng, lat):
+        """DataFrame with ENRICHED_COLUMNS for the points (lng, lat), None outside the polygons."""
+        points = shapely.points(np.asarray(lng, dtype=np.float64), np.asarray(lat, dtype=np.float64))
+        columns = {}
+        for layer in self.layers:
+            columns.update(layer.join(points))
+        return pd.DataFrame(columns, columns=ENRICHED_COLUMNS)
+
+
+def _committed_rows(output_path):
+    """Data rows already in output_path, after dropping a partially written last line."""
+    if not os.path.exists(output_path):
+        return 0
+
+    lines, end, position = 0, 0, 0
+    with open(output_path, "r+b") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            newlines = block.count(b"\n")
+            if newlines:
+                lines += newlines
+                end = position + block.rfind(b"\n") + 1
+            position += len(block)
+        f.truncate(end)
+    #minus the header
+    return max(lines - 1, 0)
+
+
+def _to_float(column):
+    #geocoding output writes decimal commas
+    return pd.to_numeric(column.str.replace(",", ".", regex=False), errors="coerce").to_numpy()
+
+
+def enrich_file(input_path, output_path, chunk_size=50000, joiner=None, lng='long', lat='lat'):
+    """Append the enriched rows of input_path not yet in output_path, returns the number of rows added."""
+    joiner = joiner or RegionJoiner()
+    done = _committed_rows(output_path)
+
+    #every column stays text, so the input columns are written back unchanged
+    chunks = pd.read_csv(input_path, sep=";", dtype=str, keep_default_na=False,
+                         skiprows=range(1, done + 1), chunksize=chunk_size)
+
+    added = 0
+    start = time.perf_counter()
+    with open(output_path, "a", encoding="utf-8", newline="") as output_file:
+        for chunk in chunks:
+            regions = joiner.enrich(_to_float(chunk[lng]), _to_float(chunk[lat]))
+            enriched = pd.concat([chunk.reset_index(drop=True), regions], axis=1)
+            enriched.to_csv(output_file, sep=";", index=False, header=output_file.tell() == 0)
+            output_file.flush()
+            os.fsync(output_file.fileno())
+
+            added += len(chunk)
+            elapsed = time.perf_counter() - start
+            print("{} rows, {:.0f} rows/sec".format(done + added, added / elapsed if elapsed else 0))
+
+    return added
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Join geocoded rows to postal code and parish polygons")
+    parser.add_argument("input", help="';' separated geocoding output with lat and long columns")
+    parser.add_argument("output", help="enriched output, appended to")
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--postnumre", default="data/filtered_postnumre")
+    parser.add_argument("--sogne", default="data/sogne")
+    args = parser.parse_args(argv)
+
+    added = enrich_file(args.input, args.output, chunk_size=args.chunk_size, joiner=RegionJoiner(args.postnumre, args.sogne))
+    print("done: {} new rows in {}".format(added, args.output))
+
+
+if __name__ == '__main__':
+    main()
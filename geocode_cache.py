@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Persistent geocode cache in a single SQLite file.
+
+Keys are normalized address strings, values the (dawa_name, confidence, lat,
+long) tuple returned by DAWA_data. Entries expire after `ttl` seconds and the
+least recently used ones are evicted once the cache holds more than
+`max_entries` rows.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+
+
+DEFAULT_PATH = "data/geocode_cache.sqlite"
+
+#30 days, addresses rarely move
+DEFAULT_TTL = 30 * 24 * 3600
+
+DEFAULT_MAX_ENTRIES = 2_000_000
+
+
+def normalize_address(address):
+    """Cache key for an address: BOM and case stripped, whitespace collapsed."""
+    address = address.replace("\ufeff", "").casefold()
+    address = re.sub(r"\s*,\s*", ", ", address)
+    return re.sub(r"\s+", " ", address).strip(" ,")
+
+
+class GeocodeCache:
+
+    def __init__(self, path=DEFAULT_PATH, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        #one connection shared by all threads, guarded by a lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS geocode (
+                key TEXT PRIMARY KEY,
+                dawa_name TEXT,
+                confidence TEXT,
+                lat REAL,
+                long REAL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL
+            )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS geocode_last_access ON geocode (last_access)")
+        self._puts = 0
+
+    def get(self, address):
+        """Cached (dawa_name, confidence, lat, long) for address, or None."""
+        key = normalize_address(address)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT dawa_name, confidence, lat, long, created FROM geocode WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None or (self.ttl and now - row[4] > self.ttl):
+                self.misses += 1
+                return None
+
+            self._conn.execute("UPDATE geocode SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return row[:4]
+
+    def put(self, address, result):
+        """Store a DAWA_data result, results without coordinates are not cached."""
+        dawa_name, confidence, lat, long = result
+        if lat is None or long is None:
+            return
+
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO geocode VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (normalize_address(address), dawa_name, confidence, lat, long, now, now),
+            )
+            self._puts += 1
+
+            #checking the size on every put would double the write cost
+            if self._puts % 1000 == 0:
+                self._evict()
+
+    def _evict(self):
+        if self.ttl:
+            self._conn.execute("DELETE FROM geocode WHERE created < ?", (time.time() - self.ttl,))
+
+        count = self._conn.execute("SELECT COUNT(*) FROM geocode").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM geocode WHERE key IN (SELECT key FROM geocode ORDER BY last_access LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def evict(self):
+        """Drop expired entries and trim the cache to max_entries."""
+        with self._lock:
+            self._evict()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM geocode").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Resumable geocoding job for the member file.
+
+Usage:
+    python geocode_pipeline.py "dimMember(v2).csv" "dimMember(v2)_output.csv" --concurrency 16 --bulk
+
+Stages: chunked reader -> geocode_batch -> writer. After every `chunk_size`
+rows the output is fsync'ed and a checkpoint is written next to it
+(<output>.checkpoint.json) with the input offset, the last member_code and
+the committed sizes of the output and dead-letter files. Rerunning the same
+command resumes from the checkpoint; anything written after it is truncated
+first, so no row is written twice.
+
+Rows that can't be split or geocoded go to <output>.deadletter.csv as
+member_code;address;reason. That file can be fed back in as input to retry.
+"""
+
+import argparse
+import json
+import os
+import time
+
+from collections import deque
+
+import dawa_scrape_prod
+from dawa_batch import geocode_batch, format_output_row, OUTPUT_HEADER
+from data_store import write_json
+from geocode_cache import GeocodeCache
+
+
+CHECKPOINT_SUFFIX = ".checkpoint.json"
+DEADLETTER_SUFFIX = ".deadletter.csv"
+
+
+def read_chunks(input_path, offset=0):
+    """Yield (offset after line, member_code, address, line) from input_path.
+
+    member_code and address are None for lines that can't be split.
+    """
+    with open(input_path, "rb") as input_file:
+        input_file.seek(offset)
+        for raw in iter(input_file.readline, b""):
+            offset += len(raw)
+            line = raw.decode("utf-8").strip().replace("\ufeff","")
+            if not line:
+                continue
+            try:
+                member_code, address = line.split(";")[:2]
+            except ValueError:
+                member_code, address = None, None
+            yield offset, member_code, address, line
+
+
+def load_checkpoint(output_path):
+    try:
+        with open(output_path + CHECKPOINT_SUFFIX, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_checkpoint(output_path, checkpoint):
+    write_json(output_path + CHECKPOINT_SUFFIX, checkpoint)
+
+
+def _open_at(path, size):
+    #open for appending after dropping anything written after the last checkpoint
+    f = open(path, "a+b")
+    f.truncate(size)
+    f.seek(size)
+    return f
+
+
+def run(input_path, output_path, chunk_size=1000, concurrency=8, bulk=False, cache=None):
+    """Geocode input_path into output_path, resuming from a checkpoint if there is one."""
+    deadletter_path = output_path + DEADLETTER_SUFFIX
+
+    checkpoint = load_checkpoint(output_path)
+    if checkpoint:
+        print("resuming after member_code {member_code} ({rows} rows done)".format(**checkpoint))
+    else:
+        checkpoint = {"input_offset": 0, "output_size": 0, "deadletter_size": 0, "member_code": None, "rows": 0, "failed": 0}
+
+    output_file = _open_at(output_path, checkpoint["output_size"])
+    deadletter_file = _open_at(deadletter_path, checkpoint["deadletter_size"])
+
+    def commit():
+        for f in (output_file, deadletter_file):
+            f.flush()
+            os.fsync(f.fileno())
+        checkpoint["output_size"] = output_file.tell()
+        checkpoint["deadletter_size"] = deadletter_file.tell()
+        write_checkpoint(output_path, checkpoint)
+
+    def write_row(record, result):
+        offset, member_code, address, line = record
+        if member_code is None:
+            deadletter_file.write((line + ";split failed\n").encode("utf-8"))
+            checkpoint["failed"] += 1
+        elif result[2] is None or result[3] is None:
+            deadletter_file.write(";".join([member_code, address, "no match"]).encode("utf-8") + b"\n")
+            checkpoint["failed"] += 1
+        else:
+            output_file.write(format_output_row(member_code, address, result).encode("utf-8"))
+            checkpoint["member_code"] = member_code
+
+        checkpoint["input_offset"] = offset
+        checkpoint["rows"] += 1
+        if checkpoint["rows"] % chunk_size == 0:
+            commit()
+
+    if output_file.tell() == 0:
+        output_file.write((";".join(OUTPUT_HEADER)+"\n").encode("utf-8"))
+
+    #records waiting for their geocode result, in input order
+    pending = deque()
+
+    def addresses():
+        for record in read_chunks(input_path, checkpoint["input_offset"]):
+            pending.append(record)
+            if record[1] is not None:
+                yield record[2]
+
+    start = time.perf_counter()
+    rows_at_start = checkpoint["rows"]
+    try:
+        for address, result in geocode_batch(addresses(), concurrency=concurrency, bulk=bulk, cache=cache):
+            #lines that failed to split never reach the geocoder, flush them in order
+            while pending[0][1] is None:
+                write_row(pending.popleft(), None)
+            write_row(pending.popleft(), result)
+
+            if checkpoint["rows"] % chunk_size == 0:
+                elapsed = time.perf_counter() - start
+                print("{} rows, {:.1f} rows/sec".format(checkpoint["rows"], (checkpoint["rows"] - rows_at_start) / elapsed))
+
+        while pending:
+            write_row(pending.popleft(), None)
+        commit()
+    finally:
+        output_file.close()
+        deadletter_file.close()
+
+    print("done: {rows} rows, {failed} in {deadletter}".format(deadletter=deadletter_path, **checkpoint))
+    return checkpoint
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Resumable geocoding of a member file")
+    parser.add_argument("input", help="';' separated file with member_code;address")
+    parser.add_argument("output")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="rows between checkpoints")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--bulk", action="store_true", help="resolve coordinates with bulk id lookups")
+    parser.add_argument("--cache", default=None, help="sqlite geocode cache file")
+    parser.add_argument("--base-url", default=None, help="override the DAWA url")
+    args = parser.parse_args(argv)
+
+    if args.base_url:
+        dawa_scrape_prod.DAWA_URL = args.base_url.rstrip("/")
+
+    cache = GeocodeCache(args.cache) if args.cache else None
+    run(args.input, args.output, chunk_size=args.chunk_size, concurrency=args.concurrency, bulk=args.bulk, cache=cache)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Interchangeable geocoder backends behind DAWA_data.
+
+Every backend has geocode(address, session=None) returning the
+(dawa_name, confidence, lat, long) tuple of DAWA_data, (None, None, None,
+None) when nothing matches, so callers pick one without changing code:
+
+    backend = CachedGeocoder(RemoteGeocoder(), GeocodeCache())
+    dawa_name, confidence, lat, long = DAWA_data(address, backend=backend)
+
+- RemoteGeocoder: datavask + coordinate lookup against the DAWA api, or a
+  stand-in at base_url (benchmarks/dawa_server.py)
+- OfflineGeocoder: the local offline_index.OfflineIndex, no network
+- CachedGeocoder: a geocode_cache.GeocodeCache in front of any other backend
+
+make_geocoder builds one from command line style options.
+"""
+
+from dawa_scrape_prod import geocode_remote
+from geocode_cache import GeocodeCache
+from offline_index import OfflineIndex
+
+
+BACKENDS = ("remote", "offline")
+
+
+class RemoteGeocoder:
+
+    def __init__(self, base_url=None):
+        #None follows dawa_scrape_prod.DAWA_URL at call time
+        self.base_url = base_url.rstrip("/") if base_url else None
+
+    def geocode(self, address, session=None):
+        return geocode_remote(address, session=session, base_url=self.base_url)
+
+    def __repr__(self):
+        return "RemoteGeocoder({!r})".format(self.base_url)
+
+
+class OfflineGeocoder:
+
+    def __init__(self, index):
+        """index: an OfflineIndex or the directory of one."""
+        if isinstance(index, str):
+            index = OfflineIndex(index)
+        self.index = index
+
+    def geocode(self, address, session=None):
+        #session is accepted for a uniform interface, lookups never touch the network
+        return self.index.DAWA_data(address)
+
+    def __repr__(self):
+        return "OfflineGeocoder({} addresses)".format(len(self.index))
+
+
+class CachedGeocoder:
+
+    def __init__(self, backend, cache):
+        self.backend = backend
+        self.cache = cache
+
+    def geocode(self, address, session=None):
+        cached = self.cache.get(address)
+        if cached is not None:
+            return tuple(cached)
+        result = self.backend.geocode(address, session=session)
+        self.cache.put(address, result)
+        return result
+
+    def __repr__(self):
+        return "CachedGeocoder({!r})".format(self.backend)
+
+
+def make_geocoder(backend="remote", base_url=None, index_dir=None, cache_path=None):
+    """Backend by name ("remote" or "offline"), behind a GeocodeCache when cache_path is given."""
+    if backend == "remote":
+        geocoder = RemoteGeocoder(base_url)
+    elif backend == "offline":
+        if not index_dir:
+            raise ValueError("the offline backend needs an index directory")
+        geocoder = OfflineGeocoder(index_dir)
+    else:
+        raise ValueError("unknown geocoder backend {!r}, expected one of {}".format(backend, BACKENDS))
+
+    if cache_path:
+        geocoder = CachedGeocoder(geocoder, GeocodeCache(cache_path))
+    return geocoder
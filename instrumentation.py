@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Timing spans and counters for app reruns and geocoding calls.
+
+Spans time a block and add it to the process wide metrics; inside a trace
+(one per app rerun) they are also recorded in order with their nesting
+depth, so a slow Plot or Search click can be broken down afterwards:
+
+    with trace('rerun', profile=False) as run:
+        with span('home_deck'):
+            ...
+        record('deck_payload_bytes', len(payload))
+    run.spans     #[(name, depth, seconds), ...]
+
+count(name) adds to a counter, observe(name, value) to a count/sum/max
+summary, record(name, value) also keeps the value on the trace. A finished trace is written as one json line to the
+'instrumentation' logger, prometheus_text() renders everything in the
+Prometheus text format and serve_metrics(port) serves it on /metrics.
+trace(profile=True) also runs cProfile for the traced block and keeps the
+top of its report in run.profile.
+"""
+
+import cProfile
+import functools
+import io
+import json
+import logging
+import pstats
+import re
+import threading
+import time
+
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+#metric name prefix in the Prometheus output
+PREFIX = "housing"
+
+#finished traces kept for recent_traces()
+MAX_TRACES = 50
+
+#functions shown of a cProfile report
+PROFILE_LINES = 40
+
+logger = logging.getLogger("instrumentation")
+
+_lock = threading.Lock()
+_counters = {}
+_summaries = {}
+_collectors = []
+_traces = deque(maxlen=MAX_TRACES)
+_local = threading.local()
+
+
+def count(name, value=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def observe(name, value):
+    with _lock:
+        summary = _summaries.setdefault(name, {"count": 0, "sum": 0.0, "max": 0.0})
+        summary["count"] += 1
+        summary["sum"] += value
+        summary["max"] = max(summary["max"], value)
+
+
+class Trace:
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.time()
+        self.seconds = None
+        self.spans = []
+        self.values = {}
+        self.profile = None
+        self.depth = 0
+
+    def to_dict(self):
+        return {
+            "trace": self.name,
+            "started": self.started,
+            "seconds": self.seconds,
+            "spans": [{"name": name, "depth": depth, "seconds": round(seconds, 6)} for name, depth, seconds in self.spans],
+            "values": self.values,
+        }
+
+
+def current_trace():
+    """The trace of the calling thread, None outside of one."""
+    return getattr(_local, "trace", None)
+
+
+@contextmanager
+def span(name):
+    """Time the block as `name`, in the metrics and in the current trace."""
+    run = current_trace()
+    if run is not None:
+        run.depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        observe(name + "_seconds", seconds)
+        if run is not None:
+            run.depth -= 1
+            #appended on exit, so the recorded order is by end time; depth keeps the nesting readable
+            run.spans.append((name, run.depth, seconds))
+
+
+def traced(name):
+    """Decorator form of span."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record(name, value):
+    """observe(name, value) and keep the value on the current trace."""
+    observe(name, value)
+    run = current_trace()
+    if run is not None:
+        run.values[name] = value
+
+
+@contextmanager
+def trace(name, profile=False):
+    """Collect the spans of the block into a Trace, optionally under cProfile."""
+    run = Trace(name)
+    previous = current_trace()
+    _local.trace = run
+    profiler = cProfile.Profile() if profile else None
+    start = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield run
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            report = io.StringIO()
+            pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(PROFILE_LINES)
+            run.profile = report.getvalue()
+        run.seconds = time.perf_counter() - start
+        _local.trace = previous
+
+        observe(name + "_seconds", run.seconds)
+        with _lock:
+            _traces.append(run)
+        logger.info(json.dumps(run.to_dict()))
+
+
+def recent_traces():
+    with _lock:
+        return list(_traces)
+
+
+def register_collector(collector):
+    """collector() -> [(metric name, labels dict, value), ...], evaluated on every prometheus_text()."""
+    with _lock:
+        if collector not in _collectors:
+            _collectors.append(collector)
+
+
+def _metric_name(name):
+    return PREFIX + "_" + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in sorted(labels.items())) + "}"
+
+
+def prometheus_text():
+    """All counters, summaries and collector values in the Prometheus text exposition format."""
+    with _lock:
+        counters = dict(_counters)
+        summaries = {name: dict(summary) for name, summary in _summaries.items()}
+        collectors = list(_collectors)
+
+    lines = []
+    for name, value in sorted(counters.items()):
+        metric = _metric_name(name) + "_total"
+        lines += ["# TYPE {} counter".format(metric), "{} {}".format(metric, value)]
+
+    for name, summary in sorted(summaries.items()):
+        metric = _metric_name(name)
+        lines += [
+            "# TYPE {} summary".format(metric),
+            "{}_count {}".format(metric, summary["count"]),
+            "{}_sum {}".format(metric, summary["sum"]),
+            "# TYPE {}_max gauge".format(metric),
+            "{}_max {}".format(metric, summary["max"]),
+        ]
+
+    typed = set()
+    for collector in collectors:
+        for name, labels, value in collector():
+            metric = _metric_name(name)
+            if metric not in typed:
+                typed.add(metric)
+                lines.append("# TYPE {} {}".format(metric, "counter" if metric.endswith("_total") else "gauge"))
+            lines.append("{}{} {}".format(metric, _labels(labels), value))
+
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve_metrics(port, host="127.0.0.1"):
+    """Serve prometheus_text() on http://host:port/metrics from a daemon thread, returns the server."""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def log_traces(path):
+    """Append every finished trace to path as a json line."""
+    handler = logging.FileHandler(path, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    return handler
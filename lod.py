@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Level-of-detail aggregation for the map layers.
+
+pydeck serializes every row it is given to the browser, so the full sales
+dataset can't be sent as individual columns. Above `max_points` rows the
+points are binned into a square grid sized for the zoom level (a cell is
+roughly `cell_pixels` screen pixels wide) and one column per cell is drawn.
+The grid starts fine and is coarsened until it fits, so the map keeps as
+much detail as the point budget allows. Either way the layer only gets a
+plain DataFrame with the numeric columns it uses, never the GeoDataFrame
+with its geometry column.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+#pydeck/deck.gl stays responsive in the browser up to about this many columns
+MAX_POINTS = 20000
+
+#meters per degree of latitude
+METERS_PER_DEGREE = 111320
+
+
+def cell_size(zoom, lat=55.67, cell_pixels=8):
+    """(degrees longitude, degrees latitude) of a grid cell `cell_pixels` wide at `zoom`."""
+    #a 256 pixel web mercator tile spans 360 / 2**zoom degrees of longitude
+    lng_size = 360 / 2 ** zoom / 256 * cell_pixels
+    return lng_size, lng_size * np.cos(np.radians(lat))
+
+
+def grid_aggregate(lng, lat, values, zoom, cell_pixels=8):
+    """Bin points into grid cells, returns one row per non-empty cell.
+
+    Columns: lng, lat (mean position of the points in the cell), count and
+    the mean of `values`.
+    """
+    lng = np.asarray(lng, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+
+    lng_size, lat_size = cell_size(zoom, lat.mean() if len(lat) else 55.67, cell_pixels)
+    ix = np.floor(lng / lng_size).astype(np.int64)
+    iy = np.floor(lat / lat_size).astype(np.int64)
+
+    _, cell = np.unique(ix * 2**32 + iy, return_inverse=True)
+    count = np.bincount(cell)
+
+    return pd.DataFrame({
+        'lng': (np.bincount(cell, lng) / count).astype(np.float32),
+        'lat': (np.bincount(cell, lat) / count).astype(np.float32),
+        'count': count.astype(np.int32),
+        'mean': (np.bincount(cell, values) / count).astype(np.float32),
+    })
+
+
+def level_of_detail(lng, lat, values, zoom=16, max_points=MAX_POINTS, cell_pixels=8):
+    """(cells, zoom) with at most max_points cells, coarsening from `zoom` until they fit.
+
+    Returns (None, None) when there are few enough points to draw them individually.
+    """
+    if len(lng) <= max_points:
+        return None, None
+
+    while True:
+        cells = grid_aggregate(lng, lat, values, zoom, cell_pixels)
+        if len(cells) <= max_points or zoom <= 1:
+            return cells, zoom
+        zoom -= 1
+
+
+def cell_radius(zoom, lat=55.67, cell_pixels=8):
+    """Column radius in meters that fills most of a cell."""
+    return 0.45 * cell_size(zoom, lat, cell_pixels)[1] * METERS_PER_DEGREE
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Nearest-address queries for the Search page.
+
+The distinct addresses of an AddressTable go into a KD-tree, so "the nearest
+addresses until we have at least M apartments on at least K addresses" is one
+tree query plus a cumulative sum instead of a nearest-neighbour loop over the
+whole sales frame.
+"""
+
+import numpy as np
+import pandas as pd
+
+from scipy.spatial import cKDTree
+
+
+def nearest_addresses(tree, counts, x, y, min_addresses=5, min_apartments=50):
+    """Ids and distances of the nearest points of `tree` to (x, y), closest first.
+
+    Takes points until there are at least `min_addresses` of them and more
+    than `min_apartments` in total of their `counts`.
+    """
+    n = len(counts)
+    k = min(n, max(min_addresses, 16))
+
+    while True:
+        distances, idx = tree.query([x, y], k=k)
+        distances, idx = np.atleast_1d(distances), np.atleast_1d(idx)
+
+        apartments = np.cumsum(counts[idx])
+        enough = (np.arange(1, k + 1) >= min_addresses) & (apartments > min_apartments)
+        if enough.any():
+            stop = int(np.argmax(enough)) + 1
+            return idx[:stop], distances[:stop]
+        if k == n:
+            return idx, distances
+        k = min(n, k * 4)
+
+
+class NeighbourhoodIndex:
+
+    def __init__(self, table):
+        self.table = table
+        self.lng = table.addresses['lng'].to_numpy()
+        self.lat = table.addresses['lat'].to_numpy()
+        self.counts = table.addresses['apartments'].to_numpy()
+
+        #degrees of longitude are shorter than degrees of latitude this far north
+        self.lng_scale = np.cos(np.radians(self.lat.mean())) if len(self.lat) else 1.0
+        self.tree = cKDTree(np.column_stack([self.lng * self.lng_scale, self.lat]))
+
+    def __len__(self):
+        return len(self.counts)
+
+    def nearest_addresses(self, lng, lat, min_addresses=5, min_apartments=50):
+        """Address ids and distances (degrees of latitude) of the nearest addresses, closest first.
+
+        Takes addresses until there are at least `min_addresses` of them and
+        more than `min_apartments` sales on them in total.
+        """
+        return nearest_addresses(self.tree, self.counts, lng * self.lng_scale, lat, min_addresses, min_apartments)
+
+    def query(self, lng, lat, min_addresses=5, min_apartments=50, columns=None):
+        """(sales, addresses) around a point.
+
+        sales holds the sales on the nearest addresses (only `columns` of them
+        as a plain DataFrame if given, gathered column by column so the shared
+        frame is never copied or modified), in address order; addresses has
+        one row per address with its id in the table and its apartment count,
+        closest first.
+        """
+        idx, distances = self.nearest_addresses(lng, lat, min_addresses, min_apartments)
+        rows = self.table.rows_of(idx)
+
+        if columns is None:
+            sales = self.table.gdf.iloc[rows]
+        else:
+            sales = pd.DataFrame({c: self.table.gdf[c].iloc[rows].to_numpy() for c in columns})
+
+        addresses = self.table.addresses.iloc[idx].reset_index(drop=True)
+        addresses['address_id'] = idx
+        addresses['distance'] = distances
+        return sales, addresses
@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Offline geocoding against a local copy of the DAWA address register.
+
+Build the index once from a bulk csv dump of adgangsadresser, e.g.
+https://api.dataforsyningen.dk/adgangsadresser?format=csv&kommunekode=0101
+(one file per kommune can be concatenated):
+
+    python offline_index.py build adgangsadresser.csv data/address_index
+    python offline_index.py lookup data/address_index "Kongens Nytorv 1, 1050 København K"
+
+The index is a directory of .npy columns (memory mapped on load) sorted by
+street, postnr and husnr, plus a trigram index over the unique street names.
+Lookups return the same datavask-shaped json as search_address, so
+json_best_match_name and DAWA_data's (dawa_name, confidence, lat, long)
+contract work unchanged.
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from dawa_scrape_prod import json_best_match_name
+from geocode_cache import normalize_address
+
+
+#column names in the DAWA csv dump, the json "mini" structure uses x/y
+DUMP_COLUMNS = {
+    "id": "id",
+    "vejnavn": "vejnavn",
+    "husnr": "husnr",
+    "supplerendebynavn": "supplerendebynavn",
+    "postnr": "postnr",
+    "postnrnavn": "postnrnavn",
+    "x": "wgs84koordinat_længde",
+    "y": "wgs84koordinat_bredde",
+}
+
+
+def trigrams(text):
+    text = "  " + text + " "
+    return {text[i:i+3] for i in range(len(text) - 2)}
+
+
+def _husnr_key(husnr):
+    #zero pad the number part so "9" sorts before "10" and "10A"
+    m = re.match(r"(\d+)(.*)", husnr)
+    if not m:
+        return husnr.casefold()
+    return "{:05d}{}".format(int(m.group(1)), m.group(2).strip().casefold())
+
+
+def build_index(dump_path, index_dir):
+    """Build an index directory from a DAWA adgangsadresser csv dump."""
+    header = pd.read_csv(dump_path, nrows=0).columns
+    columns = dict(DUMP_COLUMNS)
+    if columns["x"] not in header:
+        columns["x"], columns["y"] = "x", "y"
+
+    df = pd.read_csv(dump_path, usecols=list(columns.values()), dtype=str, keep_default_na=False)
+    df = df.rename(columns={v: k for k, v in columns.items()})
+
+    df["street_norm"] = df["vejnavn"].map(normalize_address)
+    df["husnr_key"] = df["husnr"].map(_husnr_key)
+    df["postnr"] = pd.to_numeric(df["postnr"], errors="coerce").fillna(0).astype(np.int32)
+    df = df.sort_values(["street_norm", "postnr", "husnr_key"]).reset_index(drop=True)
+
+    street_codes, streets = pd.factorize(df["street_norm"], sort=True)
+    vejnavn = df.groupby(street_codes)["vejnavn"].first().tolist()
+    by_codes, by_names = pd.factorize(df["supplerendebynavn"], sort=True)
+    postnrnavn = df.groupby("postnr")["postnrnavn"].first()
+
+    os.makedirs(index_dir, exist_ok=True)
+
+    def save(name, array):
+        np.save(os.path.join(index_dir, name + ".npy"), np.ascontiguousarray(array))
+
+    save("street", street_codes.astype(np.int32))
+    save("postnr", df["postnr"].values)
+    save("husnr_key", df["husnr_key"].values.astype("U12"))
+    save("husnr", df["husnr"].values.astype("U12"))
+    save("supplerendebynavn", by_codes.astype(np.int32))
+    save("x", pd.to_numeric(df["x"]).values.astype(np.float64))
+    save("y", pd.to_numeric(df["y"]).values.astype(np.float64))
+    save("id", df["id"].values.astype("U36"))
+    #rows of street s are street_start[s]:street_start[s+1]
+    save("street_start", np.searchsorted(street_codes, np.arange(len(streets) + 1)).astype(np.int64))
+
+    #trigram index over unique street names, csr layout: postings[offsets[i]:offsets[i+1]]
+    grams = {}
+    for code, name in enumerate(streets):
+        for gram in trigrams(name):
+            grams.setdefault(gram, []).append(code)
+    keys = sorted(grams)
+    save("trigram_keys", np.array(keys, dtype="U3"))
+    save("trigram_offsets", np.cumsum([0] + [len(grams[k]) for k in keys]).astype(np.int64))
+    save("trigram_postings", np.concatenate([np.array(grams[k], dtype=np.int32) for k in keys]))
+
+    with open(os.path.join(index_dir, "names.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "streets": list(streets),
+            "vejnavn": vejnavn,
+            "supplerendebynavn": [None if b == "" else b for b in by_names],
+            "postnrnavn": {str(k): v for k, v in postnrnavn.items()},
+        }, f, ensure_ascii=False)
+
+    return len(df)
+
+
+def parse_address(address):
+    """Split free text into (street, husnr, postnr), missing parts are None."""
+    text = normalize_address(address)
+    first, _, rest = text.partition(",")
+
+    m = re.search(r"\b(\d{4})\b", rest)
+    postnr = int(m.group(1)) if m else None
+
+    #street name runs until the first token starting with a digit
+    tokens = first.split()
+    street, husnr = [], None
+    for i, token in enumerate(tokens):
+        if token[0].isdigit() and i > 0:
+            husnr = token
+            #"10 a" -> "10a"
+            if i + 1 < len(tokens) and len(tokens[i+1]) == 1 and tokens[i+1].isalpha():
+                husnr += tokens[i+1]
+            break
+        street.append(token)
+
+    if postnr is None and husnr is None:
+        m = re.search(r"\b(\d{4})\b", first)
+        postnr = int(m.group(1)) if m else None
+
+    return " ".join(street), husnr, postnr
+
+
+class OfflineIndex:
+
+    def __init__(self, index_dir, mmap=True):
+        mode = "r" if mmap else None
+
+        def load(name):
+            #plain ndarray view of the mapping, np.memmap slicing is slow on the lookup path
+            return np.asarray(np.load(os.path.join(index_dir, name + ".npy"), mmap_mode=mode))
+
+        self.street = load("street")
+        self.postnr = load("postnr")
+        self.husnr_key = load("husnr_key")
+        self.husnr = load("husnr")
+        self.supplerendebynavn = load("supplerendebynavn")
+        self.x = load("x")
+        self.y = load("y")
+        self.id = load("id")
+        self.street_start = load("street_start")
+        self.trigram_keys = load("trigram_keys")
+        self.trigram_offsets = load("trigram_offsets")
+        self.trigram_postings = load("trigram_postings")
+
+        with open(os.path.join(index_dir, "names.json"), "r", encoding="utf-8") as f:
+            names = json.load(f)
+        self.streets = names["streets"]
+        self.vejnavn = names["vejnavn"]
+        self.by_names = names["supplerendebynavn"]
+        self.postnrnavn = names["postnrnavn"]
+        self.street_lookup = {s: i for i, s in enumerate(self.streets)}
+
+        #the street tables are small, keep them as plain python/numpy objects for fast lookups
+        self.trigram_lookup = {str(g): i for i, g in enumerate(self.trigram_keys)}
+        self.street_trigrams = np.array([len(trigrams(s)) for s in self.streets], dtype=np.int32)
+
+    def __len__(self):
+        return len(self.street)
+
+    def _street_candidates(self, street, limit=5):
+        """[(street code, similarity)] best first, exact names short-circuit the trigram search."""
+        code = self.street_lookup.get(street)
+        if code is not None:
+            return [(code, 1.0)]
+
+        query = trigrams(street)
+        postings = []
+        for gram in query:
+            i = self.trigram_lookup.get(gram)
+            if i is not None:
+                postings.append(self.trigram_postings[self.trigram_offsets[i]:self.trigram_offsets[i+1]])
+        if not postings:
+            return []
+
+        candidates, counts = np.unique(np.concatenate(postings), return_counts=True)
+        #dice coefficient on trigram sets
+        dice = 2 * counts / (len(query) + self.street_trigrams[candidates])
+        best = np.argsort(dice)[::-1][:limit]
+        return [(int(candidates[i]), float(dice[i])) for i in best]
+
+    def _husnr_row(self, lo, hi, key):
+        """(row, exact) of husnr key within rows lo:hi of one (street, postnr) block."""
+        keys = self.husnr_key[lo:hi]
+        i = int(np.searchsorted(keys, key))
+        if i < len(keys) and keys[i] == key:
+            return lo + i, True
+        #closest house number in the block
+        return lo + min(i, len(keys) - 1), False
+
+    def _best_row(self, code, key, postnr):
+        """(row, husnr exact, postnr matched) within a street for the husnr key, None if the street has no rows."""
+        lo, hi = int(self.street_start[code]), int(self.street_start[code+1])
+        if lo == hi:
+            return None
+
+        postnrs = self.postnr[lo:hi]
+        if postnr is not None:
+            p_lo, p_hi = lo + np.searchsorted(postnrs, postnr), lo + np.searchsorted(postnrs, postnr, side="right")
+            if p_lo < p_hi:
+                if key is None:
+                    return p_lo, False, True
+                return self._husnr_row(p_lo, p_hi, key) + (True,)
+
+        if key is None:
+            return lo, False, False
+
+        #husnr keys are only sorted within a postnr, so look for an exact house number over the whole
+        #street at once, else take the closest one in the first postnr block
+        exact = np.flatnonzero(self.husnr_key[lo:hi] == key)
+        if len(exact):
+            return lo + int(exact[0]), True, False
+        first_hi = lo + int(np.searchsorted(postnrs, postnrs[0], side="right"))
+        return self._husnr_row(lo, first_hi, key)[0], False, False
+
+    def search_address(self, address):
+        """Offline counterpart of dawa_scrape_prod.search_address."""
+        street, husnr, postnr = parse_address(address)
+        if not street:
+            return None
+
+        key = _husnr_key(husnr) if husnr is not None else None
+        best = None
+        for code, similarity in self._street_candidates(street):
+            found = self._best_row(code, key, postnr)
+            if found is None:
+                continue
+            row, husnr_ok, postnr_ok = found
+            score = similarity + 0.5 * husnr_ok + 0.25 * postnr_ok
+            if best is None or score > best[0]:
+                best = (score, row, similarity, husnr_ok, postnr_ok)
+
+        if best is None:
+            return None
+        _, row, similarity, husnr_ok, postnr_ok = best
+
+        #same meaning as DAWA's kategori: A exact, B minor deviations, C significant deviations
+        if similarity == 1.0 and husnr_ok and (postnr_ok or postnr is None):
+            kategori = "A"
+        elif similarity >= 0.8 and husnr_ok:
+            kategori = "B"
+        else:
+            kategori = "C"
+
+        return {"kategori": kategori, "resultater": [{"adresse": self.address(row)}]}
+
+    def address(self, row):
+        postnr = int(self.postnr[row])
+        return {
+            "id": str(self.id[row]),
+            "vejnavn": self.vejnavn[int(self.street[row])],
+            "husnr": str(self.husnr[row]),
+            "supplerendebynavn": self.by_names[int(self.supplerendebynavn[row])],
+            "postnr": str(postnr),
+            "postnrnavn": self.postnrnavn.get(str(postnr)),
+            "x": float(self.x[row]),
+            "y": float(self.y[row]),
+        }
+
+    def DAWA_data(self, address):
+        """Same (dawa_name, confidence, lat, long) contract as dawa_scrape_prod.DAWA_data."""
+        json = self.search_address(address)
+        if json is None:
+            return None, None, None, None
+        adresse = json["resultater"][0]["adresse"]
+        return json_best_match_name(json), json["kategori"], adresse["y"], adresse["x"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline DAWA address index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="build an index from a DAWA adgangsadresser csv dump")
+    build.add_argument("dump")
+    build.add_argument("index_dir")
+    lookup = sub.add_parser("lookup", help="geocode addresses with an index")
+    lookup.add_argument("index_dir")
+    lookup.add_argument("addresses", nargs="*", help="addresses, read from stdin if none are given")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        start = time.perf_counter()
+        rows = build_index(args.dump, args.index_dir)
+        print("indexed {} addresses in {:.1f}s".format(rows, time.perf_counter() - start))
+    else:
+        index = OfflineIndex(args.index_dir)
+        for address in args.addresses or (line.strip() for line in sys.stdin):
+            print(";".join(str(v) for v in (address,) + index.DAWA_data(address)))
+
+
+if __name__ == '__main__':
+    main()
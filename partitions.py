@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Year-partitioned sales dataset that grows by appending.
+
+Usage:
+    python partitions.py build data/final_geodataframe_v2 data/sales
+    python partitions.py append new_sales.parquet data/sales
+
+Layout:
+    data/sales/_manifest.json
+    data/sales/year=2014/part-00000.parquet
+    data/sales/year=2014/part-00001.parquet
+    ...
+
+New sales are written as new part files of their years, without tooltip
+columns (the app formats tooltips for the rows it draws), and the
+manifest is replaced last, so readers never see half an append. Every
+append bumps the manifest version and stamps it on the years it touched.
+PartitionedSales.refresh() only re-reads the manifest, frame() then reads
+the part files added since it last ran, so a refresh costs the size of
+the delta and nothing is read until the data is needed. versions(y0, y1)
+changes only when a year in the range changed, which is what the app's
+caches are keyed on. partitions(name, build) keeps structures derived
+from single years (region cubes, address tables) and rebuilds only those
+of the years an append touched.
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+
+from pandas.api.types import union_categoricals
+
+from data_store import read_geo, write_json
+
+
+MANIFEST = "_manifest.json"
+
+#per-row strings the full layout used to carry, see compact.add_derived_columns
+TOOLTIP_COLUMNS = ['tooltip_price', 'tooltip_address']
+
+
+def concat_frames(frames):
+    """pd.concat(frames, ignore_index=True), categorical columns stay categorical when the frames' categories differ."""
+    frames = list(frames)
+    if len(frames) == 1:
+        return frames[0]
+
+    for column, dtype in frames[0].dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            try:
+                categories = union_categoricals([frame[column] for frame in frames]).categories
+            except TypeError:
+                #categories of different dtypes, e.g. int32 and int64 postal codes from different appends
+                categories = pd.Index(pd.concat([frame[column].cat.categories.to_series() for frame in frames]).unique())
+            frames = [frame.assign(**{column: frame[column].cat.set_categories(categories)}) for frame in frames]
+    return pd.concat(frames, ignore_index=True)
+
+
+def read_manifest(root):
+    try:
+        with open(os.path.join(root, MANIFEST), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"version": 0, "partitions": {}}
+
+
+def write_manifest(root, manifest):
+    write_json(os.path.join(root, MANIFEST), manifest, indent=1, sort_keys=True)
+
+
+def append(gdf, root):
+    """Append the sales in gdf to the dataset at root as new part files, returns the years written."""
+    #tooltips are formatted for the drawn rows (compact.tooltip_columns), stored ones would never be read
+    gdf = gdf.drop(columns=TOOLTIP_COLUMNS, errors='ignore')
+    manifest = read_manifest(root)
+    manifest["version"] += 1
+
+    years = []
+    for year, part in gdf.groupby('year', sort=True):
+        entry = manifest["partitions"].setdefault(str(year), {"files": [], "rows": 0, "version": 0})
+        name = "year={}/part-{:05d}.parquet".format(year, len(entry["files"]))
+        os.makedirs(os.path.join(root, os.path.dirname(name)), exist_ok=True)
+        part.to_parquet(os.path.join(root, name), compression='zstd', index=False)
+
+        entry["files"].append(name)
+        entry["rows"] += len(part)
+        entry["version"] = manifest["version"]
+        years.append(int(year))
+
+    write_manifest(root, manifest)
+    return years
+
+
+class PartitionedSales:
+
+    def __init__(self, root, transform=None):
+        """transform(gdf) -> gdf runs on every newly read part, e.g. to add columns that need other files."""
+        self.root = root
+        self.transform = transform
+        self.version = 0
+        self.manifest = {"version": 0, "partitions": {}}
+
+        #year -> GeoDataFrame of the parts read so far, and how many parts that is
+        self.years = {}
+        self.loaded = {}
+        self._frame = None
+        self._manifest_mtime = None
+        self._lock = threading.Lock()
+
+        #name -> {year: (frame it was built from, result)} for partitions()
+        self._derived = {}
+
+    def refresh(self):
+        """Pick up a new manifest, returns the years that changed. Their new part files are read by frame()."""
+        with self._lock:
+            try:
+                mtime = os.stat(os.path.join(self.root, MANIFEST)).st_mtime_ns
+            except FileNotFoundError:
+                return []
+            if mtime == self._manifest_mtime:
+                return []
+
+            manifest = read_manifest(self.root)
+            old = self.manifest["partitions"]
+            changed = [int(year) for year, entry in manifest["partitions"].items()
+                       if len(entry["files"]) > len(old.get(year, {}).get("files", []))]
+
+            self.manifest = manifest
+            self.version = manifest["version"]
+            self._manifest_mtime = mtime
+            return sorted(changed)
+
+    def _load(self):
+        import geopandas as gpd
+
+        #read the part files the manifest lists beyond what was read before
+        changed = False
+        for year, entry in self.manifest["partitions"].items():
+            new_files = entry["files"][self.loaded.get(year, 0):]
+            if not new_files:
+                continue
+
+            parts = [gpd.read_parquet(os.path.join(self.root, name)) for name in new_files]
+            if self.transform is not None:
+                parts = [self.transform(part) for part in parts]
+            if year in self.years:
+                parts.insert(0, self.years[year])
+
+            self.years[year] = concat_frames(parts)
+            self.loaded[year] = len(entry["files"])
+            changed = True
+
+        if changed:
+            self._frame = None
+
+    def frame(self):
+        """All sales of the current manifest as one GeoDataFrame sorted by year (partitions concatenated in year order)."""
+        with self._lock:
+            self._load()
+            if self._frame is None:
+                years = sorted(self.years, key=int)
+                self._frame = concat_frames(self.years[y] for y in years) if years else None
+            return self._frame
+
+    def partitions(self, name, build):
+        """{year: build(frame of the year)} in year order, build only runs for years whose frame changed since the last call with this name."""
+        with self._lock:
+            self._load()
+            cache = self._derived.setdefault(name, {})
+            result = {}
+            for year in sorted(self.years, key=int):
+                frame = self.years[year]
+                cached = cache.get(year)
+                if cached is None or cached[0] is not frame:
+                    cached = cache[year] = (frame, build(frame))
+                result[int(year)] = cached[1]
+            return result
+
+    def year_list(self):
+        """Years in the manifest, without reading any data."""
+        return sorted(int(year) for year in self.manifest["partitions"])
+
+    def versions(self, year_from, year_to):
+        """(year, version) of the partitions in year_from..year_to, changes only when one of them does."""
+        partitions = self.manifest["partitions"]
+        return tuple((int(y), partitions[y]["version"]) for y in sorted(partitions, key=int) if year_from <= int(y) <= year_to)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or append to the year-partitioned sales dataset")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="partition an existing dataset into an empty directory")
+    build.add_argument("source", help="dataset path, read with read_geo")
+    build.add_argument("root")
+    add = sub.add_parser("append", help="append new sales as new part files")
+    add.add_argument("source", help="dataset path, read with read_geo")
+    add.add_argument("root")
+    args = parser.parse_args(argv)
+
+    if args.command == "build" and os.path.exists(os.path.join(args.root, MANIFEST)):
+        parser.error("{} already has a manifest, use append".format(args.root))
+
+    start = time.perf_counter()
+    gdf = read_geo(args.source)
+    years = append(gdf, args.root)
+    print("{} rows into years {} of {} in {:.1f}s".format(len(gdf), years, args.root, time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Pre-serialized polygon geometry for the Postal Codes and Parish layers.
+
+Handing pydeck a GeoDataFrame makes it go through __geo_interface__ on
+every plot, converting every vertex (with the Z coordinate filtered_postnumre
+carries) to full-precision floats. A PolygonLayer does that once per
+polygon frame and zoom tier:
+
+- Z is dropped and the polygons are simplified to half a screen pixel at
+  the tier's zoom, as a coverage when they form one (shared borders stay
+  shared, no slivers or gaps), per polygon with preserve_topology otherwise
+- coordinates are rounded to a tenth of that tolerance
+- every polygon becomes a GeoJSON geometry dict, kept for the process
+
+A plot then only builds the small per-region properties and attaches the
+shared geometry dicts, in the flattened record form pydeck produces itself:
+
+    layer = PolygonLayer(get_postnumre().geometry.values, zoom=12)
+    data = layer.records(rows, properties)   #properties: DataFrame, one row per entry of rows
+"""
+
+import json
+
+import numpy as np
+import shapely
+
+from lod import cell_size
+
+
+#zoom level the app's region layers are prepared for
+CITY_ZOOM = 12
+
+
+def simplify_polygons(geometry, tolerance):
+    """2D geometries simplified by tolerance, keeping shared borders when they form a valid coverage."""
+    geometry = shapely.force_2d(np.asarray(geometry, dtype=object))
+    if shapely.coverage_is_valid(geometry):
+        return shapely.coverage_simplify(geometry, tolerance)
+    return shapely.simplify(geometry, tolerance, preserve_topology=True)
+
+
+class PolygonLayer:
+
+    def __init__(self, geometry, zoom=CITY_ZOOM, lat=55.67):
+        #half a screen pixel at `zoom`, in degrees
+        self.tolerance = cell_size(zoom, lat, cell_pixels=1)[1] / 2
+        self.decimals = int(np.ceil(-np.log10(self.tolerance))) + 1
+
+        simplified = simplify_polygons(geometry, self.tolerance)
+        rounded = shapely.transform(simplified, lambda coords: np.round(coords, self.decimals))
+        self.vertices = int(shapely.get_num_coordinates(rounded).sum())
+        self.geometry = [json.loads(text) for text in shapely.to_geojson(rounded)]
+
+    def __len__(self):
+        return len(self.geometry)
+
+    def records(self, rows, properties):
+        """pydeck records of the polygons at `rows`: the properties row plus the shared geometry dict."""
+        records = properties.to_dict(orient='records')
+        for record, row in zip(records, rows):
+            record['geometry'] = self.geometry[row]
+        return records
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Shared rate limiting and retry scheduling for calls to the DAWA api.
+
+RetryScheduler.request wraps a single GET with
+    - an adaptive token bucket: the rate creeps up while requests succeed and
+      is halved on every 429/503 (additive increase, multiplicative decrease),
+    - exponential backoff with full jitter, honouring Retry-After,
+    - a circuit breaker that fails fast after repeated errors and lets a
+      single probe request through once its reset timeout has passed,
+and keeps counters of requests, retries, throttles and failures.
+"""
+
+import random
+import threading
+import time
+
+from email.utils import parsedate_to_datetime
+
+import requests
+
+import instrumentation
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class TokenBucket:
+
+    def __init__(self, rate=20.0, capacity=None, min_rate=1.0, max_rate=200.0, increase=0.5):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = min(self._tokens, 0)
+
+
+class CircuitBreaker:
+
+    def __init__(self, failure_threshold=10, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        #when the half-open probe went out, None while no probe is pending
+        self._probing_since = None
+        self._lock = threading.Lock()
+
+    def _state(self, now):
+        if self._opened_at is None:
+            return "closed"
+        if now - self._opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def allow(self):
+        """Whether a request may go out. Half-open lets exactly one probe through until its result is recorded."""
+        with self._lock:
+            now = time.monotonic()
+            state = self._state(now)
+            if state != "half-open":
+                return state == "closed"
+            #a probe that never reports back (e.g. throttled) stops blocking after reset_timeout
+            if self._probing_since is not None and now - self._probing_since < self.reset_timeout:
+                return False
+            self._probing_since = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing_since = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold or self._opened_at is not None:
+                self._opened_at = time.monotonic()
+            self._probing_since = None
+
+
+def retry_after_seconds(response):
+    """Seconds from a Retry-After header (delta or http date), None if missing."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryScheduler:
+
+    def __init__(self, bucket=None, breaker=None, max_retries=4, base_delay=0.5, max_delay=30.0, timeout=30.0):
+        self.bucket = bucket or TokenBucket()
+        self.breaker = breaker or CircuitBreaker()
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.counters = {"requests": 0, "retries": 0, "throttles": 0, "failures": 0, "circuit_open": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+        instrumentation.count("http_" + name)
+
+    def _backoff(self, attempt):
+        #full jitter, spreads retries of concurrent workers out
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def request(self, http, url, **kwargs):
+        """GET url through `http` (requests or a Session) with rate limiting and retries.
+
+        Returns the response, raises CircuitOpenError when the circuit is open
+        and the last requests exception once the retries are used up.
+        Responses that are still 429/5xx after the last retry are returned as is.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                self._count("circuit_open")
+                raise CircuitOpenError(url)
+
+            if attempt:
+                self._count("retries")
+
+            self.bucket.acquire()
+            self._count("requests")
+
+            try:
+                with instrumentation.span("http_request"):
+                    r = http.get(url, **kwargs)
+            except requests.RequestException:
+                self._count("failures")
+                self.breaker.record_failure()
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self._backoff(attempt))
+                continue
+
+            if r.status_code in (429, 503):
+                self._count("throttles")
+                self.bucket.on_throttle()
+                if attempt == self.max_retries:
+                    return r
+                delay = retry_after_seconds(r)
+                time.sleep(min(self.max_delay, delay) if delay is not None else self._backoff(attempt))
+                continue
+
+            if r.status_code >= 500:
+                self._count("failures")
+                self.breaker.record_failure()
+                if attempt == self.max_retries:
+                    return r
+                time.sleep(self._backoff(attempt))
+                continue
+
+            self.bucket.on_success()
+            self.breaker.record_success()
+            return r
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        stats["rate"] = self.bucket.rate
+        stats["circuit"] = self.breaker.state
+        return stats
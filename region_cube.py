@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Pre-aggregated region x year cube for the Postal Codes and Parish views.
+
+Built once per dataset, every (region, year) cell keeps the count, the sum,
+a cumulative log-spaced histogram of the prices and the prices themselves,
+sorted. Histograms of several years can be added together, so the mean and
+median for any year range come from summing `years` slices instead of
+filtering and grouping the sales, and joining to the polygons is an integer
+lookup on precomputed pairs.
+
+Both are exact: the summed histogram only locates the bin holding the
+middle price(s) of a region, and the prices of that bin are a known slice
+of every year's sorted block, so only those few prices are sorted per
+query. The bins decide how many that is, not the accuracy.
+
+The bins are fixed rather than fitted to the data, so cubes built on
+separate year partitions line up and RegionCube.combine merges them
+without touching the sales again; an append only rebuilds its years.
+"""
+
+import numpy as np
+import pandas as pd
+
+from data_store import concat_ranges
+
+
+#log spaced bin edges, prices are roughly log normal; prices outside go to the first/last bin
+PRICE_EDGES = np.geomspace(1.0, 1e7, 1025)
+
+
+def region_ids(frame, keys):
+    """(region id of every row, one row per region with its key columns), regions sorted by key value.
+
+    Keys are compared as values, not as categorical codes, so the ids of
+    frames with different categories sort the same way.
+    """
+    region = frame[keys].astype(object).groupby(keys, sort=True, dropna=False).ngroup().to_numpy()
+    _, first = np.unique(region, return_index=True)
+    return region, frame[keys].iloc[first].reset_index(drop=True)
+
+
+class RegionCube:
+
+    def __init__(self, gdf, keys, value='adjusted_sqm_price', edges=PRICE_EDGES):
+        self.keys = list(keys)
+        self.value = value
+        self.edges = edges
+        bins = len(edges) - 1
+
+        values = gdf[value].to_numpy(dtype=np.float64)
+        #one row per region with its key columns, row i is region i
+        region, self.regions = region_ids(gdf, self.keys)
+        year, self.years = pd.factorize(gdf['year'], sort=True)
+        self.years = np.asarray(self.years)
+
+        bin_idx = np.clip(np.searchsorted(self.edges, values, side='right') - 1, 0, bins - 1)
+
+        shape = (len(self.regions), len(self.years))
+        cell = np.ravel_multi_index((region, year), shape)
+        self.count = np.bincount(cell, minlength=np.prod(shape)).reshape(shape)
+        self.sum = np.bincount(cell, values, minlength=np.prod(shape)).reshape(shape)
+        hist = np.bincount(cell * bins + bin_idx, minlength=np.prod(shape) * bins).reshape(shape + (bins,))
+        #sales in bins 0..b of every cell, so the sales of bin b are cumhist[..., b-1]:cumhist[..., b] of the cell's sorted prices
+        self.cumhist = np.cumsum(hist, axis=2, dtype=np.int32)
+
+        #prices of every year sorted by (region, price), region r's are values[y][starts[y][r]:starts[y][r+1]]
+        raw = gdf[value].to_numpy()
+        order = np.lexsort((raw, region, year))
+        year_start = np.concatenate([[0], np.cumsum(self.count.sum(axis=0))])
+        self.values, self.starts = [], []
+        for y in range(len(self.years)):
+            self.values.append(raw[order[year_start[y]:year_start[y + 1]]])
+            self.starts.append(np.concatenate([[0], np.cumsum(self.count[:, y])]))
+
+    @classmethod
+    def combine(cls, cubes):
+        """One cube over the sales of several cubes of disjoint years (e.g. one per year partition) and the same edges."""
+        cubes = list(cubes)
+        first = cubes[0]
+        if any(not np.array_equal(cube.edges, first.edges) for cube in cubes):
+            raise ValueError("cubes with different bin edges can't be combined")
+
+        #every part's regions in the combined (sorted) region order, which keeps each part's own order
+        parts = pd.concat([cube.regions for cube in cubes], ignore_index=True)
+        region, regions = region_ids(parts, first.keys)
+        bounds = np.cumsum([0] + [len(cube.regions) for cube in cubes])
+
+        years = np.concatenate([cube.years for cube in cubes])
+        if len(np.unique(years)) < len(years):
+            raise ValueError("cubes with overlapping years can't be combined")
+        order = np.argsort(years, kind='stable')
+
+        merged = cls.__new__(cls)
+        merged.keys, merged.value, merged.edges = first.keys, first.value, first.edges
+        merged.regions = regions
+        merged.years = years[order]
+
+        shape = (len(regions), len(years))
+        merged.count = np.zeros(shape, dtype=first.count.dtype)
+        merged.sum = np.zeros(shape)
+        merged.cumhist = np.zeros(shape + (len(merged.edges) - 1,), dtype=np.int32)
+        year_of = np.empty(len(years), dtype=np.int64)
+        year_of[order] = np.arange(len(years))
+        part_values = []
+        for cube, lo, hi, at in zip(cubes, bounds[:-1], bounds[1:], np.cumsum([0] + [len(cube.years) for cube in cubes])):
+            rows, cols = region[lo:hi], year_of[at:at + len(cube.years)]
+            merged.count[np.ix_(rows, cols)] = cube.count
+            merged.sum[np.ix_(rows, cols)] = cube.sum
+            merged.cumhist[np.ix_(rows, cols)] = cube.cumhist
+            part_values.extend(cube.values)
+
+        #a year's sorted prices only move to other region positions, their order stays
+        merged.values = [part_values[i] for i in order]
+        merged.starts = [np.concatenate([[0], np.cumsum(merged.count[:, y])]) for y in range(len(years))]
+        return merged
+
+    def _year_slice(self, year_from, year_to):
+        lo = np.searchsorted(self.years, year_from, side='left')
+        hi = np.searchsorted(self.years, year_to, side='right')
+        return slice(lo, hi)
+
+    def query(self, year_from, year_to):
+        """mean and median of `value` per region for year_from <= year <= year_to.
+
+        Returns a DataFrame with the key columns, count, mean and median;
+        regions without sales in the range are left out, like a groupby would.
+        """
+        years = self._year_slice(year_from, year_to)
+        count = self.count[:, years].sum(axis=1)
+        total = self.sum[:, years].sum(axis=1)
+
+        has_sales = count > 0
+        regions = np.flatnonzero(has_sales)
+        count, total = count[has_sales], total[has_sales]
+        cumulative = self.cumhist[:, years, :].sum(axis=1)[has_sales]
+
+        #the middle price, or the two middle prices of an even count
+        median = (self._nth_price(regions, cumulative, (count - 1) // 2, years) +
+                  self._nth_price(regions, cumulative, count // 2, years)) / 2
+
+        result = self.regions[has_sales].reset_index(drop=True)
+        result['region'] = regions
+        result['count'] = count
+        result['mean'] = total / count
+        result['median'] = median
+        return result
+
+    def _nth_price(self, regions, cumulative, n, years):
+        """n-th smallest (0-based) price of each region over the years slice, cumulative its summed cumhist."""
+        if len(regions) == 0:
+            return np.array([], dtype=np.float64)
+
+        rows = np.arange(len(regions))
+        b = np.argmax(cumulative > n[:, None], axis=1)
+        below = np.where(b > 0, cumulative[rows, b - 1], 0)
+
+        #prices of bin b from every year's sorted block of the region, labelled by region
+        values, labels = [], []
+        for y in range(years.start, years.stop):
+            hi = self.cumhist[regions, y, b]
+            lo = np.where(b > 0, self.cumhist[regions, y, np.maximum(b - 1, 0)], 0)
+            start = self.starts[y][regions]
+            values.append(self.values[y][concat_ranges(start + lo, start + hi)])
+            labels.append(np.repeat(rows, hi - lo))
+        values, labels = np.concatenate(values), np.concatenate(labels)
+        values = values[np.lexsort((values, labels))]
+
+        in_bin = np.bincount(labels, minlength=len(regions))
+        offset = np.cumsum(in_bin) - in_bin
+        return values[offset + n - below].astype(np.float64)
+
+    def geometry_pairs(self, geometry_keys):
+        """(region, geometry row) index pairs of every region/polygon match.
+
+        geometry_keys are the geometry frame's key values in row order; a key
+        can appear on several rows (postal codes split into several polygons).
+        Pairs come in geometry row order, like geometry.merge(grouped) would.
+        """
+        lookup = pd.Series(np.arange(len(self.regions)), index=self.regions[self.keys[0]].astype(str).values)
+        geometry = pd.DataFrame({'key': pd.Series(geometry_keys).astype(str).values, 'row': np.arange(len(geometry_keys))})
+        pairs = geometry.merge(lookup.rename('region'), left_on='key', right_index=True)
+        return pairs['region'].to_numpy(), pairs['row'].to_numpy()
+
+    def join(self, stats, pairs):
+        """(stats rows, geometry rows) aligned on the pairs from geometry_pairs, regions without sales dropped."""
+        regions, rows = pairs
+        stat_row = np.full(len(self.regions), -1)
+        stat_row[stats['region'].to_numpy()] = np.arange(len(stats))
+        matched = stat_row[regions]
+        keep = matched >= 0
+        return stats.iloc[matched[keep]].reset_index(drop=True), rows[keep]
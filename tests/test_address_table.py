@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+
+from address_table import AddressTable, street_address
+from compact import tooltip_columns
+from synthetic import synthetic_sales
+
+
+def test_prices_match_groupby():
+    gdf = synthetic_sales(5000)
+    table = AddressTable(gdf)
+    expected = (
+        pd.DataFrame({'address_id': table.row_address, 'year': gdf['year'].to_numpy(), 'price': gdf['adjusted_sqm_price'].to_numpy()})
+        .groupby(['address_id', 'year'])['price']
+        .agg(['count', 'mean', 'median'])
+    )
+    assert table.prices.index.equals(expected.index)
+    assert np.array_equal(table.prices['count'], expected['count'])
+    assert np.allclose(table.prices['mean'], expected['mean'])
+    assert np.array_equal(table.prices['median'], expected['median'])
+
+
+def test_tooltips_look_up_the_address():
+    gdf = pd.DataFrame({
+        'lng': [12.5, 12.6, 12.5, 12.7],
+        'lat': [55.6, 55.7, 55.6, 55.8],
+        'address': ['Testvej 1, 2. tv', 'Testvej 2', 'Testvej 1, st.', 'Testvej 3, 1. th'],
+        'year': [2015, 2015, 2016, 2016],
+        'adjusted_sqm_price': [30000.0, 40000.0, 50000.0, 60000.0],
+    })
+    table = AddressTable(gdf)
+    assert list(table.address_of_rows()) == list(street_address(gdf['address'].to_numpy()))
+
+    columns = tooltip_columns(table, slice(1, 3))
+    assert list(columns['tooltip_address']) == ['Testvej 2', 'Testvej 1']
+    assert list(columns['tooltip_price']) == ['40,000.00', '50,000.00']
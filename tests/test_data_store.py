@@ -0,0 +1,40 @@
+import os
+
+import geopandas as gpd
+import pytest
+import shapely
+
+from data_store import convert, read_geo
+
+
+def write_geojson(path, value):
+    gpd.GeoDataFrame({'a': [value]}, geometry=[shapely.Point(12.5, 55.6)], crs='EPSG:4326').to_file(path)
+
+
+def age(path, seconds):
+    mtime = os.path.getmtime(path) - seconds
+    os.utime(path, (mtime, mtime))
+
+
+def test_reads_the_columnar_copy(tmp_path):
+    geojson = str(tmp_path / "sales.geojson")
+    write_geojson(geojson, 1)
+    convert(geojson)
+    os.remove(geojson)
+    assert read_geo(str(tmp_path / "sales"))['a'].tolist() == [1]
+
+
+def test_skips_a_copy_older_than_the_geojson(tmp_path):
+    geojson = str(tmp_path / "sales.geojson")
+    write_geojson(geojson, 1)
+    parquet = convert(geojson)
+    write_geojson(geojson, 2)
+    age(parquet, 10)
+
+    with pytest.warns(UserWarning, match="older than"):
+        assert read_geo(str(tmp_path / "sales"))['a'].tolist() == [2]
+    #asked for by name, the copy is read whatever its age
+    assert read_geo(parquet)['a'].tolist() == [1]
+
+    convert(geojson)
+    assert read_geo(str(tmp_path / "sales"), columns=['a'])['a'].tolist() == [2]
@@ -0,0 +1,55 @@
+import pytest
+
+import dawa_scrape_prod
+from dawa_scrape_prod import DAWA_data, geocode_remote, extract_coordinates_bulk, search_address
+from dawa_server import start_server
+from rate_limit import CircuitBreaker, RetryScheduler, TokenBucket
+
+
+NO_MATCH = (None, None, None, None)
+
+
+@pytest.fixture
+def dawa(monkeypatch):
+    """Start a stand-in server with the given fault rates, returns its base url."""
+    servers = []
+
+    def start(**kwargs):
+        server, url = start_server(**kwargs)
+        servers.append(server)
+        monkeypatch.setattr(dawa_scrape_prod, "DAWA_URL", url)
+        #one quick retry, so the test sees the response that is left once the retries are used up
+        scheduler = RetryScheduler(TokenBucket(rate=1000.0, min_rate=1000.0), CircuitBreaker(failure_threshold=1000), max_retries=1, base_delay=0.001, max_delay=0.001)
+        monkeypatch.setattr(dawa_scrape_prod, "SCHEDULER", scheduler)
+        return url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+def test_match_without_faults(dawa):
+    dawa()
+    dawa_name, confidence, lat, long = geocode_remote("Testvej 1, 2300 København S")
+    assert confidence == "A"
+    assert (lat, long) == (55.67, 12.55)
+
+
+@pytest.mark.parametrize("faults", [{"error_rate": 1.0}, {"throttle_rate": 1.0}])
+def test_failed_lookup_is_no_match(dawa, faults):
+    dawa(**faults)
+    assert search_address("Testvej 1, 2300 København S") is None
+    assert geocode_remote("Testvej 1, 2300 København S") == NO_MATCH
+    assert DAWA_data("Testvej 1, 2300 København S") == NO_MATCH
+
+
+def test_client_error_is_no_match(dawa):
+    url = dawa()
+    #the stand-in answers unknown paths with a 404 error body
+    assert geocode_remote("Testvej 1, 2300 København S", base_url=url + "/missing") == NO_MATCH
+
+
+def test_bulk_coordinates_of_failed_lookup(dawa):
+    dawa(error_rate=1.0)
+    json = {"resultater": [{"adresse": {"id": "0a3f5081-1111-4c5e-e044-0003ba298018"}}]}
+    assert extract_coordinates_bulk([json]) == [[None, None]]
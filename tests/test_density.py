@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+from density import density_levels, kde_grid, level_polygons
+
+
+@pytest.mark.parametrize("x, y", [
+    ([], []),
+    ([12.5], [55.6]),
+    ([12.5] * 3, [55.6] * 3),
+    ([12.5, 12.6, 12.7], [55.6, 55.7, 55.8]),
+])
+def test_points_without_spread_skip_the_estimate(x, y):
+    with pytest.warns(UserWarning, match="skipping density estimate"):
+        surface = kde_grid(x, y)
+    assert surface is None
+    bands = level_polygons(surface)
+    assert len(bands) == 0
+    assert list(bands.columns) == ['level', 'geometry']
+
+
+def test_level_polygons_one_band_per_level():
+    rng = np.random.default_rng(0)
+    bands = density_levels(12.56 + rng.normal(0, 0.02, 500), 55.68 + rng.normal(0, 0.01, 500))
+    assert list(bands['level']) == [0.2, 0.4, 0.6, 0.8, 0.95]
+    assert not bands.geometry.is_empty.any()
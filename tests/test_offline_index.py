@@ -0,0 +1,80 @@
+import pytest
+
+from offline_index import OfflineIndex, build_index, parse_address
+
+
+ADDRESSES = [
+    #id, vejnavn, husnr, supplerendebynavn, postnr, postnrnavn, x, y
+    ("a1", "Hovedgaden", "1", "", "2300", "København S", 12.61, 55.66),
+    ("a3", "Hovedgaden", "3", "", "2300", "København S", 12.62, 55.66),
+    ("a10", "Hovedgaden", "10A", "", "2300", "København S", 12.63, 55.66),
+    ("b2", "Hovedgaden", "2", "", "2700", "Brønshøj", 12.49, 55.70),
+    ("b9", "Hovedgaden", "9", "", "2700", "Brønshøj", 12.50, 55.70),
+    ("k1", "Kongens Nytorv", "1", "", "1050", "København K", 12.585, 55.679),
+]
+
+
+@pytest.fixture(scope="module")
+def index(tmp_path_factory):
+    root = tmp_path_factory.mktemp("offline")
+    dump = root / "adgangsadresser.csv"
+    lines = ["id,vejnavn,husnr,supplerendebynavn,postnr,postnrnavn,wgs84koordinat_længde,wgs84koordinat_bredde"]
+    lines += [",".join(str(v) for v in row) for row in ADDRESSES]
+    dump.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    build_index(str(dump), str(root / "index"))
+    return OfflineIndex(str(root / "index"))
+
+
+def match(index, address):
+    json = index.search_address(address)
+    adresse = json["resultater"][0]["adresse"]
+    return json["kategori"], adresse["id"]
+
+
+def test_parse_address():
+    assert parse_address("Hovedgaden 10 A, 2300 København S") == ("hovedgaden", "10a", 2300)
+    assert parse_address("Hovedgaden 2") == ("hovedgaden", "2", None)
+
+
+@pytest.mark.parametrize("address, expected", [
+    ("Hovedgaden 3, 2300 København S", ("A", "a3")),
+    ("Hovedgaden 2, 2700 Brønshøj", ("A", "b2")),
+    ("Hovedgaden 10A, 2300 København S", ("A", "a10")),
+    ("Kongens Nytorv 1, 1050 København K", ("A", "k1")),
+])
+def test_lookup_with_postnr(index, address, expected):
+    assert match(index, address) == expected
+
+
+@pytest.mark.parametrize("address, expected", [
+    #husnr keys are sorted per postnr, these only exist in the second postnr block of the street
+    ("Hovedgaden 2", ("A", "b2")),
+    ("Hovedgaden 9", ("A", "b9")),
+    ("Hovedgaden 1", ("A", "a1")),
+    ("Hovedgaden 10A", ("A", "a10")),
+])
+def test_lookup_without_postnr(index, address, expected):
+    assert match(index, address) == expected
+
+
+def test_lookup_with_unknown_postnr(index):
+    #no block of the street has the postnr, the house number decides and the confidence drops
+    assert match(index, "Hovedgaden 2, 2100 København Ø") == ("B", "b2")
+
+
+def test_lookup_with_missing_husnr(index):
+    #a matching postnr wins, the closest house number in it is a significant deviation
+    assert match(index, "Hovedgaden 2, 2300 København S") == ("C", "a3")
+
+
+def test_misspelt_street(index):
+    kategori, row_id = match(index, "Hovedgadn 9, 2700 Brønshøj")
+    assert row_id == "b9"
+    assert kategori in ("B", "C")
+
+
+def test_dawa_data(index):
+    dawa_name, confidence, lat, long = index.DAWA_data("Kongens Nytorv 1, 1050 København K")
+    assert dawa_name == "Kongens Nytorv 1 ,1050 København K"
+    assert (confidence, lat, long) == ("A", 55.679, 12.585)
+    assert index.DAWA_data("") == (None, None, None, None)
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from address_table import AddressTable, PartitionedAddressTable
+from compact import compact_sales
+from neighbourhood import NeighbourhoodIndex
+from partitions import PartitionedSales, append
+from region_cube import RegionCube
+from synthetic import synthetic_sales
+
+
+@pytest.fixture(scope="module")
+def store(tmp_path_factory):
+    root = str(tmp_path_factory.mktemp("sales"))
+    append(synthetic_sales(20000), root)
+    store = PartitionedSales(root, transform=compact_sales)
+    store.refresh()
+    return store
+
+
+def cube_of(keys):
+    return lambda frame: RegionCube(frame, keys)
+
+
+@pytest.mark.parametrize("keys", [['postal', 'kommune'], ['sognekode']])
+def test_combined_cube_matches_whole_frame(store, keys):
+    whole = RegionCube(store.frame(), keys)
+    combined = RegionCube.combine(store.partitions(('cube', tuple(keys)), cube_of(keys)).values())
+    for year_from, year_to in [(1990, 2030), (2016, 2018), (2020, 2020)]:
+        a, b = whole.query(year_from, year_to), combined.query(year_from, year_to)
+        assert a[keys].astype(str).equals(b[keys].astype(str))
+        assert np.array_equal(a['count'], b['count'])
+        assert np.allclose(a['mean'], b['mean'])
+        assert np.array_equal(a['median'], b['median'])
+
+
+def test_median_is_exact(store):
+    gdf = store.frame()
+    result = RegionCube(gdf, ['sognekode']).query(2015, 2017)
+    expected = gdf[(gdf.year >= 2015) & (gdf.year <= 2017)].groupby('sognekode', observed=True)['adjusted_sqm_price'].median()
+    assert np.array_equal(result['median'].to_numpy(), expected.loc[result['sognekode']].to_numpy(dtype=np.float64))
+
+
+def test_partitions_only_rebuilds_changed_years(store):
+    built = []
+    store.partitions('count', lambda frame: built.append(len(frame)) or len(frame))
+    built.clear()
+
+    delta = synthetic_sales(100, seed=1)
+    delta['year'] = 2021
+    append(delta, store.root)
+    assert store.refresh() == [2021]
+
+    counts = store.partitions('count', lambda frame: built.append(len(frame)) or len(frame))
+    assert len(built) == 1
+    assert counts[2021] == built[0]
+    assert sum(counts.values()) == len(store.frame())
+
+
+def test_partitioned_address_table_matches_whole_frame(store):
+    gdf = store.frame()
+    whole = AddressTable(gdf)
+    merged = PartitionedAddressTable(gdf, store.partitions('address_table', AddressTable).values())
+    assert len(whole) == len(merged)
+    assert merged.addresses['apartments'].sum() == len(gdf)
+    assert np.array_equal(merged.address_of_rows(), whole.address_of_rows())
+
+    #the same prices once the merged address ids are mapped to the whole table's
+    ids = merged.addresses.reset_index().merge(whole.addresses.reset_index(), on=['lng', 'lat'])
+    to_whole = np.empty(len(merged), dtype=np.int64)
+    to_whole[ids['index_x']] = ids['index_y']
+    prices = merged.prices.set_axis(pd.MultiIndex.from_arrays(
+        [to_whole[merged.prices.index.get_level_values(0)], merged.prices.index.get_level_values(1)], names=['address_id', 'year'])).sort_index()
+    assert prices.index.equals(whole.prices.index)
+    assert np.allclose(prices.to_numpy(), whole.prices.to_numpy())
+
+    a, b = NeighbourhoodIndex(whole), NeighbourhoodIndex(merged)
+    rng = np.random.default_rng(2)
+    for lng, lat in zip(12.56 + rng.normal(0, 0.04, 20), 55.68 + rng.normal(0, 0.025, 20)):
+        sales_a, addresses_a = a.query(lng, lat)
+        sales_b, addresses_b = b.query(lng, lat)
+        assert list(addresses_a['address']) == list(addresses_b['address'])
+        assert np.array_equal(np.sort(sales_a['adjusted_sqm_price'].to_numpy()), np.sort(sales_b['adjusted_sqm_price'].to_numpy()))
+
+
+def test_partitioned_address_table_checks_the_frame(store):
+    with pytest.raises(ValueError):
+        PartitionedAddressTable(store.frame().head(10), store.partitions('address_table', AddressTable).values())
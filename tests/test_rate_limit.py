@@ -0,0 +1,58 @@
+import threading
+import time
+
+from rate_limit import CircuitBreaker
+
+
+def half_open_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.state == "half-open"
+    return breaker
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = half_open_breaker()
+    allowed = []
+    start = threading.Barrier(16)
+
+    def worker():
+        start.wait()
+        allowed.append(breaker.allow())
+
+    threads = [threading.Thread(target=worker) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert allowed.count(True) == 1
+
+
+def test_probe_success_closes_the_circuit():
+    breaker = half_open_breaker()
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow() and breaker.allow()
+
+
+def test_probe_failure_reopens_the_circuit():
+    breaker = half_open_breaker()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+
+
+def test_lost_probe_stops_blocking_after_the_reset_timeout():
+    breaker = half_open_breaker()
+    assert breaker.allow()
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()